@@ -1,54 +1,79 @@
+import numpy as np
 import pandas as pd
+import scales
+import metrics
 
-def calculate_nps(df: pd.DataFrame, nps_column: str, weight_column: str = None) -> float:
+NPS_SCORES = 11  # 0-10
+
+# Histogram buckets after the 0-10 scores for numeric answers that are not
+# whole numbers in 0-10 (e.g. 11 or 8.5). They are classified by the usual
+# thresholds (>= 9 promoter, 7-8 passive, <= 6 detractor) but left out of the
+# distribution; values between the thresholds (e.g. 6.5) only count towards
+# the base.
+OTHER_PROMOTER, OTHER_PASSIVE, OTHER_DETRACTOR, OTHER_UNCLASSIFIED = range(NPS_SCORES, NPS_SCORES + 4)
+NPS_BUCKETS = NPS_SCORES + 4
+
+PROMOTER_BUCKETS = [9, 10, OTHER_PROMOTER]
+PASSIVE_BUCKETS = [7, 8, OTHER_PASSIVE]
+DETRACTOR_BUCKETS = list(range(7)) + [OTHER_DETRACTOR]
+
+def nps_histogram(scores: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
     """
-    Calculates NPS Score.
-    NPS = % Promoters (9-10) - % Detractors (0-6)
+    Weighted histogram over NPS_BUCKETS in a single pass. scores must already
+    be bucket codes (see nps_score_codes).
     """
-    if nps_column not in df.columns:
-        return 0.0
-        
-    # Ensure numeric
-    df[nps_column] = pd.to_numeric(df[nps_column], errors='coerce')
-    valid_df = df.dropna(subset=[nps_column])
-    
-    if valid_df.empty:
-        return 0.0
+    return np.bincount(scores, weights=weights, minlength=NPS_BUCKETS).astype(np.float64)
 
-    if weight_column and weight_column in valid_df.columns:
-        weights = valid_df[weight_column]
-    else:
-        weights = pd.Series([1] * len(valid_df), index=valid_df.index)
+def grouped_nps_histograms(scores: np.ndarray, group_codes: np.ndarray, n_groups: int, weights: np.ndarray = None) -> np.ndarray:
+    """
+    (n_groups, NPS_BUCKETS) matrix of weighted histograms, one row per group,
+    computed with one bincount over group * NPS_BUCKETS + score.
+    """
+    flat = group_codes.astype(np.int64) * NPS_BUCKETS + scores
+    return np.bincount(flat, weights=weights, minlength=n_groups * NPS_BUCKETS).astype(np.float64).reshape(n_groups, NPS_BUCKETS)
+
+def nps_score_codes(series: pd.Series) -> tuple:
+    """
+    Converts an NPS column to histogram bucket codes: the score itself for
+    whole numbers in 0-10, one of the OTHER_* buckets for any other number.
+
+    Returns:
+        (codes for the valid rows, boolean mask of valid rows). A row is valid
+        when its value is numeric.
+    """
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~np.isnan(values)
+    values = values[valid]
+    codes = np.full(len(values), OTHER_UNCLASSIFIED, dtype=np.int64)
+    codes[values >= 9] = OTHER_PROMOTER
+    codes[(values >= 7) & (values <= 8)] = OTHER_PASSIVE
+    codes[values <= 6] = OTHER_DETRACTOR
+    whole = (values >= 0) & (values <= 10) & (np.floor(values) == values)
+    codes[whole] = values[whole].astype(np.int64)
+    return codes, valid
 
-    total_weight = weights.sum()
+def nps_from_histogram(histogram: np.ndarray):
+    """Derives score, breakdown and distribution from a weighted histogram (see nps_histogram)."""
+    total_weight = float(histogram.sum())
     if total_weight == 0:
         return 0.0
 
-    # Promoters: 9-10
-    promoters_mask = valid_df[nps_column] >= 9
-    promoters_weighted = weights[promoters_mask].sum()
-    
-    # Passives: 7-8
-    passives_mask = (valid_df[nps_column] >= 7) & (valid_df[nps_column] <= 8)
-    passives_weighted = weights[passives_mask].sum()
-    
-    # Detractors: 0-6
-    detractors_mask = valid_df[nps_column] <= 6
-    detractors_weighted = weights[detractors_mask].sum()
-    
+    promoters_weighted = float(histogram[PROMOTER_BUCKETS].sum())
+    passives_weighted = float(histogram[PASSIVE_BUCKETS].sum())
+    detractors_weighted = float(histogram[DETRACTOR_BUCKETS].sum())
+
     # NPS = (Promoters % - Detractors %) * 100
     nps_score = ((promoters_weighted - detractors_weighted) / total_weight) * 100
-    
+
     # Distribution (0-10)
     distribution = {}
-    for score in range(11):
-        score_mask = valid_df[nps_column] == score
-        score_weighted = weights[score_mask].sum()
+    for score in range(NPS_SCORES):
+        score_weighted = float(histogram[score])
         distribution[str(score)] = {
             "count": round(score_weighted, 1),
             "percent": round((score_weighted / total_weight) * 100, 1)
         }
-        
+
     return {
         "score": round(nps_score, 1),
         "breakdown": {
@@ -60,40 +85,81 @@ def calculate_nps(df: pd.DataFrame, nps_column: str, weight_column: str = None)
         "total_weight": round(total_weight, 1)
     }
 
-import re
+@metrics.timed("nps")
+def calculate_nps(df: pd.DataFrame, nps_column: str, weight_column: str = None) -> float:
+    """
+    Calculates NPS Score.
+    NPS = % Promoters (9-10) - % Detractors (0-6)
+    Non-numeric values are treated as missing.
+    """
+    if nps_column not in df.columns:
+        return 0.0
+
+    scores, valid = nps_score_codes(df[nps_column])
+    if len(scores) == 0:
+        return 0.0
+
+    weights = _weight_array(df, weight_column)
+    if weights is not None:
+        weights = weights[valid]
+
+    return nps_from_histogram(nps_histogram(scores, weights))
+
+def _weight_array(df: pd.DataFrame, weight_column: str = None):
+    """Weights as float64 with missing values counted as 0, or None if unweighted."""
+    if not weight_column or weight_column not in df.columns:
+        return None
+    return np.nan_to_num(df[weight_column].to_numpy(dtype=np.float64, na_value=np.nan), nan=0.0)
+
+@metrics.timed("nps")
+def grouped_nps_scores(df: pd.DataFrame, nps_column: str, group_codes: np.ndarray, n_groups: int, weight_column: str = None) -> list:
+    """
+    NPS score for every group at once. group_codes holds each row's group
+    (0..n_groups-1, or -1 for rows outside any group). Groups without valid
+    responses score 0.0, like calculate_nps.
+    """
+    if nps_column not in df.columns:
+        return [0.0] * n_groups
+
+    scores, valid = nps_score_codes(df[nps_column])
+    rows = np.flatnonzero(valid)
+    in_group = group_codes[rows] >= 0
+    rows = rows[in_group]
+
+    weights = _weight_array(df, weight_column)
+    histograms = grouped_nps_histograms(
+        scores[in_group],
+        group_codes[rows],
+        n_groups,
+        None if weights is None else weights[rows]
+    )
+
+    results = []
+    for histogram in histograms:
+        total = histogram.sum()
+        if total == 0:
+            results.append(0.0)
+        else:
+            results.append(round(float((histogram[PROMOTER_BUCKETS].sum() - histogram[DETRACTOR_BUCKETS].sum()) / total * 100), 1))
+    return results
 
 def _extract_numeric_value(series: pd.Series) -> pd.Series:
     """
     Extracts numeric values from a series that might contain labels (e.g., "7 - Extremely satisfied").
     """
-    # First, try direct numeric conversion
-    numeric_series = pd.to_numeric(series, errors='coerce')
-    
-    # If we have a significant number of NaNs (and the original wasn't all NaN), try regex extraction
-    if numeric_series.isna().sum() > 0 and series.notna().sum() > 0:
-        # Regex to find the first integer in the string
-        def extract_first_int(val):
-            if pd.isna(val): return val
-            match = re.search(r'(\d+)', str(val))
-            return int(match.group(1)) if match else None
-            
-        # Apply regex only to non-numeric values (or just apply to all if mixed)
-        # To be safe and handle "7 - Label", we can try applying to the string representation
-        extracted = series.astype(str).apply(extract_first_int)
-        
-        # Combine: prefer the direct numeric if valid (though direct numeric on "7 - Label" is NaN)
-        # So we should probably use the extracted version for anything that failed conversion
-        # Or just use extracted version for everything if it looks like labels.
-        
-        # Let's fill NaNs in numeric_series with extracted values
-        numeric_series = numeric_series.fillna(pd.to_numeric(extracted, errors='coerce'))
-        
-    return numeric_series
+    return scales.extract_scale_values(series)
+
+def _scale_values(df: pd.DataFrame, col: str, scale_codes: pd.DataFrame = None) -> np.ndarray:
+    """Numeric values of a scale column, from precomputed codes when the dataset has them."""
+    if scale_codes is not None and col in scale_codes.columns and df.index.is_unique:
+        return scales.code_values(scale_codes[col], df.index)
+    return _extract_numeric_value(df[col]).to_numpy(dtype=np.float64, na_value=np.nan)
 
-def calculate_top_3_box(df: pd.DataFrame, columns: list[str], weight_column: str = None) -> dict[str, float]:
+def calculate_top_3_box(df: pd.DataFrame, columns: list[str], weight_column: str = None, scale_codes: pd.DataFrame = None) -> dict[str, float]:
     """
     Calculates Top 3 Box % for a 7-point scale (5, 6, 7) for multiple columns.
     Returns a dictionary {column_name: percentage}.
+    scale_codes are the dataset's precomputed label codes (see scales.encode_scales).
     """
     results = {}
     for col in columns:
@@ -103,7 +169,7 @@ def calculate_top_3_box(df: pd.DataFrame, columns: list[str], weight_column: str
             
         # Create a copy for this column's calculation to avoid messing up other iterations
         # Ensure numeric using robust extraction
-        col_series = _extract_numeric_value(df[col])
+        col_series = pd.Series(_scale_values(df, col, scale_codes), index=df.index)
         
         # We need to align weights with valid data for THIS column
         valid_mask = col_series.notna()
@@ -132,6 +198,35 @@ def calculate_top_3_box(df: pd.DataFrame, columns: list[str], weight_column: str
         
     return results
 
+def grouped_top_3_box(df: pd.DataFrame, columns: list[str], group_codes: np.ndarray, n_groups: int, weight_column: str = None, scale_codes: pd.DataFrame = None) -> list[dict[str, float]]:
+    """
+    calculate_top_3_box for every group at once, using one weighted bincount
+    per column over the group codes (see grouped_nps_scores).
+    Returns one {column_name: percentage} dict per group.
+    """
+    results = [{} for _ in range(n_groups)]
+    weights = _weight_array(df, weight_column)
+    if weights is None:
+        weights = np.ones(len(df))
+    in_group = group_codes >= 0
+
+    for col in columns:
+        if col not in df.columns:
+            for group_result in results:
+                group_result[col] = 0.0
+            continue
+
+        values = _scale_values(df, col, scale_codes)
+        valid = in_group & ~np.isnan(values)
+        codes = group_codes[valid]
+        totals = np.bincount(codes, weights=weights[valid], minlength=n_groups)
+        top = np.bincount(codes, weights=np.where(values[valid] >= 5, weights[valid], 0.0), minlength=n_groups)
+
+        for g, group_result in enumerate(results):
+            group_result[col] = round(float(top[g] / totals[g]) * 100, 1) if totals[g] != 0 else 0.0
+
+    return results
+
 def calculate_response_rate(df: pd.DataFrame, columns: list[str], id_column: str = None, weight_column: str = None) -> dict[str, float]:
     """
     Calculates response rate (non-empty / total) for multiple columns.
@@ -191,6 +286,7 @@ def calculate_response_rate(df: pd.DataFrame, columns: list[str], id_column: str
         
     return results
 
+@metrics.timed("category_stats")
 def calculate_category_stats(df: pd.DataFrame, column: str, id_column: str = None, weight_column: str = None, parent_column: str = None) -> dict[str, float]:
     """
     Calculates the percentage of respondents who mentioned each category in the given column.
@@ -220,67 +316,93 @@ def calculate_category_stats(df: pd.DataFrame, column: str, id_column: str = Non
         return {}
 
     # Filter out empty categories for numerator calculation
-    valid_df = df[df[column].notna() & (df[column].astype(str).str.strip() != '')].copy()
+    valid_df = df[df[column].notna() & (df[column].astype(str).str.strip() != '')]
     
     if valid_df.empty:
         return {}
 
-    stats = {}
-    
-    if parent_column and parent_column in df.columns:
-        # Group by Parent and Category
-        # Get unique pairs
-        pairs = valid_df[[parent_column, column]].drop_duplicates()
-        
-        for _, row in pairs.iterrows():
-            parent = row[parent_column]
-            cat = row[column]
-            
-            # Filter for this specific pair
-            cat_df = valid_df[(valid_df[parent_column] == parent) & (valid_df[column] == cat)]
-            
-            if id_column and id_column in df.columns:
-                if weight_column and weight_column in df.columns:
-                    unique_responders = cat_df[[id_column, weight_column]].drop_duplicates(subset=[id_column])
-                    count = unique_responders[weight_column].sum()
-                else:
-                    count = cat_df[id_column].nunique()
-            else:
-                if weight_column and weight_column in df.columns:
-                    count = cat_df[weight_column].sum()
-                else:
-                    count = len(cat_df)
-            
+    has_parent = bool(parent_column and parent_column in df.columns)
+    key_columns = [parent_column, column] if has_parent else [column]
+    id_col = id_column if id_column and id_column in df.columns else None
+    weight_col = weight_column if weight_column and weight_column in df.columns else None
+
+    counts, keys = _category_counts(valid_df, key_columns, id_col, weight_col)
+    return format_category_stats(counts, keys, total_base, has_parent, weight_col is not None)
+
+def format_category_stats(counts: list, keys: list, total_base, has_parent: bool, weighted: bool) -> dict:
+    """
+    Builds the category stats dict from per-category counts and key tuples
+    (parent, category) or (category,), sorted by percentage descending.
+    """
+    labels = []
+    counts = list(counts)
+    for i, key in enumerate(keys):
+        if has_parent:
+            parent, cat = key
+            # Rows never compare equal to a missing parent, so such pairs count 0
+            if pd.isna(parent):
+                counts[i] = np.float64(0.0) if weighted else 0
             # Format key: "Sub (Parent)"
-            key = f"{cat} ({parent})"
-            stats[key] = {
-                "count": round(count, 1),
-                "percentage": round((count / total_base) * 100, 1)
-            }
-            
+            labels.append(f"{cat} ({parent})")
+        else:
+            labels.append(str(key[0]))
+
+    if weighted:
+        # Rounds the same way as round() on each numpy value, in one call
+        values = np.asarray(counts, dtype=np.float64)
+        rounded = zip(np.round(values, 1), np.round((values / total_base) * 100, 1))
     else:
-        # Original logic: Group by Category only
-        categories = valid_df[column].unique()
-        
-        for cat in categories:
-            cat_df = valid_df[valid_df[column] == cat]
-            
-            if id_column and id_column in df.columns:
-                if weight_column and weight_column in df.columns:
-                    unique_responders = cat_df[[id_column, weight_column]].drop_duplicates(subset=[id_column])
-                    count = unique_responders[weight_column].sum()
-                else:
-                    count = cat_df[id_column].nunique()
-            else:
-                if weight_column and weight_column in df.columns:
-                    count = cat_df[weight_column].sum()
-                else:
-                    count = len(cat_df)
-            
-            stats[str(cat)] = {
-                "count": round(count, 1),
-                "percentage": round((count / total_base) * 100, 1)
-            }
-        
+        rounded = ((round(count, 1), round((count / total_base) * 100, 1)) for count in counts)
+
+    stats = {}
+    for label, (count, percentage) in zip(labels, rounded):
+        stats[label] = {
+            "count": count,
+            "percentage": percentage
+        }
+
     # Sort by percentage descending
     return dict(sorted(stats.items(), key=lambda item: item[1]['percentage'], reverse=True))
+
+def category_groups(df: pd.DataFrame, key_columns: list) -> np.ndarray:
+    """
+    One integer code per row for the combination of key_columns values, numbered
+    in order of first appearance. Missing values form their own group.
+    """
+    group = np.zeros(len(df), dtype=np.int64)
+    for col in key_columns:
+        codes, col_uniques = pd.factorize(df[col], use_na_sentinel=False)
+        group = group * len(col_uniques) + codes
+    group, _ = pd.factorize(group)
+    return group
+
+def _category_counts(valid_df: pd.DataFrame, key_columns: list, id_column: str = None, weight_column: str = None):
+    """
+    Respondent count (or weight) for every distinct combination of key_columns,
+    in order of first appearance. A respondent with several rows for the same
+    combination is counted once, using the weight of their first row.
+
+    Returns:
+        (counts, keys) where keys are tuples of key column values.
+    """
+    group = category_groups(valid_df, key_columns)
+    n_groups = int(group.max()) + 1 if len(group) else 0
+
+    # Key values as they appear in the first row of each group
+    first_rows = pd.Series(group).drop_duplicates().index.to_numpy()
+    keys = list(zip(*(valid_df[col].to_numpy()[first_rows] for col in key_columns)))
+
+    weights = _weight_array(valid_df, weight_column)
+    rows = np.ones(len(valid_df), dtype=bool)
+    if id_column:
+        id_codes, _ = pd.factorize(valid_df[id_column], use_na_sentinel=False)
+        rows = ~pd.Series(id_codes.astype(np.int64) * n_groups + group).duplicated().to_numpy()
+        if weights is None:
+            # nunique ignores missing IDs
+            rows &= valid_df[id_column].notna().to_numpy()
+
+    if weights is None:
+        counts = [int(c) for c in np.bincount(group[rows], minlength=n_groups)]
+    else:
+        counts = list(np.bincount(group[rows], weights=weights[rows], minlength=n_groups))
+    return counts, keys
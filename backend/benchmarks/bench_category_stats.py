@@ -0,0 +1,181 @@
+"""
+Benchmark: calculate_category_stats on multi-row coding data.
+
+Compares the grouped implementation in analysis.py against the previous
+per-pair loop (kept below as legacy_category_stats) and checks that both
+return identical results.
+
+Usage (from backend/):
+    python benchmarks/bench_category_stats.py [--respondents 20000] [--categories 300] [--repeat 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analysis
+
+
+def make_coding_data(respondents: int, categories: int, parents: int = 12, seed: int = 0) -> pd.DataFrame:
+    """Synthetic coded open-ends: 1-5 rows per respondent, each with a parent and sub-category."""
+    rng = np.random.default_rng(seed)
+    rows_per_respondent = rng.integers(1, 6, respondents)
+    ids = np.repeat([f"R_{i:06d}" for i in range(respondents)], rows_per_respondent)
+    n = len(ids)
+
+    weights = np.repeat(rng.uniform(0.5, 2.0, respondents), rows_per_respondent)
+    sub = rng.integers(0, categories, n)
+    sub_category = np.array([f"Sub_{i:03d}" for i in range(categories)], dtype=object)[sub]
+    parent = np.array([f"Parent_{i:02d}" for i in range(parents)], dtype=object)[sub % parents]
+
+    # A few uncoded rows, as in real exports
+    blank = rng.random(n) < 0.05
+    sub_category[blank] = None
+
+    return pd.DataFrame({
+        "ResponseId": ids,
+        "Weight": weights,
+        "Category": parent,
+        "SubCategory": sub_category
+    })
+
+
+def time_call(func, repeat: int, *args, **kwargs):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--respondents", type=int, default=20000)
+    parser.add_argument("--categories", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    df = make_coding_data(args.respondents, args.categories)
+    print(f"Coding rows: {len(df):,}  respondents: {args.respondents:,}  sub-categories: {args.categories}")
+
+    cases = [
+        ("sub-category by parent, weighted", dict(column="SubCategory", id_column="ResponseId", weight_column="Weight", parent_column="Category")),
+        ("sub-category by parent, unweighted", dict(column="SubCategory", id_column="ResponseId", parent_column="Category")),
+        ("category, weighted", dict(column="Category", id_column="ResponseId", weight_column="Weight")),
+    ]
+
+    for name, kwargs in cases:
+        legacy_s, legacy_result = time_call(legacy_category_stats, args.repeat, df, **kwargs)
+        new_s, new_result = time_call(analysis.calculate_category_stats, args.repeat, df, **kwargs)
+        identical = list(legacy_result.items()) == list(new_result.items())
+        print(f"{name:<38} legacy {legacy_s * 1000:10.1f} ms   grouped {new_s * 1000:8.1f} ms   "
+              f"speedup {legacy_s / new_s:7.1f}x   identical={identical}")
+        if not identical:
+            sys.exit(1)
+
+
+# --- Previous implementation, kept as the reference ------------------------
+
+def legacy_category_stats(df: pd.DataFrame, column: str, id_column: str = None, weight_column: str = None, parent_column: str = None) -> dict[str, float]:
+    """
+    Calculates the percentage of respondents who mentioned each category in the given column.
+    Handles multi-row data (one respondent can have multiple categories).
+    If parent_column is provided, keys will be formatted as "Category (Parent)".
+    """
+    if df.empty or column not in df.columns:
+        return {}
+
+    # 1. Determine Total Base (Unique Respondents)
+    # Reverted to use Total Segment Population (Incidence Rate) as requested.
+    if id_column and id_column in df.columns:
+        if weight_column and weight_column in df.columns:
+            # Weighted Unique Respondents
+            unique_weights = df[[id_column, weight_column]].drop_duplicates(subset=[id_column])
+            total_base = unique_weights[weight_column].sum()
+        else:
+            total_base = df[id_column].nunique()
+    else:
+        # Fallback: Total rows
+        if weight_column and weight_column in df.columns:
+            total_base = df[weight_column].sum()
+        else:
+            total_base = len(df)
+
+    if total_base == 0:
+        return {}
+
+    # Filter out empty categories for numerator calculation
+    valid_df = df[df[column].notna() & (df[column].astype(str).str.strip() != '')].copy()
+    
+    if valid_df.empty:
+        return {}
+
+    stats = {}
+    
+    if parent_column and parent_column in df.columns:
+        # Group by Parent and Category
+        # Get unique pairs
+        pairs = valid_df[[parent_column, column]].drop_duplicates()
+        
+        for _, row in pairs.iterrows():
+            parent = row[parent_column]
+            cat = row[column]
+            
+            # Filter for this specific pair
+            cat_df = valid_df[(valid_df[parent_column] == parent) & (valid_df[column] == cat)]
+            
+            if id_column and id_column in df.columns:
+                if weight_column and weight_column in df.columns:
+                    unique_responders = cat_df[[id_column, weight_column]].drop_duplicates(subset=[id_column])
+                    count = unique_responders[weight_column].sum()
+                else:
+                    count = cat_df[id_column].nunique()
+            else:
+                if weight_column and weight_column in df.columns:
+                    count = cat_df[weight_column].sum()
+                else:
+                    count = len(cat_df)
+            
+            # Format key: "Sub (Parent)"
+            key = f"{cat} ({parent})"
+            stats[key] = {
+                "count": round(count, 1),
+                "percentage": round((count / total_base) * 100, 1)
+            }
+            
+    else:
+        # Original logic: Group by Category only
+        categories = valid_df[column].unique()
+        
+        for cat in categories:
+            cat_df = valid_df[valid_df[column] == cat]
+            
+            if id_column and id_column in df.columns:
+                if weight_column and weight_column in df.columns:
+                    unique_responders = cat_df[[id_column, weight_column]].drop_duplicates(subset=[id_column])
+                    count = unique_responders[weight_column].sum()
+                else:
+                    count = cat_df[id_column].nunique()
+            else:
+                if weight_column and weight_column in df.columns:
+                    count = cat_df[weight_column].sum()
+                else:
+                    count = len(cat_df)
+            
+            stats[str(cat)] = {
+                "count": round(count, 1),
+                "percentage": round((count / total_base) * 100, 1)
+            }
+        
+    # Sort by percentage descending
+    return dict(sorted(stats.items(), key=lambda item: item[1]['percentage'], reverse=True))
+
+
+if __name__ == "__main__":
+    main()
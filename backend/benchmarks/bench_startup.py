@@ -0,0 +1,174 @@
+"""
+Benchmark: backend cold start.
+
+Starts the backend as a separate process, the way Electron does, and
+measures from spawn to:
+
+- first /health answer (the Electron window can open),
+- /health reporting ready (the analysis modules are loaded),
+- first /analyze result on datasets persisted by an earlier run (what an
+  analyst reopening the app waits for).
+
+Datasets are uploaded once into a temporary NPS_DATA_DIR before the timed
+runs. By default both entry points are measured: server.py (fast start)
+and main.py (every module imported before listening).
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 3] [--respondents 10000]
+        [--command ./dist/nps-backend/nps-backend] [--output startup.json]
+"""
+
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEGMENT_COLUMNS = ["Gender", "Age", "Region"]
+POLL_S = 0.02
+START_TIMEOUT_S = 120
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(port: int, method: str, path: str, body: bytes = None, content_type: str = None, timeout: float = 300):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=body, method=method)
+    if content_type:
+        req.add_header("Content-Type", content_type)
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return response.status, json.loads(response.read() or b"null")
+
+
+def post_json(port: int, path: str, payload: dict):
+    return request(port, "POST", path, json.dumps(payload).encode(), "application/json")
+
+
+def upload(port: int, path: str, filename: str, content: bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: text/csv\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return request(port, "POST", path, body, f"multipart/form-data; boundary={boundary}")
+
+
+class Backend:
+    """A backend process on a free port; started on enter, killed on exit."""
+
+    def __init__(self, command: list, data_dir: str):
+        self.command = command
+        self.port = free_port()
+        self.env = dict(os.environ, NPS_DATA_DIR=data_dir, NPS_PORT=str(self.port))
+        self.process = None
+        self.spawned_at = None
+
+    def __enter__(self) -> "Backend":
+        self.spawned_at = time.perf_counter()
+        self.process = subprocess.Popen(self.command, cwd=BACKEND_DIR, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.kill()
+        self.process.wait()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.spawned_at
+
+    def wait_for_health(self, ready: bool) -> float:
+        """Seconds from spawn until /health answers (and reports ready, if asked)."""
+        while self.elapsed() < START_TIMEOUT_S:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{' '.join(self.command)} exited with code {self.process.returncode}")
+            try:
+                status, body = request(self.port, "GET", "/health", timeout=1)
+                if status == 200 and (not ready or body.get("ready", True)):
+                    return self.elapsed()
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            time.sleep(POLL_S)
+        raise RuntimeError(f"{' '.join(self.command)} did not start within {START_TIMEOUT_S}s")
+
+
+def analysis_request(port: int) -> dict:
+    _, preview = post_json(port, "/preview-segments", {"segment_columns": SEGMENT_COLUMNS, "target_column": "Count"})
+    return {
+        "nps_column": "NPS",
+        "top_box_columns": ["Sat1", "Sat2", "Sat3"],
+        "open_end_columns": ["Category", "SubCategory"],
+        "group_by_columns": ["Region"],
+        "weighting_config": {
+            "segment_columns": SEGMENT_COLUMNS,
+            "targets": preview["suggested_targets"],
+            "target_column": "Count"
+        }
+    }
+
+
+def prepare(command: list, data_dir: str, respondents: int) -> dict:
+    """Uploads synthetic datasets (persisted to data_dir) and returns the /analyze request."""
+    with Backend(command, data_dir) as backend:
+        backend.wait_for_health(ready=True)
+        upload(backend.port, "/upload/qualtrics", "survey.csv", datagen.make_survey(respondents).to_csv(index=False).encode())
+        upload(backend.port, "/upload/population", "population.csv", datagen.make_population().to_csv(index=False).encode())
+        upload(backend.port, "/upload/coding", "coding.csv", datagen.make_coding(respondents).to_csv(index=False).encode())
+        return analysis_request(backend.port)
+
+
+def measure(command: list, data_dir: str, analysis: dict) -> dict:
+    with Backend(command, data_dir) as backend:
+        first_health = backend.wait_for_health(ready=False)
+        status, _ = post_json(backend.port, "/analyze", analysis)
+        if status != 200:
+            raise RuntimeError(f"/analyze answered {status}")
+        first_analyze = backend.elapsed()
+        ready = backend.wait_for_health(ready=True)
+    return {"first_health_s": round(first_health, 3), "ready_s": round(ready, 3), "first_analyze_s": round(first_analyze, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--respondents", type=int, default=10000)
+    parser.add_argument("--command", action="append", help="backend command to measure (repeatable); default: server.py and main.py")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    commands = [shlex.split(command) for command in args.command] if args.command else [
+        [sys.executable, "server.py"],
+        [sys.executable, "main.py"],
+    ]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="nps-startup-") as data_dir:
+        analysis = prepare(commands[0], data_dir, args.respondents)
+        for command in commands:
+            runs = [measure(command, data_dir, analysis) for _ in range(args.runs)]
+            best = {key: min(run[key] for run in runs) for key in runs[0]}
+            results.append({"command": " ".join(command), "runs": runs, "best": best})
+            print(f"{' '.join([os.path.basename(command[0])] + command[1:]):<30} first /health {best['first_health_s']:6.2f}s   "
+                  f"ready {best['ready_s']:6.2f}s   first /analyze {best['first_analyze_s']:6.2f}s", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"respondents": args.respondents, "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
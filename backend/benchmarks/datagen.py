@@ -0,0 +1,147 @@
+"""
+Synthetic survey data for benchmarks.
+
+Generates data shaped like the real uploads, at any number of respondents:
+
+- make_survey: a Qualtrics export (ResponseId, NPS, Gender/Age/Region and
+  7-point satisfaction questions, some with labelled end points as Qualtrics
+  writes them), with a few missing answers.
+- make_population: population counts per Gender x Age x Region cell.
+- make_coding: coded open-ends, 0-4 rows per respondent with a parent
+  category and a sub-category.
+- make_food_survey / make_food_population / make_food_coding: the Korean
+  food NPS files (Q1_1, gender, age_group, rgn_nm, bmclub, division, is_mfo;
+  mem_rate per population cell; category/sub_category coding).
+
+Every generator is vectorized and seeded, so 1M-respondent files build in
+seconds and repeat exactly between runs.
+"""
+
+import itertools
+import numpy as np
+import pandas as pd
+
+GENDERS = ["Male", "Female"]
+AGES = ["18-24", "25-34", "35-44", "45-54", "55+"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+REGION_SHARES = [0.3, 0.25, 0.2, 0.15, 0.1]
+SATISFACTION = ["1 - Extremely dissatisfied", "2", "3", "4", "5", "6", "7 - Extremely satisfied"]
+PARENT_CATEGORIES = ["Price", "Delivery", "Menu", "App", "Service", "Packaging"]
+SUB_CATEGORIES_PER_PARENT = 5
+
+FOOD_GENDERS = ["MALE", "FEMALE"]
+FOOD_AGES = ["10대", "20대", "30대", "40대", "50대 이상"]
+FOOD_REGIONS = ["수도권", "광역시", "지방"]
+FOOD_BMCLUB = ["구독", "미구독"]
+FOOD_DIVISIONS = ["OD", "MP", "TAKEOUT"]
+FOOD_CATEGORIES = {
+    "가게/메뉴 다양성": ["가게 많음", "메뉴 다양", "가게 적음"],
+    "배달팁": ["배달팁 높음", "배달팁 적정", "무료배달"],
+    "할인": ["쿠폰 많음", "쿠폰 부족", "할인 혜택"],
+    "배달 속도": ["빠름", "느림", "예상 시간 정확"],
+    "앱 사용성": ["편리함", "오류", "검색 불편"],
+}
+
+
+def _response_ids(prefix: str, n: int) -> np.ndarray:
+    return np.char.add(prefix, np.arange(n).astype(str)).astype(object)
+
+
+def _choice(rng: np.random.Generator, values: list, n: int, p=None) -> np.ndarray:
+    return np.asarray(values, dtype=object)[rng.choice(len(values), n, p=p)]
+
+
+def _blank(rng: np.random.Generator, values: np.ndarray, rate: float) -> np.ndarray:
+    values = values.astype(object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+
+def make_survey(respondents: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = respondents
+    # Scores lean positive, as in real NPS data
+    nps = rng.choice(11, n, p=np.array([1, 1, 1, 1, 2, 3, 4, 6, 8, 7, 6]) / 40).astype(float)
+    nps[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({
+        "ResponseId": _response_ids("R_", n),
+        "NPS": nps,
+        "Gender": _blank(rng, _choice(rng, GENDERS, n), 0.01),
+        "Age": _choice(rng, AGES, n),
+        "Region": _choice(rng, REGIONS, n, p=REGION_SHARES),
+        "Sat1": _blank(rng, _choice(rng, SATISFACTION, n), 0.02),
+        "Sat2": _choice(rng, SATISFACTION, n),
+        "Sat3": rng.integers(1, 8, n),
+    })
+
+
+def make_population(seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cells = list(itertools.product(GENDERS, AGES, REGIONS))
+    population = pd.DataFrame(cells, columns=["Gender", "Age", "Region"])
+    population["Count"] = rng.integers(1000, 50000, len(cells))
+    return population
+
+
+def make_coding(respondents: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 1)
+    rows_per_respondent = rng.choice(5, respondents, p=[0.3, 0.35, 0.2, 0.1, 0.05])
+    ids = np.repeat(_response_ids("R_", respondents), rows_per_respondent)
+    n = len(ids)
+    parent = rng.integers(0, len(PARENT_CATEGORIES), n)
+    sub = rng.integers(0, SUB_CATEGORIES_PER_PARENT, n)
+    parents = np.asarray(PARENT_CATEGORIES, dtype=object)[parent]
+    subs = np.char.add(np.char.add(parents.astype(str), " / "), sub.astype(str)).astype(object)
+    return pd.DataFrame({
+        "ResponseId": ids,
+        "Category": parents,
+        "SubCategory": _blank(rng, subs, 0.05),
+        "Comment": "free text",
+    })
+
+
+def make_food_survey(respondents: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 2)
+    n = respondents
+    return pd.DataFrame({
+        "ResponseId": _response_ids("F_", n),
+        "Q1_1": rng.choice(11, n, p=np.array([1, 1, 1, 1, 2, 3, 4, 6, 8, 7, 6]) / 40),
+        "gender": _choice(rng, FOOD_GENDERS, n),
+        "age_group": _choice(rng, FOOD_AGES, n),
+        "rgn_nm": _choice(rng, FOOD_REGIONS, n, p=[0.5, 0.3, 0.2]),
+        "bmclub": _choice(rng, FOOD_BMCLUB, n, p=[0.35, 0.65]),
+        "division": _choice(rng, FOOD_DIVISIONS, n, p=[0.6, 0.3, 0.1]),
+        "is_mfo": rng.integers(0, 2, n),
+        "Q11": rng.integers(1, 8, n),
+        "Q21": rng.integers(1, 8, n),
+        "Q31": rng.integers(1, 8, n),
+    })
+
+
+def make_food_population(seed: int = 0) -> pd.DataFrame:
+    """The 241 population cells of the food survey, with mem_rate summing to 1."""
+    rng = np.random.default_rng(seed + 3)
+    cells = list(itertools.product(FOOD_GENDERS, FOOD_AGES, FOOD_REGIONS, FOOD_BMCLUB, FOOD_DIVISIONS, [0, 1]))
+    population = pd.DataFrame(cells, columns=["gender", "age_group", "rgn_nm", "bmclub", "division", "is_mfo"])
+    # Not every cell exists in the real population table
+    population = population.sample(n=241, random_state=seed).sort_index().reset_index(drop=True)
+    rates = rng.random(len(population))
+    population["mem_rate"] = rates / rates.sum()
+    population["mem_cnt"] = rng.integers(100, 10000, len(population))
+    population["TOTAL_CNT"] = population["mem_cnt"].sum()
+    return population
+
+
+def make_food_coding(respondents: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 4)
+    rows_per_respondent = rng.choice(4, respondents, p=[0.35, 0.4, 0.18, 0.07])
+    ids = np.repeat(_response_ids("F_", respondents), rows_per_respondent)
+    n = len(ids)
+    pairs = [(category, sub) for category, subs in FOOD_CATEGORIES.items() for sub in subs]
+    picked = rng.integers(0, len(pairs), n)
+    return pd.DataFrame({
+        "ResponseId": ids,
+        "classification": "open-end",
+        "category": np.asarray([category for category, _ in pairs], dtype=object)[picked],
+        "sub_category": np.asarray([sub for _, sub in pairs], dtype=object)[picked],
+    })
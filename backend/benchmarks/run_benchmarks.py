@@ -0,0 +1,258 @@
+"""
+Benchmark suite: core calculations and full endpoints on synthetic data.
+
+For each size (respondents) the suite generates a survey, population table
+and multi-row coding file (plus the Korean food NPS files, see datagen.py)
+and times:
+
+- weighting.calculate_weights, analysis.calculate_nps and
+  analysis.calculate_category_stats on the survey,
+- food_nps.calculate_food_nps_with_weighting on the food files,
+- the endpoints through FastAPI's TestClient: uploads, /analyze,
+  /analyze/response-rates, and the food NPS uploads and /food-nps/analyze
+  (the result cache is cleared before every repeat).
+
+Each benchmark reports the best of --repeat runs. Results are written as
+JSON (with the git commit, library versions and CPU count) so two commits can
+be compared with --compare, which exits with status 1 when any benchmark got
+slower than --tolerance.
+
+Usage (from backend/):
+    python benchmarks/run_benchmarks.py [--sizes 10000 100000 1000000] [--repeat 3]
+        [--only weighting nps ...] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Keep benchmark uploads out of the user's dataset directory
+os.environ["NPS_PERSIST_DATASETS"] = "0"
+os.environ.setdefault("NPS_DATA_DIR", tempfile.mkdtemp(prefix="nps-bench-"))
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+import analysis
+import datagen
+import food_nps
+import main as backend
+import weighting
+
+SEGMENT_COLUMNS = ["Gender", "Age", "Region"]
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Drops what the analysis modules print while loading and computing."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def time_call(func: Callable, repeat: int, setup: Callable = None):
+    """Best wall time of func() over repeat runs (setup() runs untimed before each); also the last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def csv_bytes(df: pd.DataFrame, encoding: str = "utf-8") -> bytes:
+    return df.to_csv(index=False).encode(encoding)
+
+
+def _checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} -> {response.status_code}: {response.text[:300]}")
+    return response
+
+
+def function_benchmarks(size: int, repeat: int, seed: int) -> Dict[str, Callable[[], float]]:
+    survey = datagen.make_survey(size, seed)
+    population = datagen.make_population(seed)
+    coding = datagen.make_coding(size, seed)
+    targets = weighting.calculate_targets(population, SEGMENT_COLUMNS, "Count")
+    weighted = weighting.calculate_weights(survey, SEGMENT_COLUMNS, targets)
+    merged = coding.merge(weighted[["ResponseId", "Weight"]], on="ResponseId", how="left")
+
+    food_survey = datagen.make_food_survey(size, seed)
+    food_population = datagen.make_food_population(seed)
+    food_coding = datagen.make_food_coding(size, seed)
+
+    return {
+        "calculate_weights": lambda: time_call(
+            lambda: weighting.calculate_weights(survey, SEGMENT_COLUMNS, targets), repeat)[0],
+        "calculate_nps": lambda: time_call(
+            lambda: analysis.calculate_nps(weighted, "NPS", "Weight"), repeat)[0],
+        "calculate_category_stats": lambda: time_call(
+            lambda: analysis.calculate_category_stats(
+                merged, "SubCategory", id_column="ResponseId", weight_column="Weight", parent_column="Category"),
+            repeat)[0],
+        "calculate_food_nps_with_weighting": lambda: time_call(
+            lambda: food_nps.calculate_food_nps_with_weighting(food_survey, food_population, food_coding), repeat)[0],
+    }
+
+
+def endpoint_benchmarks(size: int, repeat: int, seed: int) -> Dict[str, Callable[[], float]]:
+    client = TestClient(backend.app)
+    files = {
+        "qualtrics": csv_bytes(datagen.make_survey(size, seed)),
+        "population": csv_bytes(datagen.make_population(seed)),
+        "coding": csv_bytes(datagen.make_coding(size, seed)),
+        "food_qualtrics": csv_bytes(datagen.make_food_survey(size, seed), "utf-8-sig"),
+        "food_population": csv_bytes(datagen.make_food_population(seed), "cp949"),
+        "food_coding": csv_bytes(datagen.make_food_coding(size, seed), "utf-8-sig"),
+    }
+
+    def upload(path: str, name: str):
+        return _checked(client.post(path, files={"file": (f"{name}.csv", files[name], "text/csv")}))
+
+    def upload_survey():
+        upload("/upload/qualtrics", "qualtrics")
+        upload("/upload/population", "population")
+        upload("/upload/coding", "coding")
+
+    def upload_food():
+        upload("/food-nps/upload/qualtrics", "food_qualtrics")
+        upload("/food-nps/upload/population", "food_population")
+        upload("/food-nps/upload/coding", "food_coding")
+
+    def analysis_request() -> dict:
+        preview = _checked(client.post("/preview-segments", json={
+            "segment_columns": SEGMENT_COLUMNS, "target_column": "Count"
+        })).json()
+        return {
+            "nps_column": "NPS",
+            "top_box_columns": ["Sat1", "Sat2", "Sat3"],
+            "open_end_columns": ["Category", "SubCategory"],
+            "group_by_columns": ["Region"],
+            "weighting_config": {
+                "segment_columns": SEGMENT_COLUMNS,
+                "targets": preview["suggested_targets"],
+                "target_column": "Count"
+            }
+        }
+
+    def analyze(path: str) -> Callable[[], float]:
+        def run() -> float:
+            upload_survey()
+            request = analysis_request()
+            return time_call(lambda: _checked(client.post(path, json=request)), repeat,
+                             setup=backend.result_cache.invalidate)[0]
+        return run
+
+    def food_analyze() -> float:
+        upload_food()
+        return time_call(lambda: _checked(client.post("/food-nps/analyze")), repeat)[0]
+
+    return {
+        "POST /upload (survey, population, coding)": lambda: time_call(upload_survey, repeat)[0],
+        "POST /analyze": analyze("/analyze"),
+        "POST /analyze/response-rates": analyze("/analyze/response-rates"),
+        "POST /food-nps/upload (survey, population, coding)": lambda: time_call(upload_food, repeat)[0],
+        "POST /food-nps/analyze": food_analyze,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def run(sizes: List[int], repeat: int, seed: int, only: List[str]) -> dict:
+    results = []
+    for size in sizes:
+        for suite in (function_benchmarks, endpoint_benchmarks):
+            for name, bench in suite(size, repeat, seed).items():
+                if only and not any(term in name for term in only):
+                    continue
+                with quiet():
+                    seconds = bench()
+                results.append({"name": name, "respondents": size, "seconds": round(seconds, 6)})
+                print(f"{name:<52} {size:>9,d}  {seconds:9.3f}s", flush=True)
+    return {"environment": environment(), "repeat": repeat, "seed": seed, "results": results}
+
+
+def compare(current: dict, baseline: dict, tolerance: float, noise_s: float) -> bool:
+    """
+    Prints the change against baseline per benchmark; False if any got slower
+    than tolerance (and by more than noise_s seconds, so sub-millisecond
+    timings do not flag on jitter).
+    """
+    previous = {(r["name"], r["respondents"]): r["seconds"] for r in baseline["results"]}
+    ok = True
+    print(f"\nCompared with {baseline['environment'].get('commit', 'baseline')}:")
+    for result in current["results"]:
+        before = previous.get((result["name"], result["respondents"]))
+        if before is None:
+            continue
+        change = (result["seconds"] - before) / before if before > 0 else 0.0
+        regressed = change > tolerance and result["seconds"] - before > noise_s
+        ok = ok and not regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{result['name']:<52} {result['respondents']:>9,d}  {before:9.3f}s -> {result['seconds']:9.3f}s  {change:+7.1%}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", default=[], help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="slowdown treated as a regression (0.10 = 10%%)")
+    parser.add_argument("--noise", type=float, default=0.005, help="slowdowns smaller than this many seconds are ignored")
+    args = parser.parse_args()
+
+    current = run(args.sizes, args.repeat, args.seed, args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(current, baseline, args.tolerance, args.noise):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,12 @@ cd "$(dirname "$0")"
 # --name: Name of the executable
 # --clean: Clean cache
 # --hidden-import: Explicitly import dependencies that might be missed
+# --exclude-module: Keep test suites and GUI toolkits pulled in by optional
+#   imports out of the bundle (fewer files to scan on first launch)
+#
+# server.py is the entry point: it answers /health while main.py and the
+# analysis modules load (see server.py). PyInstaller's own pandas hook collects
+# the compiled extensions pandas needs, so pandas is not collected wholesale.
 pyinstaller --onedir \
     --paths . \
     --name nps-backend \
@@ -23,18 +29,41 @@ pyinstaller --onedir \
     --hidden-import=python_multipart \
     --hidden-import=openpyxl \
     --hidden-import=chardet \
-    --hidden-import=requests \
+    --hidden-import=pyarrow \
     --hidden-import=encodings \
     --hidden-import=data_processing \
     --hidden-import=weighting \
+    --hidden-import=segment_keys \
+    --hidden-import=scales \
     --hidden-import=analysis \
     --hidden-import=food_nps \
-    --collect-all uvicorn \
-    --collect-all pandas \
-    main.py
+    --hidden-import=settings \
+    --hidden-import=dataset_store \
+    --hidden-import=ingest \
+    --hidden-import=result_cache \
+    --hidden-import=respondent_index \
+    --hidden-import=subset_weighting \
+    --hidden-import=compute \
+    --hidden-import=jobs \
+    --hidden-import=serialization \
+    --hidden-import=exports \
+    --hidden-import=metrics \
+    --hidden-import=profiling \
+    --hidden-import=sessions \
+    --hidden-import=lifecycle \
+    --hidden-import=main \
+    --collect-submodules uvicorn \
+    --exclude-module tkinter \
+    --exclude-module matplotlib \
+    --exclude-module IPython \
+    --exclude-module pytest \
+    --exclude-module pandas.tests \
+    --exclude-module numpy.tests \
+    --exclude-module pyarrow.tests \
+    server.py
 
 # Manually copy local modules to _internal to ensure they are found
 echo "Copying local modules to _internal..."
-cp data_processing.py weighting.py analysis.py food_nps.py dist/nps-backend/_internal/
+cp data_processing.py weighting.py segment_keys.py scales.py analysis.py food_nps.py settings.py dataset_store.py ingest.py result_cache.py respondent_index.py subset_weighting.py compute.py jobs.py serialization.py exports.py metrics.py profiling.py sessions.py lifecycle.py main.py server.py dist/nps-backend/_internal/
 
 echo "Build complete. Executable is in backend/dist/nps-backend"
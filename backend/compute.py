@@ -0,0 +1,132 @@
+"""
+Runs CPU-bound request work off the asyncio event loop.
+
+Handlers are async, but parsing uploads, weighting, analysis and exports
+are synchronous pandas/NumPy work; run on the event loop, one long analysis
+blocks /health, /food-nps/status and every other request. Heavy handlers
+instead await compute.run(), which executes the work on a bounded worker
+pool with a per-request timeout and cancels it when the client disconnects.
+
+Cancellation is cooperative: a thread cannot be interrupted, so long
+loops call check_cancelled() between independent steps (groups, segments,
+columns) and stop there once their request is gone. The same steps call
+report_progress(), which background jobs (see jobs.py) surface to the client;
+outside a job it does nothing. Work submitted for a profiled request is
+sampled with it (see profiling.py), and work in flight keeps the backend
+from shutting down as idle (see lifecycle.py).
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Tuple
+from fastapi import HTTPException, Request
+import settings
+import profiling
+import lifecycle
+
+# How often a running request checks whether its client is still connected
+DISCONNECT_POLL_S = 0.25
+
+
+class Cancelled(BaseException):
+    """
+    Raised inside offloaded work whose request timed out or disconnected.
+    A BaseException, so `except Exception` fallbacks in the analysis code
+    do not swallow it.
+    """
+
+
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("compute_cancel_event", default=None)
+_progress_sink: ContextVar[Optional[Callable[[str, float], None]]] = ContextVar("compute_progress_sink", default=None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.COMPUTE_WORKERS, thread_name_prefix="compute")
+        return _executor
+
+
+def check_cancelled():
+    """Raises Cancelled if the request running this code was cancelled."""
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise Cancelled()
+
+
+def report_progress(stage: str, percent: float):
+    """Records that the running work reached a stage, percent (0-100) through it overall."""
+    sink = _progress_sink.get()
+    if sink is not None:
+        sink(stage, percent)
+
+
+def submit(func: Callable[..., Any], *args, progress: Optional[Callable[[str, float], None]] = None, **kwargs) -> Tuple[Future, threading.Event]:
+    """
+    Starts func(*args, **kwargs) on the compute pool with the caller's
+    context variables, and returns its future with the event that cancels it.
+    progress, if given, receives the work's report_progress() calls.
+    """
+    cancel = threading.Event()
+    context = contextvars.copy_context()
+    context.run(_cancel_event.set, cancel)
+    context.run(_progress_sink.set, progress)
+    lifecycle.begin()
+    future = get_executor().submit(context.run, profiling.call_in_scope, func, *args, **kwargs)
+    future.add_done_callback(lambda _: lifecycle.end())
+    return future, cancel
+
+
+def _consume_result(future: asyncio.Future):
+    # Work abandoned after a timeout or disconnect still finishes (or raises
+    # Cancelled) later; retrieve its outcome so asyncio does not log it
+    if not future.cancelled():
+        future.exception()
+
+
+async def run(request: Optional[Request], func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Awaits func(*args, **kwargs) executed on the compute pool.
+
+    Raises HTTPException 504 when the work exceeds the timeout
+    (settings.REQUEST_TIMEOUT_S by default) and 499 when the client
+    disconnects; in both cases the work is signalled to stop.
+    """
+    loop = asyncio.get_running_loop()
+    work, cancel = submit(func, *args, **kwargs)
+    future = asyncio.wrap_future(work)
+
+    timeout = settings.REQUEST_TIMEOUT_S if timeout is None else timeout
+    deadline = loop.time() + timeout if timeout and timeout > 0 else None
+
+    try:
+        while True:
+            wait = DISCONNECT_POLL_S
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    cancel.set()
+                    raise HTTPException(status_code=504, detail=f"Request timed out after {timeout:g} seconds")
+                wait = min(wait, remaining)
+
+            done, _ = await asyncio.wait({future}, timeout=wait)
+            if done:
+                return future.result()
+
+            if request is not None and await request.is_disconnected():
+                cancel.set()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    except BaseException:
+        # Timeout, disconnect or the handler itself being cancelled
+        cancel.set()
+        if not future.done():
+            future.add_done_callback(_consume_result)
+        raise
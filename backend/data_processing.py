@@ -1,16 +1,24 @@
 import pandas as pd
-import io
+from typing import Optional
+import ingest
+import metrics
 
-def load_file(file_content: bytes, filename: str) -> pd.DataFrame:
+@metrics.timed("load", rows="result")
+def load_file(file_content: ingest.Source, filename: str, encoding: Optional[str] = None) -> pd.DataFrame:
+    """
+    Loads a CSV or Excel file. file_content is either the raw bytes or the
+    path of a spooled upload (see ingest.spool_upload). CSV encoding is
+    sniffed when not given.
+    """
     if filename.endswith('.csv'):
-        return pd.read_csv(io.BytesIO(file_content))
+        return ingest.read_text_csv(file_content, encoding)
     elif filename.endswith('.xlsx') or filename.endswith('.xls'):
-        return pd.read_excel(io.BytesIO(file_content))
+        return ingest.downcast_integers(pd.read_excel(ingest.open_source(file_content)))
     else:
         raise ValueError("Unsupported file format")
 
-def load_qualtrics_data(file_content: bytes, filename: str) -> pd.DataFrame:
-    df = load_file(file_content, filename)
+def load_qualtrics_data(file_content: ingest.Source, filename: str, encoding: Optional[str] = None) -> pd.DataFrame:
+    df = load_file(file_content, filename, encoding)
     # Qualtrics standard export often has 3 header rows.
     # Row 0: Column Names (e.g. Q1, Q2)
     # Row 1: Question Text
@@ -25,6 +33,7 @@ def load_qualtrics_data(file_content: bytes, filename: str) -> pd.DataFrame:
     # if len(df) > 2: ... (removed)
     return df
 
+@metrics.timed("merge")
 def merge_data(qualtrics_df: pd.DataFrame, coding_df: pd.DataFrame) -> pd.DataFrame:
     if coding_df is None or coding_df.empty:
         return qualtrics_df
@@ -44,7 +53,7 @@ def merge_data(qualtrics_df: pd.DataFrame, coding_df: pd.DataFrame) -> pd.DataFr
 
 # New functions for food dataset
 
-def load_food_nps_data(file_content: bytes, filename: str) -> pd.DataFrame:
+def load_food_nps_data(file_content: ingest.Source, filename: str) -> pd.DataFrame:
     """Load food NPS survey data CSV."""
     df = load_file(file_content, filename)
     # Ensure required columns exist
@@ -54,7 +63,7 @@ def load_food_nps_data(file_content: bytes, filename: str) -> pd.DataFrame:
         raise ValueError(f"Missing columns in food NPS data: {missing}")
     return df
 
-def load_food_population(file_content: bytes, filename: str) -> pd.DataFrame:
+def load_food_population(file_content: ingest.Source, filename: str) -> pd.DataFrame:
     """Load food population weighting file CSV."""
     df = load_file(file_content, filename)
     required = {'gender', 'age_group', 'rgn_nm', 'bmclub', 'mem_rate'}
@@ -0,0 +1,373 @@
+"""
+Persistent dataset store.
+
+Every uploaded dataset (qualtrics, population, coding, merged, food_*) is
+written as an Arrow IPC file under the data directory and listed in a small
+JSON manifest together with its content hash, row count and columns. On
+startup only the manifest is read; a dataset is reopened memory-mapped the
+first time it is accessed, so restarting the backend does not require
+re-uploading anything.
+
+A store may be given a memory budget. Once the datasets it holds in memory
+exceed it, the least recently used ones are evicted: only their in-memory
+frames are dropped, since the Arrow file is already on disk, and the next
+access reads them back. Datasets that could not be persisted are never
+evicted.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:  # Persistence is disabled without pyarrow
+    pa = None
+
+
+MANIFEST_FILE = "manifest.json"
+
+# Rows sampled per text column to estimate a frame's memory use; sizing
+# every string (memory_usage(deep=True)) takes seconds on a million rows
+SIZE_SAMPLE_ROWS = 1000
+
+
+def _to_arrow_table(df: pd.DataFrame) -> "pa.Table":
+    """
+    Converts df to an Arrow table. Object columns holding mixed Python types
+    (e.g. ints and strings from a ragged CSV) are stored as strings.
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == 'object':
+                df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+        return pa.Table.from_pandas(df, preserve_index=True)
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    """Approximate memory used by df, with text columns sized from a sample of rows."""
+    total = int(df.memory_usage(index=True).sum())
+    rows = len(df)
+    if rows == 0:
+        return total
+    step = max(1, rows // SIZE_SAMPLE_ROWS)
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object:
+            sample = df.iloc[::step, i]
+            strings = int(sample.memory_usage(index=False, deep=True)) - int(sample.memory_usage(index=False))
+            total += strings * rows // len(sample)
+    return total
+
+
+class DatasetStore:
+    """
+    Dict-like registry of datasets: `store["qualtrics"]` returns a DataFrame
+    or None, `store["qualtrics"] = df` replaces (and persists) it.
+    memory_budget (bytes, 0 for none) bounds the datasets held in memory.
+    """
+
+    def __init__(self, root: str, persist: bool = True, memory_budget: int = 0):
+        self.root = root
+        self.persist = persist and pa is not None
+        self.memory_budget = memory_budget
+        self._frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()  # least recently used first
+        self._sizes: Dict[str, int] = {}  # name -> approximate bytes, kept after eviction
+        self._manifest: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.reloads = 0
+
+        # The directory is created by the first write, so opening a store
+        # that never receives a dataset leaves nothing on disk
+        if self.persist and os.path.isdir(self.root):
+            self._manifest = self._read_manifest()
+            self._remove_stale_files()
+
+    # --- dict interface -------------------------------------------------
+
+    def __getitem__(self, name: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if name in self._frames:
+                self._frames.move_to_end(name)
+                return self._frames[name]
+
+            entry = self._manifest.get(name)
+            if entry is None:
+                return None
+
+            if "alias" in entry:
+                df = self[entry["alias"]]
+            else:
+                if name in self._sizes:
+                    self.reloads += 1  # read back after an eviction
+                df = self._read_file(entry["file"])
+            self._hold(name, df)
+            return df
+
+    def __setitem__(self, name: str, df: Optional[pd.DataFrame]):
+        self.update({name: df})
+
+    def update(self, datasets: Dict[str, Optional[pd.DataFrame]], meta: Optional[Dict[str, dict]] = None):
+        """
+        Replaces several datasets at once (e.g. qualtrics and merged on upload).
+        meta optionally holds JSON metadata to record with each dataset.
+        """
+        with self._lock:
+            # Datasets aliasing a replaced one keep the data they pointed to
+            dependents = {
+                other: (self[other], entry.get("meta")) for other, entry in self._manifest.items()
+                if entry.get("alias") in datasets and other not in datasets
+            }
+
+            for name, df in datasets.items():
+                if df is None:
+                    self._drop(name)
+                else:
+                    self._frames[name] = df
+                    entry = self._store(name, df)
+                    if meta and name in meta:
+                        entry["meta"] = meta[name]
+                    self._replace_entry(name, entry)
+                    self._hold(name, df)
+
+            for other, (frame, other_meta) in dependents.items():
+                self._manifest.pop(other, None)
+                self._frames.pop(other, None)
+                self.update({other: frame}, {other: other_meta} if other_meta else None)
+
+    def get(self, name: str, default=None):
+        df = self[name]
+        return default if df is None else df
+
+    def preload(self) -> List[str]:
+        """Reads every persisted dataset not yet in memory; returns their names."""
+        loaded = []
+        for name in list(self._manifest):
+            # One dataset per lock hold, so requests are not held up behind all of them
+            with self._lock:
+                if name in self._frames or name not in self._manifest:
+                    continue
+                if not self._fits(name):
+                    continue  # would only evict datasets preloaded before it
+                self[name]
+            loaded.append(name)
+        return loaded
+
+    def clear(self):
+        """Removes every dataset, in memory and on disk."""
+        with self._lock:
+            for name in list(self._manifest):
+                self._drop(name)
+            self._frames.clear()
+            self._sizes.clear()
+
+    # --- metadata (never loads the data) ---------------------------------
+
+    def names(self) -> List[str]:
+        return list(self._manifest)
+
+    def exists(self, name: str) -> bool:
+        return name in self._manifest
+
+    def rows(self, name: str) -> int:
+        entry = self._manifest.get(name)
+        return entry["rows"] if entry else 0
+
+    def columns(self, name: str) -> List[str]:
+        entry = self._manifest.get(name)
+        return list(entry["columns"]) if entry else []
+
+    def metadata(self, name: str) -> dict:
+        """Metadata recorded with the dataset by update(), or {}."""
+        entry = self._manifest.get(name)
+        return dict(entry.get("meta", {})) if entry else {}
+
+    def version(self, name: str) -> Optional[str]:
+        """Content hash of the stored dataset, or None if absent."""
+        entry = self._manifest.get(name)
+        return entry.get("hash") if entry else None
+
+    # --- memory ----------------------------------------------------------
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the datasets in memory (shared frames counted once)."""
+        with self._lock:
+            return sum(self._sizes.get(names[0], 0) for names in self._groups().values())
+
+    def residency(self, names: Optional[List[str]] = None) -> Dict[str, dict]:
+        """Whether each dataset is in memory, and its approximate size (None if never loaded)."""
+        with self._lock:
+            return {
+                name: {"resident": name in self._frames, "memory_bytes": self._sizes.get(name)}
+                for name in (self.names() if names is None else names)
+                if name in self._manifest
+            }
+
+    def persisted(self) -> bool:
+        """Whether every dataset can be read back from disk, so dropping the store loses nothing."""
+        with self._lock:
+            return self.persist and all(entry.get("file") or "alias" in entry for entry in self._manifest.values())
+
+    def memory_stats(self) -> dict:
+        return {
+            "memory_bytes": self.memory_bytes(),
+            "memory_budget_bytes": self.memory_budget,
+            "evictions": self.evictions,
+            "reloads": self.reloads
+        }
+
+    # --- internals -------------------------------------------------------
+
+    def _hold(self, name: str, df: pd.DataFrame):
+        """Records name as the most recently used dataset, then evicts down to the budget."""
+        self._frames[name] = df
+        self._frames.move_to_end(name)
+        shared = next((other for other, frame in self._frames.items() if frame is df and other != name and other in self._sizes), None)
+        self._sizes[name] = self._sizes[shared] if shared else _frame_bytes(df)
+        self._evict_over_budget(keep=df)
+
+    def _groups(self) -> "OrderedDict[int, List[str]]":
+        """Names in memory grouped by frame (aliases share one), least recently used first."""
+        groups: "OrderedDict[int, List[str]]" = OrderedDict()
+        for name, frame in self._frames.items():
+            groups.setdefault(id(frame), []).append(name)
+        return groups
+
+    def _fits(self, name: str) -> bool:
+        """Whether loading name likely stays within the budget (its file size as the estimate)."""
+        entry = self._manifest.get(name, {})
+        if not self.memory_budget or not entry.get("file"):
+            return True
+        size = self._sizes.get(name) or os.path.getsize(os.path.join(self.root, entry["file"]))
+        return self.memory_bytes() + size <= self.memory_budget
+
+    def _evict_over_budget(self, keep: pd.DataFrame):
+        if not self.memory_budget:
+            return
+        for names in list(self._groups().values()):
+            if self.memory_bytes() <= self.memory_budget:
+                return
+            if self._frames[names[0]] is keep:
+                continue
+            # Only frames that can be read back from their files
+            if all(self._manifest.get(n, {}).get("file") or "alias" in self._manifest.get(n, {}) for n in names):
+                for n in names:
+                    del self._frames[n]
+                self.evictions += 1
+
+    def _store(self, name: str, df: pd.DataFrame) -> dict:
+        """Persists df (unless disabled) and returns its manifest entry."""
+        if not self.persist:
+            return self._describe(df, None)
+
+        # A dataset that is the same object as another (e.g. merged == qualtrics
+        # when no coding is uploaded) is recorded as an alias, not written twice
+        for other, frame in self._frames.items():
+            entry = self._manifest.get(other)
+            if other != name and frame is df and entry and "alias" not in entry:
+                return dict(entry, file=None, alias=other, meta={})
+
+        try:
+            return self._write_file(name, df)
+        except Exception as e:
+            # Keep serving from memory; the dataset just won't survive a restart
+            print(f"WARNING: Could not persist dataset '{name}': {e}")
+            return self._describe(df, None)
+
+    def _describe(self, df: pd.DataFrame, file_name: Optional[str], content_hash: Optional[str] = None) -> dict:
+        if content_hash is None:
+            # In-memory only: hash the pandas representation instead of a file
+            content_hash = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes()).hexdigest()
+        return {
+            "file": file_name,
+            "hash": content_hash,
+            "rows": len(df),
+            "columns": [str(c) for c in df.columns]
+        }
+
+    def _write_file(self, name: str, df: pd.DataFrame) -> dict:
+        table = _to_arrow_table(df)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".{name}.arrow.tmp")
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        digest = hashlib.sha256()
+        with open(tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        file_name = f"{name}-{content_hash[:16]}.arrow"
+        os.replace(tmp_path, os.path.join(self.root, file_name))
+        return self._describe(df, file_name, content_hash)
+
+    def _read_file(self, file_name: str) -> pd.DataFrame:
+        source = pa.memory_map(os.path.join(self.root, file_name), "r")
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+    def _replace_entry(self, name: str, entry: dict):
+        old = self._manifest.get(name)
+        self._manifest[name] = entry
+        self._write_manifest()
+        if old and old.get("file"):
+            self._remove_if_unused(old["file"])
+
+    def _drop(self, name: str):
+        self._frames.pop(name, None)
+        self._sizes.pop(name, None)
+        entry = self._manifest.pop(name, None)
+        if entry is None:
+            return
+        if self.persist:
+            self._write_manifest()
+            if entry.get("file"):
+                self._remove_if_unused(entry["file"])
+
+    def _remove_if_unused(self, file_name: str):
+        if any(e.get("file") == file_name for e in self._manifest.values()):
+            return
+        try:
+            os.remove(os.path.join(self.root, file_name))
+        except OSError:
+            # Still memory-mapped (Windows); cleaned up on next startup
+            pass
+
+    def _remove_stale_files(self):
+        referenced = {e.get("file") for e in self._manifest.values()}
+        for file_name in os.listdir(self.root):
+            if file_name.endswith((".arrow", ".tmp")) and file_name not in referenced:
+                try:
+                    os.remove(os.path.join(self.root, file_name))
+                except OSError:
+                    pass
+
+    def _read_manifest(self) -> Dict[str, dict]:
+        path = os.path.join(self.root, MANIFEST_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose file went missing
+        return {
+            name: entry for name, entry in manifest.items()
+            if "alias" in entry or (entry.get("file") and os.path.exists(os.path.join(self.root, entry["file"])))
+        }
+
+    def _write_manifest(self):
+        if not self.persist:
+            return
+        path = os.path.join(self.root, MANIFEST_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
@@ -8,15 +8,33 @@ This module handles Korean food delivery service NPS analysis with:
 - Weighted NPS calculation with normalization
 """
 
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, Optional
-from io import BytesIO
-import chardet
+from typing import Dict, Any, List, Optional, Tuple
+import ingest
+import compute
+import metrics
 from weighting import assess_weight_risk
 
+# Demographic columns a population cell is matched on; the optional ones are
+# used when both the survey and the population data have them
+CELL_COLUMNS = ['gender', 'age_group', 'rgn_nm', 'bmclub']
+OPTIONAL_CELL_COLUMNS = ['division', 'is_mfo']
 
-def load_food_qualtrics_data(file_content: bytes, filename: str) -> pd.DataFrame:
+# NPS groups in result order
+NPS_GROUPS = ['Promoter', 'Passive', 'Detractor']
+
+# Population indexes kept for recently uploaded population datasets
+POPULATION_INDEX_CACHE_SIZE = 4
+
+_population_index_cache: "OrderedDict[str, PopulationIndex]" = OrderedDict()
+_population_index_lock = threading.Lock()
+
+
+@metrics.timed("load", rows="result")
+def load_food_qualtrics_data(file_content: ingest.Source, filename: str, encoding: Optional[str] = None) -> pd.DataFrame:
     """
     Load Korean Qualtrics food NPS survey data.
 
@@ -29,15 +47,8 @@ def load_food_qualtrics_data(file_content: bytes, filename: str) -> pd.DataFrame
     - Q31-Q33: Delivery satisfaction (7-point scale)
     - Demographics: gender, age_group, rgn_nm, bmclub, division, is_mfo
     """
-    # Detect encoding
-    detected = chardet.detect(file_content)
-    encoding = detected['encoding'] or 'utf-8'
-
-    # Try UTF-8-BOM first (common for Korean Excel exports)
-    try:
-        df = pd.read_csv(BytesIO(file_content), encoding='utf-8-sig')
-    except:
-        df = pd.read_csv(BytesIO(file_content), encoding=encoding)
+    # Encoding is sniffed from a sample (UTF-8 with BOM is common for Korean Excel exports)
+    df = ingest.read_text_csv(file_content, encoding)
 
     # Remove Qualtrics metadata rows logic REMOVED as per user request.
     # We now assume the file has a standard single header row.
@@ -78,7 +89,8 @@ def load_food_qualtrics_data(file_content: bytes, filename: str) -> pd.DataFrame
     return df
 
 
-def load_food_population_data(file_content: bytes, filename: str) -> pd.DataFrame:
+@metrics.timed("load", rows="result")
+def load_food_population_data(file_content: ingest.Source, filename: str, encoding: Optional[str] = None) -> pd.DataFrame:
     """
     Load population weighting data for Korean food delivery demographics.
 
@@ -93,14 +105,7 @@ def load_food_population_data(file_content: bytes, filename: str) -> pd.DataFram
     - mem_cnt: Sample count
     - TOTAL_CNT: Total population
     """
-    # Detect encoding
-    detected = chardet.detect(file_content)
-    encoding = detected['encoding'] or 'utf-8'
-
-    try:
-        df = pd.read_csv(BytesIO(file_content), encoding='utf-8-sig')
-    except:
-        df = pd.read_csv(BytesIO(file_content), encoding=encoding)
+    df = ingest.read_text_csv(file_content, encoding)
 
     # Validate required columns
     required_cols = ['gender', 'age_group', 'rgn_nm', 'bmclub', 'mem_rate']
@@ -119,7 +124,8 @@ def load_food_population_data(file_content: bytes, filename: str) -> pd.DataFram
     return df
 
 
-def load_food_coding_data(file_content: bytes, filename: str) -> pd.DataFrame:
+@metrics.timed("load", rows="result")
+def load_food_coding_data(file_content: ingest.Source, filename: str, encoding: Optional[str] = None) -> pd.DataFrame:
     """
     Load category classification data for open-ended responses.
 
@@ -129,14 +135,7 @@ def load_food_coding_data(file_content: bytes, filename: str) -> pd.DataFrame:
     - category: Main category (e.g., "가게/메뉴 다양성", "배달팁")
     - sub_category: Subcategory (e.g., "가게 많음", "배달팁 높음")
     """
-    # Detect encoding
-    detected = chardet.detect(file_content)
-    encoding = detected['encoding'] or 'utf-8'
-
-    try:
-        df = pd.read_csv(BytesIO(file_content), encoding='utf-8-sig')
-    except:
-        df = pd.read_csv(BytesIO(file_content), encoding=encoding)
+    df = ingest.read_text_csv(file_content, encoding)
 
     # Validate required columns
     required_cols = ['ResponseId', 'category']
@@ -148,16 +147,138 @@ def load_food_coding_data(file_content: bytes, filename: str) -> pd.DataFrame:
     return df
 
 
+def _normalized_codes(series: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """
+    Codes of a column's values as whitespace-free strings ("20대 이하" and
+    "20대이하" share a code), with the string of each code. The string work
+    runs once per distinct value.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    labels = pd.Series(uniques).astype(str).str.replace(" ", "")
+    label_codes, labels = pd.factorize(labels)
+    return label_codes[codes], pd.Index(labels)
+
+
+class PopulationIndex:
+    """
+    Population cells compiled for weight lookup: per cell column, the integer
+    code of every population row and the normalized label of every code, plus
+    each row's mem_rate. Assigning weights to survey respondents is then a
+    code lookup and a bincount instead of merges on string columns.
+    """
+
+    def __init__(self, population_df: pd.DataFrame):
+        self.columns = [col for col in CELL_COLUMNS + OPTIONAL_CELL_COLUMNS if col in population_df.columns]
+        self.codes = {}
+        self.labels = {}
+        for col in self.columns:
+            self.codes[col], self.labels[col] = _normalized_codes(population_df[col])
+        self.mem_rate = population_df['mem_rate'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    @classmethod
+    def for_dataset(cls, version: Optional[str], population_df: pd.DataFrame) -> "PopulationIndex":
+        """Returns the index for a stored population version, building it on first use."""
+        if version is None:
+            return cls(population_df)
+
+        with _population_index_lock:
+            index = _population_index_cache.get(version)
+            if index is not None:
+                _population_index_cache.move_to_end(version)
+                return index
+
+        index = cls(population_df)
+        with _population_index_lock:
+            _population_index_cache[version] = index
+            while len(_population_index_cache) > POPULATION_INDEX_CACHE_SIZE:
+                _population_index_cache.popitem(last=False)
+        return index
+
+    @metrics.timed("weighting")
+    def weight_respondents(self, qualtrics_df: pd.DataFrame, merge_cols: List[str], keep_cols: List[str]) -> pd.DataFrame:
+        """
+        Respondents of qualtrics_df (keep_cols plus the normalized merge_cols)
+        with the mem_rate of their population cell, the sample count of their
+        cell and weight = mem_rate / sample_count (1.0 where no cell matches).
+
+        Rows come out exactly as a left merge on merge_cols would produce
+        them: a respondent matching several population rows (cells repeated
+        once some optional column is not used) appears once per match.
+        qualtrics_df is not modified.
+        """
+        n = len(qualtrics_df)
+        n_pop = len(self.mem_rate)
+        labels = {}
+        respondent_cell = np.zeros(n, dtype=np.int64)  # cell of each respondent's own values
+        known = np.ones(n, dtype=bool)                  # every value exists in the population
+        pop_key = np.zeros(n_pop, dtype=np.int64)
+        q_key = np.zeros(n, dtype=np.int64)
+
+        for col in merge_cols:
+            codes, col_labels = _normalized_codes(qualtrics_df[col])
+            labels[col] = col_labels.take(codes)
+
+            # Re-factorized after each column, so combined codes stay below the row count
+            respondent_cell = pd.factorize(respondent_cell * len(col_labels) + codes)[0]
+
+            pop_codes = self.labels[col].get_indexer(col_labels)[codes]
+            known &= pop_codes >= 0
+            n_labels = len(self.labels[col])
+            combined = pd.factorize(np.concatenate([
+                pop_key * n_labels + self.codes[col],
+                q_key * n_labels + np.maximum(pop_codes, 0)
+            ]))[0]
+            pop_key, q_key = combined[:n_pop], combined[n_pop:]
+
+        # Population rows sorted by cell; a cell's rows keep their file order
+        order = np.argsort(pop_key, kind='stable')
+        cell_keys, starts, counts = np.unique(pop_key[order], return_index=True, return_counts=True)
+        if len(cell_keys):
+            position = np.minimum(np.searchsorted(cell_keys, q_key), len(cell_keys) - 1)
+            matched = known & (cell_keys[position] == q_key)
+        else:
+            position = np.zeros(n, dtype=np.int64)
+            matched = np.zeros(n, dtype=bool)
+
+        matches = np.where(matched, counts[position] if len(cell_keys) else 1, 1)
+        if (matches == 1).all():
+            rows = np.arange(n)
+            within = np.zeros(n, dtype=np.int64)
+        else:
+            rows = np.repeat(np.arange(n), matches)
+            within = np.arange(len(rows)) - np.repeat(np.cumsum(matches) - matches, matches)
+
+        mem_rate = np.full(len(rows), np.nan)
+        hit = matched[rows]
+        if hit.any():
+            mem_rate[hit] = self.mem_rate[order[starts[position[rows[hit]]] + within[hit]]]
+
+        cells = respondent_cell[rows]
+        sample_count = np.bincount(cells)[cells]
+        weight = mem_rate / sample_count
+        weight[np.isnan(weight)] = 1.0
+
+        merged_df = qualtrics_df[keep_cols].iloc[rows].reset_index(drop=True)
+        for col in merge_cols:
+            merged_df[col] = labels[col].to_numpy(dtype=object)[rows]
+        merged_df['mem_rate'] = mem_rate
+        merged_df['sample_count'] = sample_count
+        merged_df['weight'] = weight
+        return merged_df
+
+
 def calculate_food_nps_with_weighting(
     qualtrics_df: pd.DataFrame,
     population_df: pd.DataFrame,
-    coding_df: Optional[pd.DataFrame] = None
+    coding_df: Optional[pd.DataFrame] = None,
+    population_index: Optional[PopulationIndex] = None
 ) -> Dict[str, Any]:
     """
     Calculate weighted NPS for Korean food delivery service.
 
     Implements the 60-group weighting methodology:
-    1. Merge survey data with population weights
+    1. Look up each respondent's population cell weight (population_index,
+       compiled from population_df if not given)
     2. Calculate weighted NPS using mem_rate
     3. Apply normalization: scale_factor = unweighted_total / weighted_total
     4. Calculate NPS groups (Promoters 9-10, Passives 7-8, Detractors 0-6)
@@ -172,45 +293,26 @@ def calculate_food_nps_with_weighting(
         - detractors_pct: Detractor percentage
         - demographic_breakdown: NPS by segments
         - category_analysis: Response rates by category (if coding provided)
+        - category_matrix: NPS group x category x sub_category response
+          rates for drill-down (if coding provided)
     """
-    # Merge qualtrics with population weights
-    merge_cols = ['gender', 'age_group', 'rgn_nm', 'bmclub']
-
-    # Add division and is_mfo if they exist
-    if 'division' in qualtrics_df.columns and 'division' in population_df.columns:
-        merge_cols.append('division')
-    if 'is_mfo' in qualtrics_df.columns and 'is_mfo' in population_df.columns:
-        # Convert is_mfo to string for consistent merging
-        qualtrics_df['is_mfo'] = qualtrics_df['is_mfo'].astype(str)
-        population_df['is_mfo'] = population_df['is_mfo'].astype(str)
-        merge_cols.append('is_mfo')
-
-    # Normalize whitespace in merge columns to ensure matching
-    # e.g., "20대 이하" (Qualtrics) vs "20대이하" (Population)
-    for col in merge_cols:
-        qualtrics_df[col] = qualtrics_df[col].astype(str).str.replace(" ", "")
-        population_df[col] = population_df[col].astype(str).str.replace(" ", "")
+    compute.report_progress("weighting", 0)
 
-    merged_df = qualtrics_df.merge(
-        population_df[merge_cols + ['mem_rate']],
-        on=merge_cols,
-        how='left'
-    )
+    if population_index is None:
+        population_index = PopulationIndex(population_df)
 
-    # Calculate sample counts per segment
-    segment_counts = merged_df.groupby(merge_cols).size().reset_index(name='sample_count')
-    
-    # Merge sample counts back
-    merged_df = merged_df.merge(segment_counts, on=merge_cols, how='left')
+    # Match on the base demographics, plus division and is_mfo if both sides have them
+    merge_cols = CELL_COLUMNS + [
+        col for col in OPTIONAL_CELL_COLUMNS
+        if col in qualtrics_df.columns and col in population_index.columns
+    ]
 
-    # Calculate weight: Target Proportion (mem_rate) / Sample Count
-    # This ensures the sum of weights for a segment equals its target proportion (mem_rate)
-    merged_df['weight'] = merged_df['mem_rate'] / merged_df['sample_count']
-    
-    # Fill missing weights (if any) with 1.0/count or just 1.0? 
-    # If mem_rate is missing, it means no target. Fallback to 1.0 is risky if mixed.
-    # But let's keep existing fallback logic but adapted
-    merged_df['weight'] = merged_df['weight'].fillna(1.0)
+    # Weight: Target Proportion (mem_rate) / Sample Count, so the weights of a
+    # segment sum to its target proportion; respondents without a population
+    # cell keep weight 1.0. Merge columns are compared without whitespace,
+    # e.g. "20대 이하" (Qualtrics) vs "20대이하" (Population)
+    keep_cols = [col for col in qualtrics_df.columns if col not in merge_cols]
+    merged_df = population_index.weight_respondents(qualtrics_df, merge_cols, keep_cols)
 
     # Calculate normalization factor
     unweighted_total = len(merged_df)
@@ -253,15 +355,24 @@ def calculate_food_nps_with_weighting(
     deff = 1 + cv**2
     n_eff = len(weights) / deff if deff > 0 else 0
 
+    # Per-segment totals, shared by the breakdown and the weighting report
+    compute.report_progress("segmenting", 30)
+    cells = aggregate_cells(merged_df, merge_cols)
+    cell_keys = list(zip(*(cells[col].tolist() for col in merge_cols)))
+    cell_counts = cells['count'].to_numpy()
+    cell_weights = cells['weight'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cell_nps = (cells['promoter_weight'].to_numpy() / cell_weights * 100) - (cells['detractor_weight'].to_numpy() / cell_weights * 100)
+
     # Demographic breakdown
     demographic_breakdown = []
-    for segment_cols_values, group in merged_df.groupby(merge_cols):
+    for i, segment_cols_values in enumerate(cell_keys):
         segment_dict = dict(zip(merge_cols, segment_cols_values))
-        segment_nps = calculate_segment_nps(group)
+        segment_nps = cell_nps[i] if cell_weights[i] != 0 else 0.0
         segment_dict.update({
             'nps': round(segment_nps, 2),
-            'count': len(group),
-            'weight': round(group['normalized_weight'].sum(), 2)
+            'count': int(cell_counts[i]),
+            'weight': round(cell_weights[i], 2)
         })
         demographic_breakdown.append(segment_dict)
 
@@ -282,24 +393,21 @@ def calculate_food_nps_with_weighting(
     }
 
     # Generate Weighting Report (Detailed Table)
+    compute.report_progress("report", 60)
     weighting_report = []
     total_responses = len(merged_df)
-    
-    # Group by segment to get unique segments with their stats
-    # Note: merged_df has one row per respondent. We need one row per segment.
-    # We can use the 'demographic_breakdown' loop logic but we need specific columns.
-    
-    for segment_cols_values, group in merged_df.groupby(merge_cols):
+    cell_mem_rates = cells['mem_rate'].to_numpy()
+    cell_applied_weights = cells['applied_weight'].to_numpy()
+
+    for i, segment_cols_values in enumerate(cell_keys):
         segment_dict = dict(zip(merge_cols, segment_cols_values))
-        
-        # All rows in group have same sample_count, mem_rate, normalized_weight (approx)
-        # Take the first row's values
-        first_row = group.iloc[0]
-        
-        sample_count = len(group)
+
+        # All rows in a segment have the same mem_rate and normalized_weight;
+        # the table carries its first row's values
+        sample_count = int(cell_counts[i])
         sample_proportion = sample_count / total_responses if total_responses > 0 else 0
-        mem_rate = first_row['mem_rate'] if pd.notna(first_row['mem_rate']) else 0
-        weight = first_row['normalized_weight']
+        mem_rate = cell_mem_rates[i] if pd.notna(cell_mem_rates[i]) else 0
+        weight = cell_applied_weights[i]
         
         segment_dict.update({
             'sample_count': sample_count,
@@ -314,65 +422,195 @@ def calculate_food_nps_with_weighting(
 
     # Add category analysis if coding data provided
     if coding_df is not None:
-        category_analysis = calculate_category_response_rates(
-            merged_df, coding_df
-        )
-        result['category_analysis'] = category_analysis
+        compute.report_progress("categories", 80)
+        matrix = category_matrix(merged_df, coding_df)
+        result['category_analysis'] = calculate_category_response_rates(merged_df, coding_df, matrix)
+        result['category_matrix'] = format_category_matrix(matrix)
 
     return result
 
 
-def calculate_segment_nps(segment_df: pd.DataFrame) -> float:
-    """Calculate NPS for a demographic segment."""
-    total_weight = segment_df['normalized_weight'].sum()
-    if total_weight == 0:
-        return 0.0
+@metrics.timed("nps")
+def aggregate_cells(merged_df: pd.DataFrame, merge_cols: List[str]) -> pd.DataFrame:
+    """
+    One row per segment (distinct merge_cols values, in groupby order) with
+    its respondent count, normalized weight sum, promoter and detractor
+    weight, and the mem_rate and normalized weight of its first row.
+
+    Computed in one pass over integer segment codes, so callers build
+    per-segment reports in time proportional to the number of segments.
+    """
+    # Codes sorted per column and combined in column order follow the
+    # lexicographic order of the value tuples, like groupby(sort=True)
+    cell = np.zeros(len(merged_df), dtype=np.int64)
+    for col in merge_cols:
+        codes, uniques = pd.factorize(merged_df[col], sort=True)
+        cell = np.unique(cell * len(uniques) + codes, return_inverse=True)[1].reshape(-1)
+
+    _, first = np.unique(cell, return_index=True)
+    n_cells = len(first)
+    weights = merged_df['normalized_weight'].to_numpy(dtype=np.float64)
+    nps_group = merged_df['nps_group'].to_numpy()
+
+    table = pd.DataFrame({col: merged_df[col].to_numpy()[first] for col in merge_cols})
+    table['count'] = np.bincount(cell, minlength=n_cells)
+    table['weight'] = np.bincount(cell, weights=weights, minlength=n_cells)
+    table['promoter_weight'] = np.bincount(cell, weights=np.where(nps_group == 'Promoter', weights, 0.0), minlength=n_cells)
+    table['detractor_weight'] = np.bincount(cell, weights=np.where(nps_group == 'Detractor', weights, 0.0), minlength=n_cells)
+    table['mem_rate'] = merged_df['mem_rate'].to_numpy(dtype=np.float64, na_value=np.nan)[first]
+    table['applied_weight'] = weights[first]
+    return table
+
+
+@metrics.timed("category_stats")
+def category_matrix(merged_df: pd.DataFrame, coding_df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Weighted NPS group x category x sub_category incidence, in one pass.
+
+    A respondent counts once per category (and once per sub_category) no
+    matter how many coded mentions they have. The base of each NPS group is
+    all its respondents, coded or not.
 
-    promoters_weight = segment_df[segment_df['nps_group'] == 'Promoter']['normalized_weight'].sum()
-    detractors_weight = segment_df[segment_df['nps_group'] == 'Detractor']['normalized_weight'].sum()
+    Returns numpy arrays indexed [group, category] and [group, sub_category
+    pair], with categories sorted by name and sub_category pairs sorted by
+    (category, sub_category); see format_category_matrix for the JSON form.
+    """
+    weights = merged_df['normalized_weight'].to_numpy(dtype=np.float64)
+    nps_group = merged_df['nps_group'].to_numpy()
+    group = np.full(len(merged_df), -1, dtype=np.int64)
+    for g, name in enumerate(NPS_GROUPS):
+        group[nps_group == name] = g
+    in_group = group >= 0
+    n_groups = len(NPS_GROUPS)
+
+    # Respondent rows and coded mentions share ID codes
+    id_codes = pd.factorize(pd.concat([merged_df['ResponseId'], coding_df['ResponseId']], ignore_index=True))[0]
+    row_ids, mention_ids = id_codes[:len(merged_df)], id_codes[len(merged_df):]
+
+    category_codes, categories = pd.factorize(coding_df['category'], sort=True)
+    if 'sub_category' in coding_df.columns:
+        sub_codes, sub_labels = pd.factorize(coding_df['sub_category'], sort=True)
+    else:
+        sub_codes, sub_labels = np.full(len(coding_df), -1, dtype=np.int64), pd.Index([])
+
+    # (category, sub_category) pairs that occur, sorted by category then sub_category
+    has_sub = (category_codes >= 0) & (sub_codes >= 0)
+    pair_keys = category_codes * max(len(sub_labels), 1) + sub_codes
+    pairs, pair_codes = np.unique(pair_keys[has_sub], return_inverse=True)
+    mention_pair = np.full(len(coding_df), -1, dtype=np.int64)
+    mention_pair[has_sub] = pair_codes.reshape(-1)
+    pair_category = pairs // max(len(sub_labels), 1)
+    pair_sub = pairs % max(len(sub_labels), 1)
+
+    # Every (respondent row, mention) with the same ID; integer join only
+    coded = category_codes >= 0
+    links = pd.DataFrame({'id': row_ids[in_group], 'row': np.flatnonzero(in_group)}).merge(
+        pd.DataFrame({'id': mention_ids[coded], 'category': category_codes[coded], 'pair': mention_pair[coded]}),
+        on='id'
+    )
+    link_rows = links['row'].to_numpy()
+
+    def incidence(codes: np.ndarray, n_codes: int):
+        """Respondent counts and weights per [group, code], one per respondent and code."""
+        selected = codes >= 0
+        keys = np.unique(link_rows[selected] * max(n_codes, 1) + codes[selected])
+        rows, codes = keys // max(n_codes, 1), keys % max(n_codes, 1)
+        cells = group[rows] * n_codes + codes
+        size = n_groups * n_codes
+        counts = np.bincount(cells, minlength=size).reshape(n_groups, n_codes)
+        sums = np.bincount(cells, weights=weights[rows], minlength=size).reshape(n_groups, n_codes)
+        return counts, sums
+
+    category_count, category_weight = incidence(links['category'].to_numpy(), len(categories))
+    pair_count, pair_weight = incidence(links['pair'].to_numpy(), len(pairs))
+
+    base_count = np.bincount(group[in_group], minlength=n_groups)
+    base_weight = np.bincount(group[in_group], weights=weights[in_group], minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        category_rate = np.where(base_weight[:, None] > 0, category_weight / base_weight[:, None] * 100, 0.0)
+        pair_rate = np.where(base_weight[:, None] > 0, pair_weight / base_weight[:, None] * 100, 0.0)
+
+    return {
+        'categories': categories,
+        'sub_categories': sub_labels,
+        'pair_category': pair_category,
+        'pair_sub': pair_sub,
+        'base_count': base_count,
+        'base_weight': base_weight,
+        'category_count': category_count,
+        'category_weight': category_weight,
+        'category_rate': category_rate,
+        'pair_count': pair_count,
+        'pair_weight': pair_weight,
+        'pair_rate': pair_rate
+    }
 
-    promoters_pct = (promoters_weight / total_weight * 100)
-    detractors_pct = (detractors_weight / total_weight * 100)
 
-    return promoters_pct - detractors_pct
+def format_category_matrix(matrix: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON form of a category_matrix: label lists plus nested arrays indexed
+    [group][category] and [group][category][sub_category], where the
+    sub_categories of category c are listed in sub_categories[c].
+    """
+    n_categories = len(matrix['categories'])
+    # Pair columns grouped by category (pairs are sorted by category)
+    pair_bounds = np.searchsorted(matrix['pair_category'], np.arange(n_categories + 1))
+
+    def by_category(values: np.ndarray, decimals: Optional[int]) -> list:
+        if decimals is not None:
+            values = np.round(values, decimals)
+        return [
+            [values[g, pair_bounds[c]:pair_bounds[c + 1]].tolist() for c in range(n_categories)]
+            for g in range(len(NPS_GROUPS))
+        ]
+
+    sub_labels = np.asarray(matrix['sub_categories'], dtype=object)
+    return {
+        'groups': list(NPS_GROUPS),
+        'categories': matrix['categories'].tolist(),
+        'sub_categories': [
+            sub_labels[matrix['pair_sub'][pair_bounds[c]:pair_bounds[c + 1]]].tolist()
+            for c in range(n_categories)
+        ],
+        'base_count': matrix['base_count'].tolist(),
+        'base_weight': np.round(matrix['base_weight'], 2).tolist(),
+        'category_count': matrix['category_count'].tolist(),
+        'category_weight': np.round(matrix['category_weight'], 2).tolist(),
+        'category_rate': np.round(matrix['category_rate'], 2).tolist(),
+        'sub_category_count': by_category(matrix['pair_count'], None),
+        'sub_category_weight': by_category(matrix['pair_weight'], 2),
+        'sub_category_rate': by_category(matrix['pair_rate'], 2)
+    }
 
 
 def calculate_category_response_rates(
     merged_df: pd.DataFrame,
-    coding_df: pd.DataFrame
+    coding_df: pd.DataFrame,
+    matrix: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Calculate response rates by category for each NPS group.
 
-    Returns category distribution across Promoters, Passives, Detractors.
+    Returns category distribution across Promoters, Passives, Detractors:
+    the share of each group's (weighted) respondents mentioning a category,
+    highest first. matrix is the category_matrix of the same data, if
+    already computed.
     """
-    # Merge with coding data
-    analysis_df = merged_df.merge(
-        coding_df[['ResponseId', 'category', 'sub_category']],
-        on='ResponseId',
-        how='left'
-    )
+    if matrix is None:
+        matrix = category_matrix(merged_df, coding_df)
 
-    # Calculate overall category distribution
     category_counts = {}
-
-    for nps_group in ['Promoter', 'Passive', 'Detractor']:
-        group_df = analysis_df[analysis_df['nps_group'] == nps_group]
-        total_weight = group_df['normalized_weight'].sum()
-
+    for g, nps_group in enumerate(NPS_GROUPS):
         category_stats = []
-        for category, cat_group in group_df.groupby('category'):
-            if pd.isna(category):
+        for c, category in enumerate(matrix['categories'].tolist()):
+            count = matrix['category_count'][g, c]
+            if count == 0:
                 continue
-
-            cat_weight = cat_group['normalized_weight'].sum()
-            response_rate = (cat_weight / total_weight * 100) if total_weight > 0 else 0
-
             category_stats.append({
                 'category': category,
-                'count': len(cat_group),
-                'weight': round(cat_weight, 2),
-                'response_rate': round(response_rate, 2)
+                'count': int(count),
+                'weight': round(matrix['category_weight'][g, c], 2),
+                'response_rate': round(matrix['category_rate'][g, c], 2)
             })
 
         category_counts[nps_group] = sorted(
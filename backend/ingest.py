@@ -0,0 +1,211 @@
+"""
+Streaming ingest for uploaded files.
+
+Uploads are spooled to a temporary file in fixed-size chunks (hashing as
+they go) instead of being read into memory in one piece, and CSVs are then
+parsed in row chunks with integer columns downcast per chunk. Peak memory
+stays close to the size of the parsed DataFrame rather than several times
+the raw file.
+"""
+
+import codecs
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import chardet
+import pandas as pd
+from typing import Optional, Tuple, Union
+from fastapi import UploadFile
+
+# Bytes read from the upload per chunk while spooling
+SPOOL_CHUNK_BYTES = 1 << 20
+# Rows parsed per chunk from CSV files
+CSV_CHUNK_ROWS = 200_000
+# Bytes inspected when sniffing a file's encoding
+ENCODING_SAMPLE_BYTES = 1 << 20
+# Detected encodings remembered per file hash
+ENCODING_CACHE_SIZE = 256
+
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+_encoding_cache: "OrderedDict[str, str]" = OrderedDict()
+_encoding_cache_lock = threading.Lock()
+
+Source = Union[bytes, str, os.PathLike]
+
+
+class SpooledUpload:
+    """An upload copied to a temporary file on disk. Use as a context manager."""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+    def sniff_encoding(self) -> Tuple[Optional[str], float]:
+        """(encoding, detection ms) for CSV uploads; (None, 0.0) for Excel files."""
+        if not self.filename or not self.filename.lower().endswith('.csv'):
+            return None, 0.0
+        return sniff_encoding(self.path, self.sha256)
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def spool_upload(file: UploadFile) -> SpooledUpload:
+    """Copies an upload to a temporary file chunk by chunk, computing its sha256."""
+    suffix = os.path.splitext(file.filename or "")[1]
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, path = tempfile.mkstemp(prefix="nps_upload_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return SpooledUpload(path, file.filename, size, digest.hexdigest())
+
+
+def open_source(source: Source):
+    """Returns something pandas can read: a path as-is, bytes wrapped in a buffer."""
+    if isinstance(source, (bytes, bytearray)):
+        from io import BytesIO
+        return BytesIO(source)
+    return source
+
+
+def _read_sample(source: Source, size: int) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source[:size])
+    with open(source, 'rb') as f:
+        return f.read(size)
+
+
+def _decodes(sample: bytes, encoding: str) -> bool:
+    """Strict decode of a sample; a multi-byte character cut off at the end is allowed."""
+    try:
+        codecs.getincrementaldecoder(encoding)(errors='strict').decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _sniff(sample: bytes) -> str:
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    # utf-8-sig also reads plain UTF-8 and matches the previous loader default
+    if _decodes(sample, 'utf-8'):
+        return 'utf-8-sig'
+    # cp949 is the Windows superset of euc-kr used by Korean Excel exports
+    if _decodes(sample, 'cp949'):
+        return 'cp949'
+    return chardet.detect(sample)['encoding'] or 'utf-8'
+
+
+def sniff_encoding(source: Source, file_hash: Optional[str] = None) -> Tuple[str, float]:
+    """
+    Detects the text encoding of a file from a bounded sample: BOM first, then a
+    strict UTF-8 decode, then cp949, and chardet on the sample as a last resort.
+    Results are cached per file hash.
+
+    Returns:
+        (encoding, detection time in milliseconds)
+    """
+    start = time.perf_counter()
+
+    if file_hash is None and isinstance(source, (bytes, bytearray)):
+        file_hash = hashlib.sha256(source).hexdigest()
+
+    with _encoding_cache_lock:
+        encoding = _encoding_cache.get(file_hash) if file_hash else None
+        if encoding:
+            _encoding_cache.move_to_end(file_hash)
+
+    if encoding is None:
+        encoding = _sniff(_read_sample(source, ENCODING_SAMPLE_BYTES))
+        if file_hash:
+            with _encoding_cache_lock:
+                _encoding_cache[file_hash] = encoding
+                while len(_encoding_cache) > ENCODING_CACHE_SIZE:
+                    _encoding_cache.popitem(last=False)
+
+    return encoding, round((time.perf_counter() - start) * 1000, 2)
+
+
+def detect_encoding_full(source: Source) -> str:
+    """Runs chardet over the whole file in chunks; used when a sniffed encoding fails."""
+    detector = chardet.UniversalDetector()
+    if isinstance(source, (bytes, bytearray)):
+        detector.feed(bytes(source))
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(SPOOL_CHUNK_BYTES), b''):
+                detector.feed(chunk)
+                if detector.done:
+                    break
+    return detector.close()['encoding'] or 'utf-8'
+
+
+def read_text_csv(source: Source, encoding: Optional[str] = None) -> pd.DataFrame:
+    """
+    Reads a CSV whose encoding is unknown or sniffed from a sample. If the
+    sample-based guess turns out wrong further into the file, the encoding
+    is re-detected over the whole file.
+    """
+    if encoding is None:
+        encoding, _ = sniff_encoding(source)
+    try:
+        return read_csv_chunked(source, encoding=encoding)
+    except UnicodeDecodeError:
+        return read_csv_chunked(source, encoding=detect_encoding_full(source))
+
+
+def downcast_integers(df: pd.DataFrame) -> pd.DataFrame:
+    """Shrinks int64 columns to the smallest integer type that holds their values."""
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col].dtype) and df[col].dtype.itemsize > 1:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def read_csv_chunked(source: Source, encoding: Optional[str] = None, chunk_rows: int = CSV_CHUNK_ROWS) -> pd.DataFrame:
+    """Parses a CSV in row chunks, downcasting each chunk before the next one is read."""
+    chunks = []
+    with pd.read_csv(open_source(source), encoding=encoding, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunks.append(downcast_integers(chunk))
+
+    if not chunks:
+        return pd.read_csv(open_source(source), encoding=encoding)
+    if len(chunks) == 1:
+        return chunks[0]
+
+    # Chunks downcast to different widths are widened to the largest by concat
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,191 @@
+"""
+Background jobs for long analyses.
+
+A response-rate or Food NPS analysis on full-wave data can run for minutes,
+longer than a client should hold one request open. POST /jobs starts the
+same work on the compute pool and returns a job id straight away; the client
+then follows GET /jobs/{id} (or its event stream) for the stage and percent
+reported by the analysis, and fetches the result once the job has finished.
+
+Jobs live in memory only. Finished jobs are kept, newest first, up to
+settings.JOB_HISTORY; running jobs are never dropped. A job belongs to the
+session that started it (see sessions.py) and is not visible to others.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, List, Optional
+from fastapi import HTTPException
+import compute
+import sessions
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# How often an event stream checks its job for changes
+EVENT_POLL_S = 0.2
+# Seconds between keep-alive comments on an event stream without changes
+EVENT_KEEPALIVE_S = 15.0
+
+
+class Job:
+    def __init__(self, kind: str, session: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.session = session
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.progress = 0.0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[dict] = None  # {"status_code", "detail"} of a failed job
+        self.future: Optional[Future] = None
+        self.cancel_event: Optional[threading.Event] = None
+
+    def snapshot(self) -> dict:
+        """Public state of the job (everything but its result)."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 1),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+
+class JobManager:
+    def __init__(self, max_finished: int):
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable[..., Any], *args, **kwargs) -> Job:
+        """Starts func(*args, **kwargs) as a background job of the given kind."""
+        job = Job(kind, sessions.current_id())
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+
+        def progress(stage: str, percent: float):
+            with self._lock:
+                if job.status == RUNNING:
+                    job.stage = stage
+                    # Stages run concurrently in places; never move backwards
+                    job.progress = max(job.progress, min(float(percent), 100.0))
+
+        def run():
+            with self._lock:
+                if job.status != QUEUED:
+                    return None
+                job.status = RUNNING
+                job.started_at = time.time()
+            return func(*args, **kwargs)
+
+        job.future, job.cancel_event = compute.submit(run, progress=progress)
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def _finish(self, job: Job, future: Future):
+        try:
+            result = future.result()
+            outcome = (SUCCEEDED, result, None)
+        except compute.Cancelled:
+            outcome = (CANCELLED, None, None)
+        except HTTPException as e:
+            outcome = (FAILED, None, {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            outcome = (FAILED, None, {"status_code": 500, "detail": f"Analysis error: {str(e)}"})
+
+        with self._lock:
+            if job.status == CANCELLED:
+                return
+            job.status, job.result, job.error = outcome
+            job.stage = job.status
+            if job.status == SUCCEEDED:
+                job.progress = 100.0
+            job.finished_at = time.time()
+            self._trim()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.session != sessions.current_id():
+            raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+        return job
+
+    def status(self, job_id: str) -> dict:
+        job = self.get(job_id)
+        with self._lock:
+            return job.snapshot()
+
+    def list(self, session: Optional[str] = None) -> List[dict]:
+        """Jobs of the given session (all sessions if None), newest first."""
+        with self._lock:
+            return [job.snapshot() for job in reversed(self._jobs.values()) if session is None or job.session == session]
+
+    def result(self, job_id: str) -> Any:
+        """The job's result; raises its error if it failed, 409 if it has not succeeded."""
+        job = self.get(job_id)
+        with self._lock:
+            status, result, error = job.status, job.result, job.error
+        if status == SUCCEEDED:
+            return result
+        if status == FAILED:
+            raise HTTPException(status_code=error["status_code"], detail=error["detail"])
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {status}")
+
+    def cancel(self, job_id: str) -> dict:
+        """Cancels a queued or running job; a finished job is left as is."""
+        job = self.get(job_id)
+        with self._lock:
+            if job.status not in FINISHED:
+                job.cancel_event.set()
+                job.status = CANCELLED
+                job.stage = CANCELLED
+                job.finished_at = time.time()
+                self._trim()
+            return job.snapshot()
+
+    async def events(self, job_id: str) -> AsyncIterator[str]:
+        """
+        Server-sent events for a job: its snapshot whenever it changes, ending
+        after the snapshot that shows it finished.
+        """
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            try:
+                snapshot = self.status(job_id)
+            except HTTPException:
+                return  # dropped from the history
+            if snapshot != last:
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                last = snapshot
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > EVENT_KEEPALIVE_S:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            if snapshot["status"] in FINISHED:
+                return
+            await asyncio.sleep(EVENT_POLL_S)
@@ -0,0 +1,123 @@
+"""
+Lifetime of a long-running backend.
+
+The Electron launcher leaves the backend running when the app quits and
+reconnects to it on the next launch (see frontend/electron/main.cjs), so
+the backend has to end itself once nobody uses it: server.serve() stops
+uvicorn after settings.IDLE_SHUTDOWN_S without requests or running work,
+or when POST /shutdown asks it to (the launcher replacing a backend of
+another app version).
+
+A backend left running could be any process listening on the port, so the
+launcher gives each backend it spawns a secret (settings.LAUNCH_TOKEN).
+Before reusing one, it sends a random challenge to /health and checks the
+answer against launch_proof(); /shutdown requires the token itself. Any
+page in a browser can reach the port, so /health only reveals the data
+directory and pid alongside a valid proof (health()).
+
+Kept free of heavy imports: server.py imports it before main has loaded.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Optional
+import settings
+
+# How often the watcher checks for idleness and shutdown requests
+WATCH_INTERVAL_S = 1.0
+
+_lock = threading.Lock()
+_last_activity = time.monotonic()
+_busy = 0
+_shutdown = threading.Event()
+_watching = False
+
+
+def touch():
+    """Records activity (a request arriving or finishing)."""
+    global _last_activity
+    with _lock:
+        _last_activity = time.monotonic()
+
+
+def begin():
+    """Marks work in flight; the backend does not go idle until the matching end()."""
+    global _busy
+    with _lock:
+        _busy += 1
+
+
+def end():
+    global _busy, _last_activity
+    with _lock:
+        _busy = max(0, _busy - 1)
+        _last_activity = time.monotonic()
+
+
+def idle_seconds() -> float:
+    """Seconds since the last activity, or 0 while work is in flight."""
+    with _lock:
+        return 0.0 if _busy else time.monotonic() - _last_activity
+
+
+def request_shutdown() -> bool:
+    """Asks the server to stop; False if it was not started by server.serve()."""
+    _shutdown.set()
+    return _watching
+
+
+def watch(server, idle_timeout_s: float, log=print):
+    """
+    Sets server.should_exit (a uvicorn.Server) on request_shutdown(), or
+    once idle for idle_timeout_s seconds (never if 0).
+    """
+    global _watching
+    _watching = True
+
+    def run():
+        while not server.should_exit:
+            if _shutdown.wait(WATCH_INTERVAL_S):
+                log("Shutdown requested")
+                break
+            idle = idle_seconds()
+            if idle_timeout_s > 0 and idle >= idle_timeout_s:
+                log(f"Idle for {idle:.0f}s, shutting down")
+                break
+        server.should_exit = True
+
+    threading.Thread(target=run, name="lifecycle", daemon=True).start()
+
+
+def launch_proof(challenge: Optional[str]) -> Optional[str]:
+    """HMAC-SHA256 (hex) of challenge keyed with the launch token; None without either."""
+    if not challenge or not settings.LAUNCH_TOKEN:
+        return None
+    return hmac.new(settings.LAUNCH_TOKEN.encode(), challenge.encode(), hashlib.sha256).hexdigest()
+
+
+def launch_token_matches(token: Optional[str]) -> bool:
+    """Whether token is this backend's launch token (any token if it was started by hand)."""
+    if not settings.LAUNCH_TOKEN:
+        return True
+    return bool(token) and hmac.compare_digest(token, settings.LAUNCH_TOKEN)
+
+
+def health(ready: bool, challenge: Optional[str]) -> dict:
+    """
+    The /health answer. service, app_version and launch_proof let the
+    launcher decide whether to reuse this backend; data_dir and pid are only
+    included when the challenge was answered, i.e. for the launcher.
+    """
+    answer = {
+        "status": "ok",
+        "ready": ready,
+        "service": settings.SERVICE_NAME,
+        "app_version": settings.APP_VERSION,
+    }
+    proof = launch_proof(challenge)
+    if proof is not None:
+        answer.update(data_dir=settings.DATA_DIR, pid=os.getpid(), launch_proof=proof)
+    return answer
@@ -1,94 +1,276 @@
-import sys
-print("DEBUG: Starting main.py imports...", flush=True)
-from fastapi import FastAPI, UploadFile, File, HTTPException
-print("DEBUG: Imported fastapi", flush=True)
+import time
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import pandas as pd
-print("DEBUG: Imported pandas", flush=True)
+import numpy as np
 import data_processing
-print("DEBUG: Imported data_processing", flush=True)
 import weighting
-print("DEBUG: Imported weighting", flush=True)
-from weighting import WeightingConfig, assess_weight_risk
+from weighting import WeightingConfig
+import scales
 import analysis
-print("DEBUG: Imported analysis", flush=True)
 import food_nps
-print("DEBUG: Imported food_nps", flush=True)
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 import io
+import settings
+import ingest
+from result_cache import ResultCache
+from respondent_index import RespondentIndex, Segment
+import subset_weighting
+import compute
+import jobs
+import serialization
+import exports
+import metrics
+import profiling
+import sessions
+import lifecycle
 
-app = FastAPI(title="NPS Analysis Tool")
+app = FastAPI(title="NPS Analysis Tool", default_response_class=serialization.DefaultResponse)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-# In-memory storage
-data_store = {
-    "qualtrics": None,
-    "population": None,
-    "coding": None,
-    "merged": None,
-    # Food NPS specific storage
-    "food_qualtrics": None,
-    "food_population": None,
-    "food_coding": None
-}
+metrics.start_memory_tracing()
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """
+    Records each request's latency under its route, and adds a Server-Timing
+    header with the stages it ran when settings.SERVER_TIMING is on or the
+    request asks with ?timing=1.
+    """
+    start = time.perf_counter()
+    with metrics.collect_request_timings() as timings:
+        try:
+            response = await call_next(request)
+        except Exception:
+            route = request.scope.get("route")
+            metrics.registry.observe_request(request.method, route.path if route else "unmatched", time.perf_counter() - start, True)
+            raise
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.registry.observe_request(request.method, route.path if route else "unmatched", elapsed, response.status_code >= 500)
+    if settings.SERVER_TIMING or request.query_params.get("timing") == "1":
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    return response
+
+# Requests never profiled: cheap status endpoints and the profiler's own
+PROFILE_EXCLUDED_PATHS = ("/health", "/metrics", "/cache/stats", "/debug/profiles")
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """
+    Samples the request while it runs (see profiling.py) and saves the
+    profile if it was asked for (?profile=1 or settings.PROFILE_REQUESTS) or
+    the request, including streaming its body, took over settings.PROFILE_SLOW_MS.
+    """
+    forced = settings.PROFILE_REQUESTS or request.query_params.get("profile") == "1"
+    if not (forced or profiling.enabled()) or request.url.path.startswith(PROFILE_EXCLUDED_PATHS):
+        return await call_next(request)
+
+    session = profiling.start(f"{request.method} {request.url.path}")
+    start = time.perf_counter()
+
+    def finish(save: bool):
+        profiling.stop(session)
+        elapsed = time.perf_counter() - start
+        if save and (forced or 1000 * elapsed >= settings.PROFILE_SLOW_MS > 0):
+            name = profiling.save(session, elapsed)
+            if name:
+                print(f"Saved profile of {session.label} ({1000 * elapsed:.0f} ms): {name}", flush=True)
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish(True)
+        raise
+    route = request.scope.get("route")
+    if route is not None:
+        session.label = f"{request.method} {route.path}"
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        # Event streams stay open for as long as their job runs
+        finish(False)
+        return response
+
+    body = response.body_iterator
+
+    async def profiled_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finish(True)
+
+    response.body_iterator = profiled_body()
+    return response
+
+@app.middleware("http")
+async def bind_session(request: Request, call_next):
+    """
+    Runs the request in the session named by its X-NPS-Session header or
+    ?session= parameter (see sessions.py), and records it as activity so an
+    idle backend can shut down (see lifecycle.py).
+    """
+    session_id = request.headers.get(sessions.SESSION_HEADER) or request.query_params.get(sessions.SESSION_PARAM) or sessions.DEFAULT_SESSION
+    if not sessions.valid_id(session_id):
+        return JSONResponse({"detail": f"Invalid session id '{session_id}'"}, status_code=400)
+    sessions.activate(session_id)
+    session_registry.touch(session_id)
+    lifecycle.touch()
+    try:
+        return await call_next(request)
+    finally:
+        lifecycle.touch()
+
+# Dataset storage: qualtrics, population, coding, merged and food_* datasets,
+# one store per session, persisted under settings.DATA_DIR so they survive
+# backend restarts; each session keeps at most settings.SESSION_MEMORY_MB in
+# memory, and at most settings.MAX_SESSIONS sessions are open at once
+session_registry = sessions.SessionRegistry(
+    settings.DATA_DIR,
+    persist=settings.PERSIST_DATASETS,
+    memory_budget=settings.SESSION_MEMORY_MB * 1024 * 1024,
+    max_sessions=settings.MAX_SESSIONS
+)
+
+# The datasets of the session of the request being handled
+data_store = sessions.CurrentSessionStore(session_registry)
+
+# Analysis results keyed on request fingerprint + dataset versions
+result_cache = ResultCache(settings.RESULT_CACHE_MB * 1024 * 1024)
+
+# Background analyses started through POST /jobs
+job_manager = jobs.JobManager(settings.JOB_HISTORY)
+
+def storage_report(*names: str) -> dict:
+    """The current session's memory use, and whether the given datasets are in memory."""
+    return {"session": sessions.current_id(), **data_store.memory_stats(), "datasets": data_store.residency(list(names))}
+
+def dataset_versions(*names: str) -> Dict[str, Optional[str]]:
+    return {sessions.qualified(name): data_store.version(name) for name in names}
+
+# Datasets analysed by /analyze, whose labelled scale columns are pre-coded
+SCALED_DATASETS = ("qualtrics", "merged")
+
+def store_datasets(datasets: Dict[str, Optional[pd.DataFrame]]):
+    """Replaces datasets (with scale codes where analysed) and drops cached results that read them."""
+    entries = dict(datasets)
+    meta = {}
+    encoded = {}  # id(df) -> (codes, mappings), so an aliased frame is encoded once
+    for name, df in datasets.items():
+        if name not in SCALED_DATASETS:
+            continue
+        if df is not None and id(df) not in encoded:
+            encoded[id(df)] = scales.encode_scales(df)
+        codes, mappings = encoded[id(df)] if df is not None else (None, {})
+        entries[scales.codes_name(name)] = codes if mappings else None
+        if mappings:
+            meta[scales.codes_name(name)] = {"mappings": mappings}
+
+    with metrics.stage("store", rows=max((len(df) for df in datasets.values() if df is not None), default=0)):
+        data_store.update(entries, meta)
+    for name in datasets:
+        result_cache.invalidate(sessions.qualified(name))
+
+def store_dataset(name: str, df: Optional[pd.DataFrame]):
+    """Replaces a dataset and drops cached results that read it."""
+    store_datasets({name: df})
+
+def load_analysis_data():
+    """Qualtrics data (falling back to merged) together with its scale codes."""
+    for name in ("qualtrics", "merged"):
+        df = data_store[name]
+        if df is not None:
+            return df, data_store[scales.codes_name(name)]
+    raise HTTPException(status_code=400, detail="No data uploaded")
 
 @app.post("/reset")
 async def reset_data():
-    global data_store
-    data_store = {
-        "qualtrics": None,
-        "population": None,
-        "coding": None,
-        "merged": None,
-        "food_qualtrics": None,
-        "food_population": None,
-        "food_coding": None
-    }
+    """Removes the current session's datasets and cached results; other sessions keep theirs."""
+    for name in data_store.names():
+        result_cache.invalidate(sessions.qualified(name))
+    data_store.clear()
     return {"message": "Data store reset successfully"}
 
+@app.get("/sessions")
+async def list_sessions():
+    """The caller's own session; other sessions' ids are not disclosed."""
+    return {"current": sessions.current_id(), "session": session_registry.describe(sessions.current_id())}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Removes the caller's own session's datasets and cached results."""
+    # Other sessions answer 404 like unknown ones, so ids cannot be probed
+    if session_id != sessions.current_id() or not session_registry.exists(session_id):
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+    for name in session_registry.store(session_id).names():
+        result_cache.invalidate(sessions.qualified(name, session_id))
+    session_registry.drop(session_id)
+    return {"message": f"Session '{session_id}' removed"}
+
 @app.post("/upload/qualtrics")
-async def upload_qualtrics(file: UploadFile = File(...)):
-    content = await file.read()
+async def upload_qualtrics(http_request: Request, file: UploadFile = File(...)):
+    upload = await ingest.spool_upload(file)
+    try:
+        return await compute.run(http_request, store_qualtrics_upload, upload)
+    finally:
+        upload.close()
+
+def store_qualtrics_upload(upload: ingest.SpooledUpload):
     try:
-        df = data_processing.load_qualtrics_data(content, file.filename)
-        data_store["qualtrics"] = df
+        encoding, detection_ms = upload.sniff_encoding()
+        df = data_processing.load_qualtrics_data(upload.path, upload.filename, encoding)
         # If coding is already there, merge
         if data_store["coding"] is not None:
-             data_store["merged"] = data_processing.merge_data(df, data_store["coding"])
+             merged = data_processing.merge_data(df, data_store["coding"])
         else:
-             data_store["merged"] = df
-        return {"message": "Qualtrics data uploaded", "columns": df.columns.tolist(), "rows": len(df)}
+             merged = df
+        store_datasets({"qualtrics": df, "merged": merged})
+        return {"message": "Qualtrics data uploaded", "columns": df.columns.tolist(), "rows": len(df), "encoding": encoding, "encoding_detection_ms": detection_ms}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/upload/population")
-async def upload_population(file: UploadFile = File(...)):
-    content = await file.read()
+async def upload_population(http_request: Request, file: UploadFile = File(...)):
+    upload = await ingest.spool_upload(file)
+    try:
+        return await compute.run(http_request, store_population_upload, upload)
+    finally:
+        upload.close()
+
+def store_population_upload(upload: ingest.SpooledUpload):
     try:
-        df = data_processing.load_file(content, file.filename)
-        data_store["population"] = df
-        return {"message": "Population data uploaded", "columns": df.columns.tolist(), "rows": len(df)}
+        encoding, detection_ms = upload.sniff_encoding()
+        df = data_processing.load_file(upload.path, upload.filename, encoding)
+        store_dataset("population", df)
+        return {"message": "Population data uploaded", "columns": df.columns.tolist(), "rows": len(df), "encoding": encoding, "encoding_detection_ms": detection_ms}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/upload/coding")
-async def upload_coding(file: UploadFile = File(...)):
-    content = await file.read()
+async def upload_coding(http_request: Request, file: UploadFile = File(...)):
+    upload = await ingest.spool_upload(file)
+    try:
+        return await compute.run(http_request, store_coding_upload, upload)
+    finally:
+        upload.close()
+
+def store_coding_upload(upload: ingest.SpooledUpload):
     try:
-        df = data_processing.load_file(content, file.filename)
-        data_store["coding"] = df
+        encoding, detection_ms = upload.sniff_encoding()
+        df = data_processing.load_file(upload.path, upload.filename, encoding)
+        store_dataset("coding", df)
         if data_store["qualtrics"] is not None:
-             data_store["merged"] = data_processing.merge_data(data_store["qualtrics"], df)
-        return {"message": "Coding data uploaded", "columns": df.columns.tolist(), "rows": len(df)}
+             store_dataset("merged", data_processing.merge_data(data_store["qualtrics"], df))
+        return {"message": "Coding data uploaded", "columns": df.columns.tolist(), "rows": len(df), "encoding": encoding, "encoding_detection_ms": detection_ms}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -105,7 +287,10 @@ class PreviewRequest(BaseModel):
     target_column: Optional[str] = None
 
 @app.post("/preview-segments")
-async def preview_segments(request: PreviewRequest):
+async def preview_segments(request: PreviewRequest, http_request: Request):
+    return await compute.run(http_request, perform_preview_segments, request)
+
+def perform_preview_segments(request: PreviewRequest):
     # Use qualtrics data for segmentation to avoid duplication from coding data
     df = data_store["qualtrics"]
     if df is None:
@@ -116,13 +301,7 @@ async def preview_segments(request: PreviewRequest):
         raise HTTPException(status_code=400, detail="No data uploaded")
     
     try:
-        # Normalize whitespace in segment columns
-        if request.segment_columns:
-             for col in request.segment_columns:
-                 if col in df.columns and df[col].dtype == 'object':
-                     df[col] = df[col].str.replace(r'\s+', '', regex=True)
-
-        # Calculate segments
+        # Calculate segments (whitespace is normalized by the segment keys)
         segments = weighting.get_segment_counts(df, request.segment_columns)
         
         # Calculate suggested targets from population data if available
@@ -139,120 +318,147 @@ async def preview_segments(request: PreviewRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def perform_analysis(request: AnalysisRequest, df: pd.DataFrame):
-    # Apply weighting if config provided
-    excluded_count = 0
-    weight_col = None
-    
-    if request.weighting_config and request.weighting_config.segment_columns:
-        try:
-            # Filter out rows with missing segment data
-            initial_count = len(df)
-            for col in request.weighting_config.segment_columns:
-                if col in df.columns:
-                     # Replace whitespace with NaN
-                     df[col] = df[col].replace(r'^\s*$', pd.NA, regex=True)
-            
-            df = df.dropna(subset=request.weighting_config.segment_columns)
-            excluded_count = initial_count - len(df)
-            
-            if len(df) == 0:
-                 raise HTTPException(status_code=400, detail="All rows excluded due to missing segment data.")
+def batched_groups(df: pd.DataFrame, request: AnalysisRequest, codes: np.ndarray, groups, weight_col: Optional[str], scale_codes: Optional[pd.DataFrame] = None) -> dict:
+    """NPS and top-box for every group of one column in a single grouped pass, reusing the global weights."""
+    nps_scores = analysis.grouped_nps_scores(df, request.nps_column, codes, len(groups), weight_col)
+    top_boxes = analysis.grouped_top_3_box(df, request.top_box_columns, codes, len(groups), weight_col, scale_codes)
+    return {
+        str(group): {"nps": nps_scores[g], "top_box_3_percent": top_boxes[g]}
+        for g, group in enumerate(groups)
+    }
 
-            # Calculate weights on the unique respondent data
-            df = weighting.calculate_weights(df, request.weighting_config.segment_columns, request.weighting_config.targets)
-            weight_col = 'Weight'
+def load_subset_targets(request: AnalysisRequest) -> Optional[dict]:
+    """Population targets over group_weighting_columns, or None if unavailable."""
+    try:
+        pop_df = data_store["population"]
+        if pop_df is None:
+            return None
+        return weighting.calculate_targets(
+            pop_df,
+            request.group_weighting_columns,
+            request.weighting_config.target_column
+        )
+    except Exception as e:
+        print(f"Subset weighting failed: {e}")
+        return None
+
+def subset_weighted_groups(df: pd.DataFrame, request: AnalysisRequest, codes: np.ndarray, groups, subset_targets: dict, weight_col: Optional[str], scale_codes: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Re-weights each group to the subset targets before measuring it. Groups are
+    sliced from one sort by code and weighted on the subset-weighting pool.
+    """
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(groups)))])
+    offset = int((codes < 0).sum())  # rows with missing group values sort first
+
+    def measure_group(g: int):
+        group = groups[g]
+        group_df = df.iloc[order[offset + bounds[g]:offset + bounds[g + 1]]]
+        current_weight_col = weight_col
+        try:
+            group_df, _ = weighting.apply_weighting(
+                group_df,
+                request.weighting_config,
+                segment_columns=request.group_weighting_columns,
+                targets=subset_targets
+            )
+            current_weight_col = 'Weight'
         except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Weighting error: {str(e)}")
+            print(f"Subset weighting failed for group {group}: {e}")
+
+        group_nps_data = analysis.calculate_nps(group_df, request.nps_column, current_weight_col)
+        group_nps = group_nps_data['score'] if isinstance(group_nps_data, dict) else group_nps_data
+        return str(group), {
+            "nps": group_nps,
+            "top_box_3_percent": analysis.calculate_top_3_box(group_df, request.top_box_columns, current_weight_col, scale_codes)
+        }
+
+    # Groups are weighted concurrently; results are merged in group order
+    return dict(subset_weighting.map_subsets(measure_group, range(len(groups))))
+
+def weighted_rows(request: AnalysisRequest, df: pd.DataFrame) -> tuple:
+    """
+    Weights for the request's weighting config, as (positions of the weighted
+    rows in df, their weights, excluded count, weighting diagnostics).
+    Cached like analysis results, so an export reuses the weights computed
+    for the analysis it follows.
+    """
+    return result_cache.get_or_compute(
+        "weights",
+        request.weighting_config,
+        dataset_versions("qualtrics", "merged", "population"),
+        lambda: compute_weighted_rows(request, df)
+    )
+
+def compute_weighted_rows(request: AnalysisRequest, df: pd.DataFrame) -> tuple:
+    compute.report_progress("weighting", 0)
+    try:
+        # Filter out rows with missing segment data. Blank values count as
+        # missing; df is the stored dataset, so the mask is built on a
+        # cleaned copy of the segment columns and df is never written to
+        cleaned = df[list(request.weighting_config.segment_columns)].replace(r'^\s*$', pd.NA, regex=True)
+        keep = cleaned.notna().all(axis=1).to_numpy()
+        excluded_count = int(len(df) - keep.sum())
+
+        if not keep.any():
+             raise HTTPException(status_code=400, detail="All rows excluded due to missing segment data.")
+
+        # Calculate weights on the unique respondent data
+        weighted_df, weighting_diagnostics = weighting.apply_weighting(df[keep], request.weighting_config)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Weighting error: {str(e)}")
+
+    return np.flatnonzero(keep), weighted_df['Weight'].to_numpy(), excluded_count, weighting_diagnostics
+
+def apply_request_weighting(request: AnalysisRequest, df: pd.DataFrame):
+    """
+    Drops respondents with missing segment data and weights the rest per the
+    request's weighting config. Returns (df, weight column or None,
+    excluded count, weighting diagnostics).
+    """
+    if not (request.weighting_config and request.weighting_config.segment_columns):
+        return df, None, 0, None
+
+    rows, weights, excluded_count, weighting_diagnostics = weighted_rows(request, df)
+    return df.iloc[rows].assign(Weight=weights), 'Weight', excluded_count, weighting_diagnostics
+
+def perform_analysis(request: AnalysisRequest, df: pd.DataFrame, scale_codes: Optional[pd.DataFrame] = None):
+    # Apply weighting if config provided
+    df, weight_col, excluded_count, weighting_diagnostics = apply_request_weighting(request, df)
     
     # Calculate metrics
     nps = analysis.calculate_nps(df, request.nps_column, weight_col)
-    top_box = analysis.calculate_top_3_box(df, request.top_box_columns, weight_col)
+    top_box = analysis.calculate_top_3_box(df, request.top_box_columns, weight_col, scale_codes)
     
     # Calculate Segmented Results if group_by_columns are provided
     segmented_results = {}
     if request.group_by_columns:
-        for col in request.group_by_columns:
+        subset_targets = None
+        if request.group_weighting_columns and request.weighting_config:
+            subset_targets = load_subset_targets(request)
+
+        for i, col in enumerate(request.group_by_columns):
+            compute.check_cancelled()
+            compute.report_progress("segmenting", 20 + 70 * i / len(request.group_by_columns))
             if col in df.columns:
-                col_results = {}
-                groups = df[col].dropna().unique()
-                
-                for group in groups:
-                    group_df = df[df[col] == group]
-                    current_weight_col = weight_col
-                    
-                    # Apply Subset Weighting if configured
-                    if request.group_weighting_columns and request.weighting_config:
-                        try:
-                            pop_df = data_store["population"]
-                            if pop_df is not None:
-                                subset_targets = weighting.calculate_targets(
-                                    pop_df, 
-                                    request.group_weighting_columns, 
-                                    request.weighting_config.target_column
-                                )
-                                weighted_group_df = weighting.calculate_weights(
-                                    group_df, 
-                                    request.group_weighting_columns, 
-                                    subset_targets
-                                )
-                                group_df = weighted_group_df
-                                current_weight_col = 'Weight'
-                        except Exception as e:
-                            print(f"Subset weighting failed for group {group}: {e}")
-                    
-                    group_nps_data = analysis.calculate_nps(group_df, request.nps_column, current_weight_col)
-                    group_nps = group_nps_data['score'] if isinstance(group_nps_data, dict) else group_nps_data
-                    
-                    group_top_box = analysis.calculate_top_3_box(group_df, request.top_box_columns, current_weight_col)
-                    
-                    col_results[str(group)] = {
-                        "nps": group_nps,
-                        "top_box_3_percent": group_top_box
-                    }
-                
-                segmented_results[col] = col_results
+                # Factorize once; group order follows first appearance like unique()
+                codes, groups = pd.factorize(df[col], sort=False)
+                if subset_targets is not None:
+                    segmented_results[col] = subset_weighted_groups(df, request, codes, groups, subset_targets, weight_col, scale_codes)
+                else:
+                    segmented_results[col] = batched_groups(df, request, codes, groups, weight_col, scale_codes)
     
     # Generate Weighting Report (Detailed Table)
     weighting_report = []
     if request.weighting_config and request.weighting_config.segment_columns and weight_col:
+        compute.report_progress("report", 90)
         try:
-            total_responses = len(df)
-            # Group by segment columns
-            # We need to group by all segment columns to get unique segments
-            # The weights should be identical within each group
-            
-            # Create a grouper list
-            grouper = request.weighting_config.segment_columns
-            
-            for segment_values, group in df.groupby(grouper):
-                # segment_values can be a single value or a tuple
-                if not isinstance(segment_values, tuple):
-                    segment_values = (segment_values,)
-                
-                segment_dict = dict(zip(grouper, segment_values))
-                
-                # Get stats
-                sample_count = len(group)
-                sample_proportion = sample_count / total_responses if total_responses > 0 else 0
-                weight = group[weight_col].iloc[0]
-                
-                # Get target proportion
-                # Construct the segment key used in targets (e.g. "Male_18-24")
-                # The key format depends on how calculate_weights constructs it.
-                # In weighting.py, it joins with "_".
-                segment_key = "_".join([str(v) for v in segment_values])
-                target_prop = request.weighting_config.targets.get(segment_key, 0)
-                
-                segment_dict.update({
-                    'sample_count': sample_count,
-                    'sample_proportion': round(sample_proportion, 4),
-                    'population_proportion': round(target_prop, 4),
-                    'applied_weight': round(weight, 4),
-                    'risk_level': assess_weight_risk(weight)
-                })
-                weighting_report.append(segment_dict)
-                
+            weighting_report = weighting.build_weighting_report(
+                df,
+                request.weighting_config.segment_columns,
+                request.weighting_config.targets,
+                weight_column=weight_col
+            )
         except Exception as e:
             print(f"Error generating weighting report: {e}")
 
@@ -262,75 +468,106 @@ def perform_analysis(request: AnalysisRequest, df: pd.DataFrame):
         "weighted": weight_col is not None,
         "excluded_count": excluded_count,
         "segmented_results": segmented_results,
-        "weighting_report": weighting_report
+        "weighting_report": weighting_report,
+        "weighting_diagnostics": weighting_diagnostics
     }
 
-@app.post("/analyze")
-async def analyze_data(request: AnalysisRequest):
+def cached_analysis(request: AnalysisRequest, df: pd.DataFrame, scale_codes: Optional[pd.DataFrame] = None):
+    return result_cache.get_or_compute(
+        "analyze",
+        request,
+        dataset_versions("qualtrics", "merged", "population"),
+        lambda: perform_analysis(request, df, scale_codes)
+    )
+
+def analysis_results(request: AnalysisRequest):
     # Use qualtrics data for analysis to ensure 1 row per respondent
-    df = data_store["qualtrics"]
-    if df is None:
-        df = data_store["merged"]
-        
-    if df is None:
-        raise HTTPException(status_code=400, detail="No data uploaded")
-    
-    return perform_analysis(request, df)
+    df, scale_codes = load_analysis_data()
+    return cached_analysis(request, df, scale_codes)
+
+@app.post("/analyze")
+async def analyze_data(request: AnalysisRequest, http_request: Request):
+    return serialization.respond(http_request, await compute.run(http_request, analysis_results, request))
 
 @app.post("/export/quantitative")
-async def export_quantitative(request: AnalysisRequest):
-    df = data_store["qualtrics"]
-    if df is None:
-        df = data_store["merged"]
-    if df is None:
-        raise HTTPException(status_code=400, detail="No data uploaded")
+async def export_quantitative(request: AnalysisRequest, http_request: Request, export_format: str = Query("xlsx", alias="format")):
+    """
+    Quantitative results as an Excel workbook (format=xlsx, default), a zip
+    of CSV files (format=csv) or a zip of Parquet files (format=parquet), with
+    the weighting report and per-respondent weights when weighting is applied.
+    """
+    try:
+        exports.check_format(export_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    results = perform_analysis(request, df)
-    
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Sheet 1: Overview
-        overview_data = {
-            "Metric": ["NPS Score", "Promoters %", "Passives %", "Detractors %", "Top Box %"],
-            "Value": [
-                results["nps"]["score"],
-                results["nps"]["breakdown"]["promoters"],
-                results["nps"]["breakdown"]["passives"],
-                results["nps"]["breakdown"]["detractors"],
-                results["top_box_3_percent"]
-            ]
-        }
-        pd.DataFrame(overview_data).to_excel(writer, sheet_name="Overview", index=False)
-        
-        # Sheet 2: Segmented Results
-        if results["segmented_results"]:
-            rows = []
-            for group_col, group_data in results["segmented_results"].items():
-                for group_val, metrics in group_data.items():
-                    rows.append({
-                        "Group Column": group_col,
-                        "Group Value": group_val,
-                        "NPS": metrics["nps"],
-                        "Top Box %": metrics["top_box_3_percent"]
-                    })
-            pd.DataFrame(rows).to_excel(writer, sheet_name="Segments", index=False)
-
-    output.seek(0)
+    tables = await compute.run(http_request, build_quantitative_export, request)
+    media_type, extension = exports.EXPORT_FORMATS[export_format]
     return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=nps_analysis_quantitative.xlsx"}
+        profiling.iterate(metrics.timed_iter("export_write", exports.stream(tables, export_format), rows=sum(len(table.frame) for table in tables))),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=nps_analysis_quantitative.{extension}"}
     )
 
+@metrics.timed("export")
+def build_quantitative_export(request: AnalysisRequest) -> List[exports.Table]:
+    results = analysis_results(request)
+    top_box = results["top_box_3_percent"]
+    tables = []
+
+    # Sheet 1: Overview
+    overview_data = {
+        "Metric": ["NPS Score", "Promoters %", "Passives %", "Detractors %"] + [f"Top Box % ({col})" for col in top_box],
+        "Value": [
+            results["nps"]["score"],
+            results["nps"]["breakdown"]["promoters"],
+            results["nps"]["breakdown"]["passives"],
+            results["nps"]["breakdown"]["detractors"]
+        ] + list(top_box.values())
+    }
+    tables.append(exports.Table("Overview", pd.DataFrame(overview_data)))
+
+    # Sheet 2: Segmented Results
+    if results["segmented_results"]:
+        rows = []
+        for group_col, group_data in results["segmented_results"].items():
+            for group_val, group_metrics in group_data.items():
+                row = {
+                    "Group Column": group_col,
+                    "Group Value": group_val,
+                    "NPS": group_metrics["nps"]
+                }
+                for col in top_box:
+                    row[f"Top Box % ({col})"] = group_metrics["top_box_3_percent"].get(col)
+                rows.append(row)
+        tables.append(exports.Table("Segments", pd.DataFrame(rows)))
+
+    # Sheets 3-4: Weighting report and the weight of every respondent
+    if results["weighting_report"]:
+        tables.append(exports.Table("Weighting Report", pd.DataFrame(results["weighting_report"])))
+    if results["weighted"]:
+        # Weights cached by the analysis above; only the exported columns are copied
+        df, _ = load_analysis_data()
+        rows, weights, _, _ = weighted_rows(request, df)
+        id_cols = ['ResponseId'] if 'ResponseId' in df.columns else []
+        weights_df = df[id_cols + list(request.weighting_config.segment_columns)].iloc[rows].assign(Weight=weights)
+        tables.append(exports.Table("Weights", weights_df))
+
+    return tables
+
 @app.post("/export/open-ended")
-async def export_open_ended(request: AnalysisRequest):
-    # For open-ended, we need to call analyze_response_rates logic
-    # But analyze_response_rates is an endpoint, let's just call it directly or extract logic?
-    # It's better to call the function logic. 
-    # Since analyze_response_rates is async and depends on request, we can just call it.
-    # However, it returns a dict, not markdown. We need to format it.
-    
-    data = await analyze_response_rates(request)
+async def export_open_ended(request: AnalysisRequest, http_request: Request):
+    md_content = await compute.run(http_request, build_open_ended_export, request)
+    return StreamingResponse(
+        io.BytesIO(md_content.encode()),
+        media_type="text/markdown",
+        headers={"Content-Disposition": "attachment; filename=nps_analysis_open_ended.md"}
+    )
+
+@metrics.timed("export")
+def build_open_ended_export(request: AnalysisRequest) -> str:
+    # Same (cached) results as /analyze/response-rates, formatted as markdown
+    data = response_rate_results(request)
     
     md_lines = ["# Open-Ended Analysis Results\n"]
     
@@ -348,35 +585,52 @@ async def export_open_ended(request: AnalysisRequest):
                     md_lines.append(f"| {cat} | {val['count']} | {val['percentage']}% |")
             md_lines.append("\n")
             
-    md_content = "\n".join(md_lines)
-    
-    return StreamingResponse(
-        io.BytesIO(md_content.encode()),
-        media_type="text/markdown",
-        headers={"Content-Disposition": "attachment; filename=nps_analysis_open_ended.md"}
-    )
+    return "\n".join(md_lines)
 
 @app.post("/analyze/response-rates")
-async def analyze_response_rates(request: AnalysisRequest):
+async def analyze_response_rates(request: AnalysisRequest, http_request: Request):
+    return serialization.respond(http_request, await compute.run(http_request, response_rate_results, request))
+
+def response_rate_results(request: AnalysisRequest):
+    return result_cache.get_or_compute(
+        "response-rates",
+        request,
+        dataset_versions("qualtrics", "merged", "population"),
+        lambda: perform_response_rate_analysis(request)
+    )
+
+def perform_response_rate_analysis(request: AnalysisRequest):
     # Use merged data for response rates to support coding columns
+    merged_name = "merged"
     merged_df = data_store["merged"]
     qualtrics_df = data_store["qualtrics"]
     
     if merged_df is None:
         # Fallback to qualtrics if merged is missing
+        merged_name = "qualtrics"
         merged_df = qualtrics_df
         
     if merged_df is None:
         raise HTTPException(status_code=400, detail="No data uploaded")
-        
+
+    # We pass id_column='ResponseId' to ensure we count unique respondents, not rows
+    id_col = 'ResponseId' if 'ResponseId' in merged_df.columns else None
+    nps_col = request.nps_column if request.nps_column and request.nps_column in merged_df.columns else None
+    index = RespondentIndex.for_dataset(data_store.version(merged_name), merged_df, id_col, nps_col)
+
     weight_col = None
     excluded_count = 0
+    weighting_diagnostics = None
+
+    # Respondents in the analysis and their weights (from a Weight column in the data if present)
+    members = np.ones(index.n_respondents, dtype=bool)
+    base_weights = index.column_weights(merged_df, 'Weight') if 'Weight' in merged_df.columns else None
     
     # Apply weighting if config provided
     # We must calculate weights based on UNIQUE respondents (qualtrics_df)
-    # Then map these weights to the merged_df
-    print(f"DEBUG: analyze_response_rates weighting_config: {request.weighting_config}")
+    # Then map these weights to the respondents of merged_df
     if request.weighting_config and request.weighting_config.segment_columns and qualtrics_df is not None:
+        compute.report_progress("weighting", 0)
         try:
             # 0. Filter missing segment data from qualtrics_df
             initial_q_count = len(qualtrics_df)
@@ -388,66 +642,35 @@ async def analyze_response_rates(request: AnalysisRequest):
             
             q_df_clean = q_df_clean.dropna(subset=request.weighting_config.segment_columns)
             excluded_count = initial_q_count - len(q_df_clean)
-            print(f"DEBUG: Excluded count: {excluded_count} (Initial: {initial_q_count}, Clean: {len(q_df_clean)})")
             
             if len(q_df_clean) == 0:
                  raise HTTPException(status_code=400, detail="All rows excluded due to missing segment data.")
 
             # 1. Calculate weights on unique respondents
-            from weighting import calculate_weights, assess_weight_risk
-            weighted_q_df = calculate_weights(q_df_clean, request.weighting_config.segment_columns, request.weighting_config.targets)
+            weighted_q_df, weighting_diagnostics = weighting.apply_weighting(q_df_clean, request.weighting_config)
             
-            # 2. Map weights to merged_df using ResponseId
-            # Assuming ResponseId exists in both
-            if 'ResponseId' in weighted_q_df.columns and 'ResponseId' in merged_df.columns:
-                # Create a mapping series
-                weight_map = weighted_q_df.set_index('ResponseId')['Weight']
-                
-                # Map to merged_df
-                # We work on a copy to avoid modifying global store
-                merged_df = merged_df.copy()
-                merged_df['Weight'] = merged_df['ResponseId'].map(weight_map)
-                
-                # CRITICAL: Drop rows in merged_df that didn't get a weight (because they were excluded)
-                # If a respondent was in merged_df but excluded from weighting, their weight is NaN.
-                # We must drop them to exclude them from analysis.
-                merged_df = merged_df.dropna(subset=['Weight'])
+            # 2. Map weights to merged_df respondents using ResponseId
+            if 'ResponseId' in weighted_q_df.columns and id_col == 'ResponseId':
+                base_weights = index.map_weights(weighted_q_df.set_index('ResponseId')['Weight'])
                 
+                # CRITICAL: Respondents that didn't get a weight (because they were excluded)
+                # must be excluded from analysis.
+                members = ~np.isnan(base_weights)
                 weight_col = 'Weight'
         except Exception as e:
-            # If weighting fails, proceed without weights but log/warn?
-            # Or fail? User expects weighting.
             raise HTTPException(status_code=400, detail=f"Weighting error: {str(e)}")
 
-    # Calculate Response Rates (Category Stats)
-    # We pass id_column='ResponseId' to ensure we count unique respondents, not rows
-    # We pass weight_column if weighting was applied
-    id_col = 'ResponseId' if 'ResponseId' in merged_df.columns else None
-    
     results = {}
     weighting_reports = {}  # Store weighting report for each segment
     
-    # Pre-calculate segment masks if NPS column is provided
-    segments = {"Overall": merged_df}
-    print(f"DEBUG: analyze_response_rates called. NPS Column: '{request.nps_column}'")
-    if request.nps_column:
-        if request.nps_column in merged_df.columns:
-            print(f"DEBUG: NPS column found in merged_df. Calculating segments.")
-            # Ensure numeric
-            nps_series = pd.to_numeric(merged_df[request.nps_column], errors='coerce')
-            
-            segments["Promoters (9-10)"] = merged_df[nps_series >= 9]
-            segments["Passives (7-8)"] = merged_df[(nps_series >= 7) & (nps_series <= 8)]
-            segments["Detractors (0-6)"] = merged_df[nps_series <= 6]
-            segments["At-Risk (0-3)"] = merged_df[nps_series <= 3]
-        else:
-            print(f"DEBUG: NPS column '{request.nps_column}' NOT found in merged_df columns: {merged_df.columns.tolist()}")
+    # NPS segments are respondent masks over the index, not copies of merged_df
+    segments = index.nps_segments(Segment(members, base_weights))
     
     # Apply subset weighting to each NPS segment if group_weighting_columns provided
     if request.group_weighting_columns and request.weighting_config and len(request.group_weighting_columns) > 0:
         pop_df = data_store["population"]
         if pop_df is not None:
-            print(f"DEBUG: Applying subset weighting with columns: {request.group_weighting_columns}")
+            compute.report_progress("segmenting", 20)
             try:
                 # Calculate subset targets once (same for all segments)
                 subset_targets = weighting.calculate_targets(
@@ -455,283 +678,172 @@ async def analyze_response_rates(request: AnalysisRequest):
                     request.group_weighting_columns,
                     request.weighting_config.target_column
                 )
-                print(f"DEBUG: Calculated {len(subset_targets)} subset targets")
                 
-                # Apply subset weighting to each segment (except Overall)
-                weighted_segments = {}
-                for seg_name, seg_df in segments.items():
-                    if seg_name == "Overall":
-                        weighted_segments[seg_name] = seg_df
-                        continue
-                    
-                    if len(seg_df) == 0:
-                        print(f"DEBUG: Skipping empty segment: {seg_name}")
-                        weighted_segments[seg_name] = seg_df
-                        continue
+                # Blank segment values count as missing; cleaned once for all segments
+                q_df_subset = None
+                if id_col == 'ResponseId' and qualtrics_df is not None:
+                    q_df_subset = qualtrics_df.copy()
+                    for col in request.group_weighting_columns:
+                        if col in q_df_subset.columns:
+                            q_df_subset[col] = q_df_subset[col].replace(r'^\s*$', pd.NA, regex=True)
+
+                def weigh_segment(seg_name: str):
+                    """Returns (weighted segment, weighting report), or None to keep the segment as is."""
+                    segment = segments[seg_name]
+                    if not segment.members.any():
+                        return None
                     
                     try:
                         # Get unique respondents for this segment from qualtrics data
-                        if 'ResponseId' in seg_df.columns and qualtrics_df is not None:
-                            # Get unique ResponseIds in this segment
-                            segment_response_ids = seg_df['ResponseId'].unique()
-                            # Filter qualtrics_df to only these respondents
-                            seg_qualtrics_df = qualtrics_df[qualtrics_df['ResponseId'].isin(segment_response_ids)].copy()
-                            
-                            # Clean segment data
-                            for col in request.group_weighting_columns:
-                                if col in seg_qualtrics_df.columns:
-                                    seg_qualtrics_df[col] = seg_qualtrics_df[col].replace(r'^\s*$', pd.NA, regex=True)
-                            
+                        if q_df_subset is not None:
+                            segment_response_ids = index.member_ids(segment.members)
+                            seg_qualtrics_df = q_df_subset[q_df_subset['ResponseId'].isin(segment_response_ids)]
                             seg_qualtrics_df = seg_qualtrics_df.dropna(subset=request.group_weighting_columns)
                             
                             if len(seg_qualtrics_df) == 0:
-                                print(f"DEBUG: No valid data for subset weighting in {seg_name}")
-                                weighted_segments[seg_name] = seg_df
-                                continue
+                                return None
                             
                             # Apply subset weighting to unique respondents
-                            weighted_seg_qualtrics = weighting.calculate_weights(
+                            weighted_seg_qualtrics, _ = weighting.apply_weighting(
                                 seg_qualtrics_df,
-                                request.group_weighting_columns,
-                                subset_targets
+                                request.weighting_config,
+                                segment_columns=request.group_weighting_columns,
+                                targets=subset_targets
                             )
                             
-                            # Map weights back to merged_df for this segment
-                            weight_map = weighted_seg_qualtrics.set_index('ResponseId')['Weight']
-                            seg_df_weighted = seg_df.copy()
-                            seg_df_weighted['Weight'] = seg_df_weighted['ResponseId'].map(weight_map)
-                            seg_df_weighted = seg_df_weighted.dropna(subset=['Weight'])
-                            
-                            weighted_segments[seg_name] = seg_df_weighted
+                            # Map weights back to this segment's respondents
+                            seg_weights = index.map_weights(weighted_seg_qualtrics.set_index('ResponseId')['Weight'])
                             
                             # Generate weighting report for this segment
-                            segment_report = []
-                            total_responses = len(weighted_seg_qualtrics)
-                            grouper = request.group_weighting_columns
-                            
-                            for segment_values, group in weighted_seg_qualtrics.groupby(grouper):
-                                if not isinstance(segment_values, tuple):
-                                    segment_values = (segment_values,)
-                                
-                                segment_dict = dict(zip(grouper, segment_values))
-                                
-                                sample_count = len(group)
-                                sample_proportion = sample_count / total_responses if total_responses > 0 else 0
-                                weight = group['Weight'].iloc[0]
-                                
-                                segment_key = "_".join([str(v) for v in segment_values])
-                                target_prop = subset_targets.get(segment_key, 0)
-                                
-                                segment_dict.update({
-                                    'nps_segment': seg_name,
-                                    'sample_count': sample_count,
-                                    'sample_proportion': round(sample_proportion, 4),
-                                    'population_proportion': round(target_prop, 4),
-                                    'applied_weight': round(weight, 4),
-                                    'risk_level': assess_weight_risk(weight)
-                                })
-                                segment_report.append(segment_dict)
-                            
-                            weighting_reports[seg_name] = segment_report
-                            print(f"DEBUG: Generated weighting report for {seg_name} with {len(segment_report)} rows")
-                        else:
-                            print(f"DEBUG: Cannot apply subset weighting to {seg_name}: missing ResponseId or qualtrics_df")
-                            weighted_segments[seg_name] = seg_df
+                            segment_report = weighting.build_weighting_report(
+                                weighted_seg_qualtrics,
+                                request.group_weighting_columns,
+                                subset_targets,
+                                extra={'nps_segment': seg_name}
+                            )
+                            return Segment(segment.members & ~np.isnan(seg_weights), seg_weights), segment_report
                             
                     except Exception as e:
-                        print(f"DEBUG: Subset weighting failed for {seg_name}: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        weighted_segments[seg_name] = seg_df
+                        print(f"Subset weighting failed for segment {seg_name}: {e}")
+                    return None
+
+                # Apply subset weighting to each segment (except Overall) concurrently,
+                # merging results in segment order
+                seg_names = [name for name in segments if name != "Overall"]
+                for seg_name, weighted in zip(seg_names, subset_weighting.map_subsets(weigh_segment, seg_names)):
+                    if weighted is not None:
+                        segments[seg_name], weighting_reports[seg_name] = weighted
                 
-                # Replace segments with weighted versions
-                segments = weighted_segments
                 # Update weight column for subsequent calculations
                 if len(weighting_reports) > 0:
                     weight_col = 'Weight'
                     
             except Exception as e:
-                print(f"ERROR: Failed to calculate subset targets: {e}")
-                import traceback
-                traceback.print_exc()
+                print(f"Subset weighting failed: {e}")
+
+    if weight_col is None:
+        segments = {name: Segment(segment.members, None) for name, segment in segments.items()}
 
     for i, col in enumerate(request.open_end_columns):
+        compute.check_cancelled()
+        compute.report_progress("categories", 50 + 50 * i / len(request.open_end_columns))
         if col:
             col_results = {}
             # Identify parent column (previous level)
             parent_col = request.open_end_columns[i-1] if i > 0 and request.open_end_columns[i-1] else None
+            answers = index.answers(merged_df, col, parent_col)
             
-            for seg_name, seg_df in segments.items():
-                # Calculate stats for this segment
-                # Note: We must use the SAME weight column. 
-                # If weighting was applied, 'Weight' is in seg_df (subset of merged_df).
-                # Calculate Base N (Total Count)
-                total_count = 0
-                if id_col and id_col in seg_df.columns:
-                    if weight_col and weight_col in seg_df.columns:
-                         unique_weights = seg_df[[id_col, weight_col]].drop_duplicates(subset=[id_col])
-                         total_count = unique_weights[weight_col].sum()
-                    else:
-                         total_count = seg_df[id_col].nunique()
-                else:
-                    if weight_col and weight_col in seg_df.columns:
-                         total_count = seg_df[weight_col].sum()
-                    else:
-                         total_count = len(seg_df)
-
-                # Calculate Response Rate
-                rr_dict = analysis.calculate_response_rate(seg_df, [col], id_column=id_col, weight_column=weight_col)
-                response_rate = rr_dict.get(col, 0.0)
-
-                # Calculate Stats
-                stats = analysis.calculate_category_stats(
-                    seg_df, 
-                    col, 
-                    id_column=id_col, 
-                    weight_column=weight_col,
-                    parent_column=parent_col
-                )
-                
+            for seg_name, segment in segments.items():
                 col_results[seg_name] = {
-                    "total_count": round(total_count, 1),
-                    "response_rate": response_rate,
-                    "category_stats": stats
+                    "total_count": round(index.base(segment), 1),
+                    "response_rate": answers.response_rate(segment),
+                    "category_stats": answers.category_stats(segment)
                 }
             results[col] = col_results
     
     return {
         "response_rates": results,
         "excluded_count": excluded_count,
-        "weighting_reports": weighting_reports
+        "weighting_reports": weighting_reports,
+        "weighting_diagnostics": weighting_diagnostics
     }
 
 @app.get("/health")
-async def health_check():
-    return {"status": "ok"}
+async def health_check(challenge: Optional[str] = None):
+    return lifecycle.health(True, challenge)
+
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+LAUNCH_TOKEN_HEADER = "X-NPS-Launch-Token"
+
+@app.post("/shutdown")
+async def shutdown(http_request: Request):
+    """
+    Stops the backend once this response is sent. Only accepted from this
+    machine, with the launch token of a backend the launcher spawned.
+    """
+    client = http_request.client
+    if client is None or client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Shutdown is only accepted from localhost")
+    if not lifecycle.launch_token_matches(http_request.headers.get(LAUNCH_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="Invalid launch token")
+    if not lifecycle.request_shutdown():
+        raise HTTPException(status_code=409, detail="Backend was not started through server.py; stop it where it was started")
+    return {"message": "Shutting down"}
+
+@app.get("/metrics")
+async def get_metrics(metrics_format: str = Query("prometheus", alias="format")):
+    """Stage and request timings in the Prometheus text format, or as JSON with format=json."""
+    cache = result_cache.stats()
+    session_totals = session_registry.totals()
+    gauges = {
+        "nps_result_cache_bytes": cache["bytes"],
+        "nps_result_cache_entries": cache["entries"],
+        "nps_result_cache_hits": cache["hits"],
+        "nps_result_cache_misses": cache["misses"],
+        "nps_jobs_running": sum(1 for job in job_manager.list() if job["status"] == jobs.RUNNING),
+        "nps_sessions": session_totals["sessions"],
+        "nps_sessions_open": session_totals["open_sessions"],
+        "nps_dataset_memory_bytes": session_totals["memory_bytes"],
+        "nps_dataset_evictions": session_totals["evictions"],
+        "nps_dataset_reloads": session_totals["reloads"],
+    }
+    if metrics_format == "json":
+        return metrics.summary(gauges)
+    if metrics_format != "prometheus":
+        raise HTTPException(status_code=400, detail="format must be 'prometheus' or 'json'")
+    return Response(metrics.prometheus(gauges), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/debug/profiles")
+async def list_profiles():
+    """Saved request profiles (speedscope files), newest first."""
+    return {"directory": settings.PROFILE_DIR, "profiles": profiling.list_profiles()}
+
+@app.get("/debug/profiles/{name}")
+async def get_profile(name: str):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{name}' not found")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return result_cache.stats()
 
 @app.get("/columns")
 async def get_columns():
-    if data_store["merged"] is None:
-         return {"columns": []}
-    return {"columns": data_store["merged"].columns.tolist()}
+    return {"columns": data_store.columns("merged"), "storage": storage_report("merged")}
 
 @app.get("/columns/qualtrics")
 async def get_qualtrics_columns():
-    if data_store["qualtrics"] is None:
-         return {"columns": []}
-    return {"columns": data_store["qualtrics"].columns.tolist()}
+    return {"columns": data_store.columns("qualtrics"), "storage": storage_report("qualtrics")}
 
 @app.get("/columns/coding")
 async def get_coding_columns():
-    if data_store["coding"] is None:
-         return {"columns": []}
-    return {"columns": data_store["coding"].columns.tolist()}
+    return {"columns": data_store.columns("coding"), "storage": storage_report("coding")}
 
 @app.get("/population-columns")
 async def get_population_columns():
-    if data_store["population"] is None:
-         return {"columns": []}
-    return {"columns": data_store["population"].columns.tolist()}
-
-class SegmentRequest(BaseModel):
-    columns: List[str]
-    target_column: Optional[str] = None
-
-@app.post("/preview-segments")
-async def preview_segments(request: SegmentRequest):
-    df = data_store["qualtrics"]
-    if df is None: 
-        # Do not fallback to merged. Weighting must be on original respondents.
-        raise HTTPException(status_code=400, detail="Qualtrics data not found. Please upload Qualtrics data.")
-
-    if not request.columns:
-        return {"segments": []}
-
-    # Create segments from survey data
-    try:
-        if len(request.columns) == 1:
-            segments = df[request.columns[0]].astype(str).str.replace(" ", "").unique().tolist()
-        else:
-            segments = df[request.columns].astype(str).apply(lambda x: x.str.replace(" ", "")).agg('_'.join, axis=1).unique().tolist()
-        
-        segments = sorted(segments)
-        
-        # Calculate targets from population data if available
-        suggested_targets = {}
-        pop_df = data_store["population"]
-        
-        print(f"DEBUG: Previewing segments for columns: {request.columns}, Target Col: {request.target_column}")
-        if pop_df is not None:
-            print(f"DEBUG: Population data available. Columns: {pop_df.columns.tolist()}")
-            
-            # Normalize column names for matching: lowercase and strip whitespace
-            # Map normalized name -> actual population column name
-            pop_col_map = {col.lower().strip(): col for col in pop_df.columns}
-            
-            # Find matching columns in population data
-            matched_pop_cols = []
-            missing_cols = []
-            
-            for req_col in request.columns:
-                normalized_req = req_col.lower().strip()
-                if normalized_req in pop_col_map:
-                    matched_pop_cols.append(pop_col_map[normalized_req])
-                else:
-                    missing_cols.append(req_col)
-            
-            if not missing_cols:
-                try:
-                    # Check if target_column is valid if provided
-                    target_col_actual = None
-                    if request.target_column:
-                        if request.target_column in pop_df.columns:
-                            target_col_actual = request.target_column
-                        elif request.target_column.lower().strip() in pop_col_map:
-                            target_col_actual = pop_col_map[request.target_column.lower().strip()]
-                        else:
-                            print(f"DEBUG: Target column '{request.target_column}' not found in population data.")
-                    
-                    print(f"DEBUG: Matched Population Columns: {matched_pop_cols}")
-                    print(f"DEBUG: Using Target Column: {target_col_actual}")
-
-                    if len(pop_df) > 0:
-                        # Group by segment columns
-                        if len(matched_pop_cols) == 1:
-                            grouper = pop_df[matched_pop_cols[0]].astype(str).str.replace(" ", "")
-                        else:
-                            grouper = pop_df[matched_pop_cols].astype(str).apply(lambda x: x.str.replace(" ", "")).agg('_'.join, axis=1)
-                        
-                        if target_col_actual:
-                            # Sum the target column (weights)
-                            # Ensure target column is numeric
-                            try:
-                                pop_counts = pop_df.groupby(grouper)[target_col_actual].sum()
-                                total_weight = pop_counts.sum()
-                            except Exception as e:
-                                print(f"Error summing target column: {e}")
-                                # Fallback to count
-                                pop_counts = grouper.value_counts()
-                                total_weight = len(pop_df)
-                        else:
-                            # Count rows
-                            pop_counts = grouper.value_counts()
-                            total_weight = len(pop_df)
-                            
-                        if total_weight > 0:
-                            for seg, count in pop_counts.items():
-                                suggested_targets[seg] = round(count / total_weight, 4)
-                        print(f"DEBUG: Calculated {len(suggested_targets)} targets.")
-                except Exception as e:
-                    print(f"Error calculating population targets: {e}")
-            else:
-                print(f"DEBUG: Missing columns in population data (case-insensitive check): {missing_cols}")
-                print(f"DEBUG: Available Population Columns: {list(pop_col_map.keys())}")
-        else:
-            print("DEBUG: No population data uploaded.")
-
-        return {"segments": segments, "suggested_targets": suggested_targets}
-    except KeyError as e:
-        raise HTTPException(status_code=400, detail=f"Column not found: {str(e)}")
+    return {"columns": data_store.columns("population"), "storage": storage_report("population")}
 
 
 # ============================================================
@@ -739,58 +851,90 @@ async def preview_segments(request: SegmentRequest):
 # ============================================================
 
 @app.post("/food-nps/upload/qualtrics")
-async def upload_food_qualtrics(file: UploadFile = File(...)):
+async def upload_food_qualtrics(http_request: Request, file: UploadFile = File(...)):
     """Upload Korean food delivery NPS survey data (Qualtrics export)."""
-    content = await file.read()
+    upload = await ingest.spool_upload(file)
     try:
-        df = food_nps.load_food_qualtrics_data(content, file.filename)
-        data_store["food_qualtrics"] = df
+        return await compute.run(http_request, store_food_qualtrics_upload, upload)
+    finally:
+        upload.close()
+
+
+def store_food_qualtrics_upload(upload: ingest.SpooledUpload):
+    try:
+        encoding, detection_ms = ingest.sniff_encoding(upload.path, upload.sha256)
+        df = food_nps.load_food_qualtrics_data(upload.path, upload.filename, encoding)
+        store_dataset("food_qualtrics", df)
         return {
             "message": "Food NPS Qualtrics data uploaded successfully",
             "columns": df.columns.tolist(),
             "rows": len(df),
-            "valid_nps_scores": len(df[df['Q1_1'].notna()])
+            "valid_nps_scores": len(df[df['Q1_1'].notna()]),
+            "encoding": encoding,
+            "encoding_detection_ms": detection_ms
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Upload error: {str(e)}")
 
 
 @app.post("/food-nps/upload/population")
-async def upload_food_population(file: UploadFile = File(...)):
+async def upload_food_population(http_request: Request, file: UploadFile = File(...)):
     """Upload population weighting data for Korean food delivery demographics."""
-    content = await file.read()
+    upload = await ingest.spool_upload(file)
+    try:
+        return await compute.run(http_request, store_food_population_upload, upload)
+    finally:
+        upload.close()
+
+
+def store_food_population_upload(upload: ingest.SpooledUpload):
     try:
-        df = food_nps.load_food_population_data(content, file.filename)
-        data_store["food_population"] = df
+        encoding, detection_ms = ingest.sniff_encoding(upload.path, upload.sha256)
+        df = food_nps.load_food_population_data(upload.path, upload.filename, encoding)
+        store_dataset("food_population", df)
+        # Compile the population cells now rather than on the first analysis
+        food_nps.PopulationIndex.for_dataset(data_store.version("food_population"), df)
         return {
             "message": "Food NPS population data uploaded successfully",
             "columns": df.columns.tolist(),
             "segments": len(df),
-            "total_weight": float(df['mem_rate'].sum())
+            "total_weight": float(df['mem_rate'].sum()),
+            "encoding": encoding,
+            "encoding_detection_ms": detection_ms
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Upload error: {str(e)}")
 
 
 @app.post("/food-nps/upload/coding")
-async def upload_food_coding(file: UploadFile = File(...)):
+async def upload_food_coding(http_request: Request, file: UploadFile = File(...)):
     """Upload category classification data for open-ended responses."""
-    content = await file.read()
+    upload = await ingest.spool_upload(file)
+    try:
+        return await compute.run(http_request, store_food_coding_upload, upload)
+    finally:
+        upload.close()
+
+
+def store_food_coding_upload(upload: ingest.SpooledUpload):
     try:
-        df = food_nps.load_food_coding_data(content, file.filename)
-        data_store["food_coding"] = df
+        encoding, detection_ms = ingest.sniff_encoding(upload.path, upload.sha256)
+        df = food_nps.load_food_coding_data(upload.path, upload.filename, encoding)
+        store_dataset("food_coding", df)
         return {
             "message": "Food NPS coding data uploaded successfully",
             "columns": df.columns.tolist(),
             "rows": len(df),
-            "unique_categories": df['category'].nunique() if 'category' in df.columns else 0
+            "unique_categories": df['category'].nunique() if 'category' in df.columns else 0,
+            "encoding": encoding,
+            "encoding_detection_ms": detection_ms
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Upload error: {str(e)}")
 
 
 @app.post("/food-nps/analyze")
-async def analyze_food_nps():
+async def analyze_food_nps(http_request: Request):
     """
     Analyze Korean food delivery NPS with demographic weighting.
 
@@ -805,6 +949,10 @@ async def analyze_food_nps():
     - Demographic breakdowns
     - Category response rates (if coding data available)
     """
+    return serialization.respond(http_request, await compute.run(http_request, perform_food_nps_analysis))
+
+
+def perform_food_nps_analysis():
     # Validate required data
     if data_store["food_qualtrics"] is None:
         raise HTTPException(status_code=400, detail="Food Qualtrics data not uploaded")
@@ -812,10 +960,12 @@ async def analyze_food_nps():
         raise HTTPException(status_code=400, detail="Food population data not uploaded")
 
     try:
+        population_df = data_store["food_population"]
         result = food_nps.calculate_food_nps_with_weighting(
             qualtrics_df=data_store["food_qualtrics"],
-            population_df=data_store["food_population"],
-            coding_df=data_store["food_coding"]
+            population_df=population_df,
+            coding_df=data_store["food_coding"],
+            population_index=food_nps.PopulationIndex.for_dataset(data_store.version("food_population"), population_df)
         )
         return result
     except Exception as e:
@@ -826,49 +976,85 @@ async def analyze_food_nps():
 async def get_food_nps_status():
     """Check which Food NPS data files have been uploaded."""
     return {
-        "qualtrics_uploaded": data_store["food_qualtrics"] is not None,
-        "population_uploaded": data_store["food_population"] is not None,
-        "coding_uploaded": data_store["food_coding"] is not None,
-        "qualtrics_rows": len(data_store["food_qualtrics"]) if data_store["food_qualtrics"] is not None else 0,
-        "population_segments": len(data_store["food_population"]) if data_store["food_population"] is not None else 0,
-        "coding_rows": len(data_store["food_coding"]) if data_store["food_coding"] is not None else 0
+        "qualtrics_uploaded": data_store.exists("food_qualtrics"),
+        "population_uploaded": data_store.exists("food_population"),
+        "coding_uploaded": data_store.exists("food_coding"),
+        "qualtrics_rows": data_store.rows("food_qualtrics"),
+        "population_segments": data_store.rows("food_population"),
+        "coding_rows": data_store.rows("food_coding"),
+        "storage": storage_report("food_qualtrics", "food_population", "food_coding")
     }
 
+class JobRequest(BaseModel):
+    kind: str  # "analyze", "response-rates" or "food-nps"
+    request: Optional[AnalysisRequest] = None
+
+# Job kind -> (analysis, whether it takes an AnalysisRequest)
+JOB_KINDS = {
+    "analyze": (analysis_results, True),
+    "response-rates": (response_rate_results, True),
+    "food-nps": (perform_food_nps_analysis, False),
+}
+
+@app.post("/jobs", status_code=202)
+async def create_job(job_request: JobRequest):
+    """
+    Starts an analysis in the background and returns its job id.
+
+    Follow progress with GET /jobs/{id} or the event stream at
+    GET /jobs/{id}/events, then fetch GET /jobs/{id}/result.
+    """
+    if job_request.kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind '{job_request.kind}'. Expected one of: {', '.join(JOB_KINDS)}")
+    func, takes_request = JOB_KINDS[job_request.kind]
+    if takes_request:
+        if job_request.request is None:
+            raise HTTPException(status_code=400, detail=f"Job kind '{job_request.kind}' requires a request")
+        job = job_manager.submit(job_request.kind, func, job_request.request)
+    else:
+        job = job_manager.submit(job_request.kind, func)
+    return job.snapshot()
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": job_manager.list(sessions.current_id())}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return job_manager.status(job_id)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, http_request: Request):
+    return serialization.respond(http_request, job_manager.result(job_id))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job_manager.get(job_id)
+    return StreamingResponse(
+        job_manager.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    return job_manager.cancel(job_id)
+
+def warm_up():
+    """
+    Reads the persisted datasets of the first settings.MAX_SESSIONS sessions
+    into memory, so the first analysis after a restart does not.
+    """
+    for session_id in session_registry.ids()[:settings.MAX_SESSIONS]:
+        start = time.perf_counter()
+        with metrics.stage("warm_up"):
+            loaded = session_registry.store(session_id).preload()
+        if loaded:
+            print(f"Warm-up: loaded {', '.join(loaded)} for session {session_id} in {time.perf_counter() - start:.2f}s", flush=True)
+
 if __name__ == "__main__":
-    import sys
-    import os
-    import tempfile
-    
-    # Write to a log file in the temp directory to avoid permission errors in .app bundle
-    log_dir = tempfile.gettempdir()
-    log_file = os.path.join(log_dir, "nps_backend_startup.log")
-    
-    try:
-        with open(log_file, "w") as f:
-            f.write(f"Starting backend from {os.getcwd()}...\n")
-            f.write(f"Executable: {sys.executable}\n")
-            
-        import uvicorn
-        import multiprocessing
-        
-        with open(log_file, "a") as f:
-            f.write("Imports successful.\n")
-            
-        multiprocessing.freeze_support()
-        
-        with open(log_file, "a") as f:
-            f.write("Starting uvicorn...\n")
-            
-        # Print to stdout so Electron can capture it too
-        print(f"Backend logging to {log_file}", flush=True)
-            
-        uvicorn.run(app, host="0.0.0.0", port=8000)
-    except Exception as e:
-        try:
-            with open(log_file, "a") as f:
-                f.write(f"Error: {str(e)}\n")
-                import traceback
-                traceback.print_exc(file=f)
-        except:
-            # If we can't even write to temp, just print to stderr
-            print(f"Critical Error: {e}", file=sys.stderr)
+    # Eager start: every module is imported before the server listens.
+    # The packaged backend starts through server.py, which answers /health
+    # while this module loads.
+    import server
+    server.serve(app)
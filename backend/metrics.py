@@ -0,0 +1,337 @@
+"""
+Timing of the backend's hot stages.
+
+Stages (load, merge, weighting, nps, category_stats, export, ...) are marked
+with the timed() decorator or the stage() context manager. Every run of a
+stage records its wall time in a latency histogram, the number of rows it
+worked on, and, when settings.METRICS_TRACE_MEMORY is on, the peak memory it
+allocated (traced with tracemalloc, which slows allocation-heavy code, hence
+off by default).
+
+GET /metrics exposes the histograms in the Prometheus text format, or as a
+JSON summary with ?format=json. Each request also collects its own stage
+timings, which the Server-Timing middleware in main.py returns as a header
+so the browser's network panel shows where a slow request spent its time.
+
+Stages nest (weighting runs inside an export, NPS inside subset weighting),
+so their times overlap rather than add up to the request total.
+"""
+
+import functools
+import itertools
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+import settings
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS gauge
+    resource = None
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Stage timings of the current request: [(stage, seconds)], or None outside a request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("metrics_request_timings", default=None)
+
+
+class Histogram:
+    """Latency histogram with row counts and peak memory, for one stage or route."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.max_rows = 0
+        self.peak_memory: Optional[int] = None
+        self.errors = 0
+
+    def observe(self, seconds: float, rows: Optional[int], peak_memory: Optional[int], failed: bool):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        if rows is not None:
+            self.rows += rows
+            self.max_rows = max(self.max_rows, rows)
+        if peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, peak_memory)
+        if failed:
+            self.errors += 1
+
+    def summary(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(BUCKETS, self.bucket_counts):
+            cumulative += count
+            buckets[f"{bound:g}"] = cumulative
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_s": round(self.sum, 6),
+            "mean_ms": round(1000 * self.sum / self.count, 3) if self.count else None,
+            "max_ms": round(1000 * self.max, 3),
+            "rows": self.rows,
+            "max_rows": self.max_rows,
+            "peak_memory_bytes": self.peak_memory,
+            "buckets": buckets
+        }
+
+
+class _MemoryTracker:
+    """
+    Peak traced memory per running stage. tracemalloc has one global peak,
+    so it is read and reset whenever a stage starts or ends; the peak of
+    each interval is credited to every stage running during it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[int, List[int]] = {}  # token -> [traced bytes at start, peak bytes]
+        self._tokens = itertools.count()
+
+    def _fold(self):
+        _, peak = tracemalloc.get_traced_memory()
+        for record in self._active.values():
+            record[1] = max(record[1], peak)
+        tracemalloc.reset_peak()
+
+    def enter(self) -> Optional[int]:
+        if not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            self._fold()
+            current, _ = tracemalloc.get_traced_memory()
+            token = next(self._tokens)
+            self._active[token] = [current, current]
+            return token
+
+    def exit(self, token: Optional[int]) -> Optional[int]:
+        """Bytes allocated above the stage's starting level at its peak."""
+        if token is None or not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            self._fold()
+            start, peak = self._active.pop(token)
+            return max(0, peak - start)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Histogram] = {}
+        self.requests: Dict[Tuple[str, str], Histogram] = {}  # (method, route) -> histogram
+        self.memory = _MemoryTracker()
+        self.started_at = time.time()
+
+    def observe_stage(self, name: str, seconds: float, rows: Optional[int] = None, peak_memory: Optional[int] = None, failed: bool = False):
+        with self._lock:
+            self.stages.setdefault(name, Histogram()).observe(seconds, rows, peak_memory, failed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+    def observe_request(self, method: str, route: str, seconds: float, failed: bool):
+        with self._lock:
+            self.requests.setdefault((method, route), Histogram()).observe(seconds, None, None, failed)
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.requests.clear()
+            self.started_at = time.time()
+
+
+registry = Registry()
+
+
+def start_memory_tracing():
+    if settings.METRICS_TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _row_count(value: Any) -> Optional[int]:
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], (pd.DataFrame, pd.Series)):
+        return len(value[0])
+    return None
+
+
+class StageRun:
+    """A running stage; set rows if the stage knows how many it processed."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: Optional[int] = None
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[StageRun]:
+    run = StageRun(name)
+    run.rows = rows
+    token = registry.memory.enter()
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield run
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe_stage(name, elapsed, run.rows, registry.memory.exit(token), failed)
+
+
+def timed(name: str, rows: str = "input") -> Callable:
+    """
+    Decorator recording every call of the function as a run of the stage.
+    rows counts the first DataFrame argument ("input") or the returned
+    DataFrame ("result").
+    """
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as run:
+                if rows == "input":
+                    run.rows = next((n for n in map(_row_count, list(args) + list(kwargs.values())) if n is not None), None)
+                result = func(*args, **kwargs)
+                if rows == "result":
+                    run.rows = _row_count(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def timed_iter(name: str, chunks: Iterator[bytes], rows: Optional[int] = None) -> Iterator[bytes]:
+    """Passes chunks through, recording the time spent producing them as a run of the stage."""
+    elapsed = 0.0
+    failed = False
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            yield chunk
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        registry.observe_stage(name, elapsed, rows, None, failed)
+
+
+@contextmanager
+def collect_request_timings() -> Iterator[List[Tuple[str, float]]]:
+    """Collects the stage timings of the work done inside (including work offloaded with compute)."""
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing(timings: List[Tuple[str, float]], total_s: float) -> str:
+    """Server-Timing header value: total duration per stage, in the order stages first finished."""
+    durations: Dict[str, List[float]] = {}
+    for name, seconds in list(timings):
+        durations.setdefault(name, []).append(seconds)
+    entries = []
+    for name, values in durations.items():
+        entry = f"{name};dur={1000 * sum(values):.1f}"
+        if len(values) > 1:
+            entry += f';desc="{len(values)} runs"'
+        entries.append(entry)
+    entries.append(f"total;dur={1000 * total_s:.1f}")
+    return ", ".join(entries)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summary(gauges: Optional[Dict[str, float]] = None) -> dict:
+    with registry._lock:
+        stages = {name: hist.summary() for name, hist in sorted(registry.stages.items())}
+        requests = {f"{method} {route}": hist.summary() for (method, route), hist in sorted(registry.requests.items())}
+    return {
+        "uptime_s": round(time.time() - registry.started_at, 1),
+        "memory_tracing": tracemalloc.is_tracing(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "stages": stages,
+        "requests": requests,
+        "gauges": gauges or {}
+    }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _histogram_lines(metric: str, labels: str, hist: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS, hist.bucket_counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    lines.append(f"{metric}_sum{{{labels}}} {hist.sum:.6f}")
+    lines.append(f"{metric}_count{{{labels}}} {hist.count}")
+    return lines
+
+
+def prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with registry._lock:
+        stages = sorted(registry.stages.items())
+        requests = sorted(registry.requests.items())
+
+        lines = [
+            "# HELP nps_stage_duration_seconds Wall time of backend stages.",
+            "# TYPE nps_stage_duration_seconds histogram",
+        ]
+        for name, hist in stages:
+            lines += _histogram_lines("nps_stage_duration_seconds", f'stage="{_label(name)}"', hist)
+
+        lines += ["# HELP nps_stage_rows_total Rows processed by backend stages.", "# TYPE nps_stage_rows_total counter"]
+        lines += [f'nps_stage_rows_total{{stage="{_label(name)}"}} {hist.rows}' for name, hist in stages]
+
+        lines += ["# HELP nps_stage_errors_total Stage runs that raised.", "# TYPE nps_stage_errors_total counter"]
+        lines += [f'nps_stage_errors_total{{stage="{_label(name)}"}} {hist.errors}' for name, hist in stages]
+
+        traced = [(name, hist) for name, hist in stages if hist.peak_memory is not None]
+        if traced:
+            lines += ["# HELP nps_stage_peak_memory_bytes Largest memory allocated by one run of a stage.", "# TYPE nps_stage_peak_memory_bytes gauge"]
+            lines += [f'nps_stage_peak_memory_bytes{{stage="{_label(name)}"}} {hist.peak_memory}' for name, hist in traced]
+
+        lines += ["# HELP nps_request_duration_seconds Wall time of HTTP requests until the response starts.", "# TYPE nps_request_duration_seconds histogram"]
+        for (method, route), hist in requests:
+            lines += _histogram_lines("nps_request_duration_seconds", f'method="{method}",route="{_label(route)}"', hist)
+
+    peak_rss = peak_rss_bytes()
+    if peak_rss is not None:
+        lines += ["# HELP nps_process_peak_rss_bytes Peak resident memory of the backend process.", "# TYPE nps_process_peak_rss_bytes gauge", f"nps_process_peak_rss_bytes {peak_rss}"]
+    for name, value in (gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,285 @@
+"""
+Sampling profiler for slow requests.
+
+A request is profiled when settings.PROFILE_REQUESTS is on, when it asks
+with ?profile=1, or, after the fact, when it takes longer than
+settings.PROFILE_SLOW_MS: every request collects samples while it runs and
+keeps them only if it turned out slow (or was asked to be profiled).
+
+The work of a request runs on several threads (the event loop, the compute
+pool, the subset-weighting pool, the threads streaming an export), so
+cProfile, which only sees the thread that enabled it, would miss most of it.
+Instead each request opens a Session; code running for the request joins it
+with thread_scope() (compute.submit, subset_weighting.map_subsets and
+iterate() do so), and one sampler thread records the stacks of the joined
+threads every settings.PROFILE_INTERVAL_MS. The event loop thread is shared
+by concurrent requests, so its samples may include other requests' work.
+
+Profiles are saved as speedscope files (https://www.speedscope.app, one
+profile per thread) named nps_profile_*.speedscope.json in
+settings.PROFILE_DIR, next to nps_backend_startup.log; the newest
+settings.PROFILE_HISTORY are kept. GET /debug/profiles lists them.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import settings
+
+PROFILE_PREFIX = "nps_profile_"
+PROFILE_SUFFIX = ".speedscope.json"
+
+# Frame key: (function, file, first line)
+FrameKey = Tuple[str, str, int]
+
+_session: ContextVar[Optional["Session"]] = ContextVar("profiling_session", default=None)
+
+
+class Session:
+    """Samples collected for one request."""
+
+    def __init__(self, label: str, origin: int):
+        self.label = label
+        self.origin = origin  # thread that opened the session (the event loop)
+        self.started_at = time.time()
+        self.closed = False
+        self.threads: Dict[int, int] = {}  # thread ident -> nesting depth
+        self.thread_names: Dict[int, str] = {}
+        self.samples: Counter = Counter()  # (thread ident, stack of frame keys) -> count
+        self._lock = threading.Lock()
+
+    def attach(self, ident: int):
+        with self._lock:
+            if not self.closed:
+                self.threads[ident] = self.threads.get(ident, 0) + 1
+                self.thread_names.setdefault(ident, threading.current_thread().name)
+
+    def detach(self, ident: int):
+        with self._lock:
+            depth = self.threads.get(ident, 0) - 1
+            if depth > 0:
+                self.threads[ident] = depth
+            else:
+                self.threads.pop(ident, None)
+
+    def sample(self, frames: Dict[int, Any]):
+        with self._lock:
+            for ident in self.threads:
+                if ident in frames:
+                    self.samples[(ident, _stack(frames[ident]))] += 1
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self.threads.clear()
+
+
+def _stack(frame) -> Tuple[FrameKey, ...]:
+    """Frames from the outermost call to the innermost."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class Sampler:
+    """One daemon thread sampling the threads of every open session."""
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._sessions: List[Session] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, session: Session):
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, session: Session):
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+            if not sessions:
+                # Idle until the next session opens
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames)
+            del frames
+            time.sleep(self.interval_s)
+
+
+_sampler: Optional[Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler() -> Sampler:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = Sampler(settings.PROFILE_INTERVAL_MS / 1000)
+        return _sampler
+
+
+def enabled() -> bool:
+    """Whether requests are sampled at all (always, on demand or above the slow threshold)."""
+    return settings.PROFILE_REQUESTS or settings.PROFILE_SLOW_MS > 0
+
+
+def start(label: str) -> Session:
+    """Opens a session for the current context (the request) and joins the calling thread to it."""
+    session = Session(label, threading.get_ident())
+    _session.set(session)
+    session.attach(session.origin)
+    get_sampler().add(session)
+    return session
+
+
+def stop(session: Session):
+    get_sampler().remove(session)
+    session.close()
+
+
+@contextmanager
+def thread_scope() -> Iterator[None]:
+    """Samples the calling thread for the current request's session, if it has one."""
+    session = _session.get()
+    if session is None:
+        yield
+        return
+    ident = threading.get_ident()
+    session.attach(ident)
+    try:
+        yield
+    finally:
+        session.detach(ident)
+
+
+def call_in_scope(func: Callable[..., Any], *args, **kwargs) -> Any:
+    with thread_scope():
+        return func(*args, **kwargs)
+
+
+def iterate(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Passes chunks through, sampling whichever thread produces each one."""
+    while True:
+        with thread_scope():
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def speedscope(session: Session, duration_s: float) -> dict:
+    """The session's samples as a speedscope file, one sampled profile per thread."""
+    interval_ms = settings.PROFILE_INTERVAL_MS
+    frame_index: Dict[FrameKey, int] = {}
+    frames = []
+    by_thread: Dict[int, Tuple[list, list]] = {}
+    for (ident, stack), count in session.samples.items():
+        indices = []
+        for key in stack:
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({"name": key[0], "file": key[1], "line": key[2]})
+            indices.append(frame_index[key])
+        samples, weights = by_thread.setdefault(ident, ([], []))
+        samples.append(indices)
+        weights.append(count * interval_ms)
+
+    # Worker threads first, busiest first, so speedscope opens on the work
+    # rather than on the event loop waiting for it
+    order = sorted(by_thread, key=lambda ident: (ident == session.origin, -sum(by_thread[ident][1])))
+    profiles = []
+    for ident in order:
+        samples, weights = by_thread[ident]
+        profiles.append({
+            "type": "sampled",
+            "name": session.thread_names.get(ident, str(ident)),
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{session.label} ({1000 * duration_s:.0f} ms)",
+        "exporter": "nps-backend",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": profiles
+    }
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-").lower()[:60]
+
+
+def save(session: Session, duration_s: float) -> Optional[str]:
+    """Writes the session's profile to settings.PROFILE_DIR; returns its file name."""
+    if not session.samples:
+        return None
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started_at))
+    name = f"{PROFILE_PREFIX}{stamp}_{_slug(session.label)}_{1000 * duration_s:.0f}ms{PROFILE_SUFFIX}"
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(settings.PROFILE_DIR, name), "w") as f:
+        json.dump(speedscope(session, duration_s), f)
+    _trim()
+    return name
+
+
+def list_profiles() -> List[dict]:
+    """Saved profiles, newest first."""
+    try:
+        names = [name for name in os.listdir(settings.PROFILE_DIR) if name.startswith(PROFILE_PREFIX) and name.endswith(PROFILE_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(settings.PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue
+        profiles.append({"name": name, "size": stat.st_size, "created_at": stat.st_mtime})
+    profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+    return profiles
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a saved profile, or None for names that are not one."""
+    if os.path.basename(name) != name or not (name.startswith(PROFILE_PREFIX) and name.endswith(PROFILE_SUFFIX)):
+        return None
+    path = os.path.join(settings.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _trim():
+    for profile in list_profiles()[settings.PROFILE_HISTORY:]:
+        try:
+            os.remove(os.path.join(settings.PROFILE_DIR, profile["name"]))
+        except OSError:
+            pass
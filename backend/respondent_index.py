@@ -0,0 +1,229 @@
+"""
+Respondent-level index over multi-row (merged) survey data.
+
+The merged dataset has one row per coded mention, so bases, response rates
+and category incidence must count each respondent once. RespondentIndex maps
+every row to an integer respondent position once per dataset (with CSR-style
+offsets into the rows) and keeps one NPS bucket code per respondent. NPS
+segments are then boolean masks over respondents with their own weights, and
+every statistic is a bincount over these arrays instead of a filtered copy of
+the DataFrame followed by drop_duplicates on the ID.
+"""
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from typing import Dict, NamedTuple, Optional
+import analysis
+import metrics
+
+# NPS bucket codes per respondent
+NO_SCORE = -1
+AT_RISK = 0      # 0-3
+DETRACTOR = 1    # 4-6
+PASSIVE = 2      # 7-8
+PROMOTER = 3     # 9-10
+
+# Segment name -> bucket codes it contains, in result order after "Overall"
+NPS_SEGMENTS = {
+    "Promoters (9-10)": (PROMOTER,),
+    "Passives (7-8)": (PASSIVE,),
+    "Detractors (0-6)": (AT_RISK, DETRACTOR),
+    "At-Risk (0-3)": (AT_RISK,),
+}
+
+# Indexes kept for recently analysed datasets
+INDEX_CACHE_SIZE = 8
+
+_index_cache: "OrderedDict[tuple, RespondentIndex]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+class Segment(NamedTuple):
+    members: np.ndarray              # bool per respondent
+    weights: Optional[np.ndarray]    # float per respondent, None when unweighted
+
+
+def nps_buckets(values) -> np.ndarray:
+    """Bucket code per value, using the same thresholds as the segment filters."""
+    scores = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    buckets = np.full(len(scores), NO_SCORE, dtype=np.int8)
+    buckets[scores >= 9] = PROMOTER
+    buckets[(scores >= 7) & (scores <= 8)] = PASSIVE
+    buckets[scores <= 6] = DETRACTOR
+    buckets[scores <= 3] = AT_RISK
+    return buckets
+
+
+def _non_empty(series: pd.Series) -> np.ndarray:
+    """Rows whose value is present and not blank; the string check runs once per distinct value."""
+    codes, uniques = pd.factorize(series)
+    filled = pd.Series(uniques, dtype='object').astype(str).str.strip() != ''
+    # Code -1 (missing) picks the trailing False
+    return np.append(filled.to_numpy(), False)[codes]
+
+
+class RespondentIndex:
+    def __init__(self, df: pd.DataFrame, id_column: Optional[str] = None, nps_column: Optional[str] = None):
+        self.id_column = id_column if id_column and id_column in df.columns else None
+        n_rows = len(df)
+
+        if self.id_column:
+            codes, ids = pd.factorize(df[self.id_column])
+            # Rows without an ID are never counted by nunique(); each becomes its
+            # own respondent so it still lands in the segment of its own NPS score
+            missing = codes < 0
+            codes[missing] = len(ids) + np.arange(np.count_nonzero(missing))
+            self.ids = pd.Index(np.concatenate([np.asarray(ids, dtype=object), np.full(np.count_nonzero(missing), None, dtype=object)]))
+            self.has_id = np.arange(len(self.ids)) < len(ids)
+        else:
+            # Without an ID column every row is its own respondent
+            codes = np.arange(n_rows)
+            self.ids = None
+            self.has_id = np.ones(n_rows, dtype=bool)
+
+        self.row_respondent = codes.astype(np.int64)
+        self.n_respondents = len(self.has_id)
+
+        # Rows of respondent r are row_order[offsets[r]:offsets[r + 1]]
+        self.row_order = np.argsort(self.row_respondent, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.row_respondent, minlength=self.n_respondents))])
+        self.first_row = self.row_order[self.offsets[:-1]]
+
+        self.buckets = None
+        if nps_column and nps_column in df.columns:
+            self.buckets = nps_buckets(df[nps_column].to_numpy()[self.first_row])
+
+    @classmethod
+    @metrics.timed("index")
+    def for_dataset(cls, version: Optional[str], df: pd.DataFrame, id_column: Optional[str] = None, nps_column: Optional[str] = None) -> "RespondentIndex":
+        """Returns the index for a stored dataset version, building it on first use."""
+        if version is None:
+            return cls(df, id_column, nps_column)
+
+        key = (version, id_column, nps_column)
+        with _index_cache_lock:
+            index = _index_cache.get(key)
+            if index is not None:
+                _index_cache.move_to_end(key)
+                return index
+
+        index = cls(df, id_column, nps_column)
+        with _index_cache_lock:
+            _index_cache[key] = index
+            while len(_index_cache) > INDEX_CACHE_SIZE:
+                _index_cache.popitem(last=False)
+        return index
+
+    # --- weights and segments ------------------------------------------
+
+    def map_weights(self, weight_map: pd.Series) -> np.ndarray:
+        """Per-respondent weights looked up by ID (NaN where the ID has no weight)."""
+        return weight_map.reindex(self.ids).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def column_weights(self, df: pd.DataFrame, column: str) -> np.ndarray:
+        """Per-respondent weights from a weight column, taken from each respondent's first row."""
+        values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)[self.first_row]
+        return np.nan_to_num(values, nan=0.0)
+
+    def member_ids(self, members: np.ndarray) -> pd.Index:
+        return self.ids[members]
+
+    @metrics.timed("nps")
+    def nps_segments(self, overall: Segment) -> Dict[str, Segment]:
+        """Overall plus the Promoter/Passive/Detractor/At-Risk segments of its members."""
+        segments = {"Overall": overall}
+        if self.buckets is None:
+            return segments
+        for name, codes in NPS_SEGMENTS.items():
+            segments[name] = Segment(overall.members & np.isin(self.buckets, codes), overall.weights)
+        return segments
+
+    def base(self, segment: Segment):
+        """Respondent count (or total weight) of a segment."""
+        if segment.weights is None:
+            return int(np.count_nonzero(segment.members & self.has_id))
+        return segment.weights[segment.members].sum()
+
+    @metrics.timed("category_stats")
+    def answers(self, df: pd.DataFrame, column: str, parent_column: Optional[str] = None) -> "ColumnAnswers":
+        return ColumnAnswers(self, df, column, parent_column)
+
+
+class ColumnAnswers:
+    """
+    Coded answers of one open-end column, laid out for per-segment
+    response rates and category incidence.
+    """
+
+    def __init__(self, index: RespondentIndex, df: pd.DataFrame, column: str, parent_column: Optional[str] = None):
+        self.index = index
+        self.present = column in df.columns
+        if not self.present:
+            return
+
+        self.has_parent = bool(parent_column and parent_column in df.columns)
+        self.key_columns = [parent_column, column] if self.has_parent else [column]
+
+        valid_rows = np.flatnonzero(_non_empty(df[column]))
+        respondent = index.row_respondent[valid_rows]
+        self.answered = np.bincount(respondent, minlength=index.n_respondents) > 0
+
+        # One entry per (respondent, category) pair, in order of its first row
+        group = analysis.category_groups(df[self.key_columns].iloc[valid_rows], self.key_columns)
+        n_groups = int(group.max()) + 1 if len(group) else 0
+        first = ~pd.Series(respondent * max(n_groups, 1) + group).duplicated().to_numpy()
+        self.pair_respondent = respondent[first]
+        self.pair_group = group[first]
+        self.pair_row = valid_rows[first]
+        self.n_groups = n_groups
+        self.key_values = [df[col].to_numpy() for col in self.key_columns]
+
+    def response_rate(self, segment: Segment) -> float:
+        """Share of the segment's respondents with at least one non-empty answer."""
+        if not self.present:
+            return 0.0
+        total = self.index.base(segment)
+        if total == 0:
+            return 0.0
+        responded = segment.members & self.answered
+        if segment.weights is None:
+            count = int(np.count_nonzero(responded & self.index.has_id))
+        else:
+            count = segment.weights[responded].sum()
+        return round((count / total) * 100, 1)
+
+    @metrics.timed("category_stats")
+    def category_stats(self, segment: Segment) -> dict:
+        """Same result as analysis.calculate_category_stats on the segment's rows."""
+        if not self.present:
+            return {}
+        total_base = self.index.base(segment)
+        if total_base == 0:
+            return {}
+
+        selected = segment.members[self.pair_respondent]
+        if not selected.any():
+            return {}
+        respondent = self.pair_respondent[selected]
+        group = self.pair_group[selected]
+
+        if segment.weights is None:
+            counted = self.index.has_id[respondent]
+            counts = np.bincount(group[counted], minlength=self.n_groups)
+        else:
+            counts = np.bincount(group, weights=segment.weights[respondent], minlength=self.n_groups)
+
+        # Categories in order of their first row within the segment
+        groups, first = np.unique(group, return_index=True)
+        order = np.argsort(first, kind='stable')
+        groups = groups[order]
+        rows = self.pair_row[selected][first[order]]
+
+        keys = list(zip(*(values[rows] for values in self.key_values)))
+        if segment.weights is None:
+            group_counts = [int(counts[g]) for g in groups]
+        else:
+            group_counts = [counts[g] for g in groups]
+        return analysis.format_category_stats(group_counts, keys, total_base, self.has_parent, segment.weights is not None)
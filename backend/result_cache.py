@@ -0,0 +1,106 @@
+"""
+LRU cache for analysis results.
+
+Entries are keyed on the kind of analysis, a hash of the canonicalized
+request and the content hashes of the datasets it reads, so a re-posted
+request (or an export right after an analyze) is answered without
+recomputing. Memory is bounded by the approximate JSON size of the cached
+results.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from pydantic import BaseModel
+
+
+def fingerprint(kind: str, request: Optional[BaseModel], versions: Dict[str, Optional[str]]) -> str:
+    """Stable key for (analysis kind, request body, dataset versions)."""
+    payload = {
+        "kind": kind,
+        "request": request.model_dump(mode="json") if request is not None else None,
+        "versions": versions
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _approximate_size(value: Any) -> int:
+    # Arrays (cached respondent weights) by their buffers, not their repr
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, tuple) and any(isinstance(item, np.ndarray) for item in value):
+        return sum(_approximate_size(item) for item in value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, datasets)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, kind: str, request: Optional[BaseModel], versions: Dict[str, Optional[str]], compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached result for this request and dataset versions, or
+        calls compute() and caches what it returns. Exceptions are not cached.
+        """
+        key = fingerprint(kind, request, versions)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = compute()
+        self._put(key, value, set(versions))
+        return value
+
+    def _put(self, key: str, value: Any, datasets: set):
+        size = _approximate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, datasets)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, dataset: Optional[str] = None):
+        """Drops entries that read the given dataset, or everything if None."""
+        with self._lock:
+            if dataset is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [k for k, (_, _, datasets) in self._entries.items() if dataset in datasets]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,104 @@
+"""
+Numeric codes for labelled scale columns.
+
+Survey exports often carry scale answers as labels ("7 - Extremely
+satisfied") instead of numbers. When a dataset is stored, each labelled
+column with few distinct values is mapped once to a compact int8 column, so
+analysis reads ready-made codes instead of running a regex over every row on
+every request.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Tuple
+
+# Code stored for missing or non-numeric labels
+MISSING = -128
+# Columns with more distinct labels than this are not treated as scales
+SCALE_MAX_LABELS = 64
+
+
+def codes_name(dataset: str) -> str:
+    """Store name of the scale codes kept alongside a dataset."""
+    return f"{dataset}.scales"
+
+
+def _label_values(labels: pd.Series) -> np.ndarray:
+    """Numeric value of each label: the label itself if numeric, otherwise its first integer."""
+    numeric = pd.to_numeric(labels, errors='coerce')
+    extracted = pd.to_numeric(labels.astype(str).str.extract(r'(\d+)', expand=False), errors='coerce')
+    return numeric.fillna(extracted).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def extract_scale_values(series: pd.Series) -> pd.Series:
+    """
+    Converts a column to numbers, reading labels like "7 - Extremely satisfied"
+    as 7. The label parsing runs once per distinct value, not once per row.
+    """
+    if series.dtype != 'object' and not isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.to_numeric(series, errors='coerce')
+
+    codes, labels = pd.factorize(series)
+    values = _label_values(pd.Series(labels, dtype='object'))
+    result = np.full(len(series), np.nan)
+    present = codes >= 0
+    result[present] = values[codes[present]]
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+def scale_mapping(series: pd.Series) -> Optional[Dict[str, int]]:
+    """
+    {label: code} for a labelled scale column, or None if the column is not
+    one (not text, too many distinct values, or values outside int8).
+    Labels without a number map to MISSING.
+    """
+    if series.dtype != 'object':
+        return None
+
+    labels = pd.unique(series.dropna())
+    if len(labels) == 0 or len(labels) > SCALE_MAX_LABELS:
+        return None
+    if not all(isinstance(label, str) for label in labels):
+        return None
+
+    labels = pd.Series(labels, dtype='object')
+    # Plain numeric text is parsed fine by to_numeric; only labelled columns need codes
+    if pd.to_numeric(labels, errors='coerce').notna().all():
+        return None
+
+    values = _label_values(labels)
+    known = ~np.isnan(values)
+    if not known.any():
+        return None
+    if (values[known] != np.floor(values[known])).any() or (np.abs(values[known]) > 127).any():
+        return None
+
+    return {
+        label: int(value) if not np.isnan(value) else MISSING
+        for label, value in zip(labels, values)
+    }
+
+
+def encode_scales(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Dict[str, int]]]:
+    """
+    Int8 codes for every labelled scale column of df (same index as df),
+    together with the label mapping used for each column.
+    """
+    codes = {}
+    mappings = {}
+    for col in df.columns:
+        mapping = scale_mapping(df[col])
+        if mapping is None:
+            continue
+        codes[str(col)] = df[col].map(mapping).fillna(MISSING).astype(np.int8)
+        mappings[str(col)] = mapping
+    return pd.DataFrame(codes, index=df.index), mappings
+
+
+def code_values(codes: pd.Series, index: pd.Index) -> np.ndarray:
+    """Float values (NaN for MISSING) of stored codes, aligned to the rows of index."""
+    if not codes.index.equals(index):
+        codes = codes.reindex(index, fill_value=MISSING)
+    values = codes.to_numpy().astype(np.float64)
+    values[values == MISSING] = np.nan
+    return values
@@ -0,0 +1,103 @@
+"""
+Shared segment keying for weighting.
+
+Segment columns are normalized once per column (whitespace removed, on the
+unique values only) into pandas Categoricals, then combined into a single
+integer cell id with a mixed-radix code. The "A_B_C" label used by targets
+and API responses is decoded only for the cells that are actually needed.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+
+def normalize_column(series: pd.Series) -> pd.Categorical:
+    """
+    Normalizes a segment column into a Categorical whose categories are the
+    whitespace-stripped string labels (e.g. "20대 이하" -> "20대이하").
+    Values that collapse to the same label share a code. Missing values map
+    to the label "nan", matching the previous astype(str) behaviour.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Already encoded at ingest: reuse the codes, normalize only the categories
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+
+    labels = pd.Index(uniques).astype(str).str.replace(r'\s+', '', regex=True)
+    labels = labels.append(pd.Index(['nan']))
+    codes = np.where(codes < 0, len(labels) - 1, codes)
+
+    # Distinct raw values may normalize to the same label
+    label_codes, categories = pd.factorize(labels)
+    codes = label_codes[codes]
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+class SegmentKeys:
+    """Integer cell ids for the combination of several segment columns."""
+
+    def __init__(self, columns: List[str], categoricals: List[pd.Categorical]):
+        self.columns = columns
+        self.categoricals = categoricals
+        self.radices = [max(len(cat.categories), 1) for cat in categoricals]
+
+        # Mixed radix: the first column is the most significant digit
+        self.strides = []
+        stride = 1
+        for radix in reversed(self.radices):
+            self.strides.append(stride)
+            stride *= radix
+        self.strides.reverse()
+
+        cell_ids = np.zeros(len(categoricals[0]) if categoricals else 0, dtype=np.int64)
+        for cat, stride in zip(categoricals, self.strides):
+            cell_ids += cat.codes.astype(np.int64) * stride
+        self.cell_ids = cell_ids
+
+    @property
+    def codes(self) -> np.ndarray:
+        """(n_rows, n_columns) matrix of per-column category codes."""
+        if not self.categoricals:
+            return np.empty((0, 0), dtype=np.int64)
+        return np.column_stack([cat.codes.astype(np.int64) for cat in self.categoricals])
+
+    def factorize(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (cells, inverse): the distinct cell ids present, and for every
+        row the dense position of its cell in `cells`.
+        """
+        inverse, cells = pd.factorize(self.cell_ids)
+        return np.asarray(cells, dtype=np.int64), inverse
+
+    def components(self, cells: np.ndarray) -> List[Tuple[str, ...]]:
+        """Decodes cell ids into per-column label tuples."""
+        cells = np.asarray(cells, dtype=np.int64)
+        parts = []
+        for cat, stride, radix in zip(self.categoricals, self.strides, self.radices):
+            labels = np.asarray(cat.categories, dtype=object)
+            parts.append(labels[(cells // stride) % radix])
+        return list(zip(*parts))
+
+    def decode(self, cells: np.ndarray) -> List[str]:
+        """Decodes cell ids into "A_B_C" labels."""
+        return ['_'.join(parts) for parts in self.components(cells)]
+
+    def sums(self, weights: np.ndarray = None) -> Dict[str, float]:
+        """Row counts (or weight sums) per cell, keyed by decoded label."""
+        cells, inverse = self.factorize()
+        totals = np.bincount(inverse, weights=weights, minlength=len(cells))
+        return dict(zip(self.decode(cells), totals.tolist()))
+
+
+def encode_segments(df: pd.DataFrame, segment_columns: List[str]) -> SegmentKeys:
+    """Builds SegmentKeys for the given columns of df."""
+    missing = [col for col in segment_columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+    return SegmentKeys(
+        list(segment_columns),
+        [normalize_column(df[col]) for col in segment_columns]
+    )
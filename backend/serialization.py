@@ -0,0 +1,152 @@
+"""
+Response encodings for analysis results.
+
+Results are nested dicts whose bulk is table-shaped: lists of records
+(demographic_breakdown, weighting_report, ...) and dicts of records keyed by
+category (category_stats). The client picks an encoding with the Accept
+header:
+
+- application/json (default): the result as is, serialized with orjson
+  when it is installed. FastAPI's jsonable_encoder pass is skipped.
+- application/vnd.nps.columnar+json: the same document with every table
+  replaced by {"$table": {field: [values...]}} (plus "$index": [keys] for
+  dicts of records), so field names are not repeated per row.
+- application/vnd.apache.arrow.stream: one table of the result as an Arrow
+  IPC stream, selected with ?table=<dotted.path>; dicts of records get their
+  keys in a "key" column.
+
+Every encoding answers with "Vary: Accept".
+"""
+
+import io
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Falls back to FastAPI's JSON encoding
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow responses are unavailable without pyarrow
+    pa = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.nps.columnar+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return jsonable_encoder(value)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    class DefaultResponse(JSONResponse):
+        """JSONResponse rendered with orjson (FastAPI's ORJSONResponse is deprecated)."""
+
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content, default=_json_default, option=_ORJSON_OPTIONS)
+else:
+    DefaultResponse = JSONResponse
+
+
+def _scalar(value: Any) -> bool:
+    return not isinstance(value, (dict, list, tuple))
+
+
+def _records(rows: List[Any]) -> bool:
+    """True for a non-empty list of flat dicts that all have the same fields in the same order."""
+    if not rows or not isinstance(rows[0], dict):
+        return False
+    fields = list(rows[0])
+    return all(
+        isinstance(row, dict) and list(row) == fields and all(_scalar(v) for v in row.values())
+        for row in rows
+    )
+
+
+def _table_columns(rows: List[dict]) -> Dict[str, list]:
+    """Arrays per field of records that share their fields."""
+    return {field: [row[field] for row in rows] for field in rows[0]}
+
+
+def to_columnar(value: Any) -> Any:
+    """value with every list or dict of flat records replaced by its columns."""
+    if isinstance(value, list):
+        if _records(value):
+            return {"$table": _table_columns(value)}
+        return [to_columnar(item) for item in value]
+    if isinstance(value, dict):
+        if _records(list(value.values())):
+            return {"$index": list(value.keys()), "$table": _table_columns(list(value.values()))}
+        return {key: to_columnar(item) for key, item in value.items()}
+    return value
+
+
+def find_table(value: Any, path: str) -> Tuple[List[dict], Optional[list]]:
+    """The records (and keys, for a dict of records) at a dotted path of a result."""
+    for part in path.split(".") if path else []:
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            raise HTTPException(status_code=404, detail=f"No table at '{path}'")
+    if isinstance(value, list) and _records(value):
+        return value, None
+    if isinstance(value, dict) and _records(list(value.values())):
+        return list(value.values()), list(value.keys())
+    raise HTTPException(status_code=400, detail=f"'{path}' is not a table")
+
+
+def json_response(payload: Any) -> Response:
+    if orjson is None:
+        return JSONResponse(jsonable_encoder(payload))
+    return Response(orjson.dumps(payload, default=_json_default, option=_ORJSON_OPTIONS), media_type=JSON)
+
+
+def arrow_response(payload: Any, path: Optional[str]) -> Response:
+    if pa is None:
+        raise HTTPException(status_code=406, detail="Arrow responses require pyarrow")
+    if not path:
+        raise HTTPException(status_code=400, detail="Arrow responses need ?table=<path> naming one table of the result")
+
+    rows, keys = find_table(payload, path)
+    columns = _table_columns(rows)
+    if keys is not None:
+        key_column = "key" if "key" not in columns else "_key"
+        columns = {key_column: keys, **columns}
+    try:
+        table = pa.Table.from_pydict({
+            str(field): [v.item() if isinstance(v, np.generic) else v for v in values]
+            for field, values in columns.items()
+        })
+    except (pa.ArrowTypeError, pa.ArrowInvalid) as e:
+        raise HTTPException(status_code=400, detail=f"'{path}' cannot be encoded as Arrow: {str(e)}")
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue(), media_type=ARROW_STREAM)
+
+
+def respond(request: Request, payload: Any) -> Response:
+    """Encodes an analysis result in the format named by the request's Accept header."""
+    accept = request.headers.get("accept", "")
+    if ARROW_STREAM in accept:
+        response = arrow_response(payload, request.query_params.get("table"))
+    elif COLUMNAR_JSON in accept:
+        response = json_response(to_columnar(payload))
+        response.headers["content-type"] = COLUMNAR_JSON
+    else:
+        response = json_response(payload)
+    response.headers["vary"] = "Accept"
+    return response
@@ -0,0 +1,156 @@
+"""
+Entry point of the packaged backend, with fast start.
+
+Importing main pulls in pandas, NumPy, pyarrow, openpyxl and the analysis
+modules, which takes several seconds on a cold laptop. Rather than listen
+only once all of that is loaded, the server starts straight away with a
+small ASGI app (FastStartApp) that:
+
+- answers GET /health at once, with "ready": false until main has loaded,
+- imports main on a background thread, then warms it up (main.warm_up
+  reads the persisted datasets),
+- holds every other request until main.app is loaded and hands it over.
+
+Electron shows the window as soon as /health answers; the first requests
+from the UI simply wait for the import to finish instead of failing.
+
+The launcher leaves the server running between app launches; serve()
+stops it after settings.IDLE_SHUTDOWN_S idle or on POST /shutdown (see
+lifecycle.py).
+
+Run `python server.py` (what the PyInstaller build starts), or
+`python main.py` to import everything before listening.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Optional
+from urllib.parse import parse_qs
+import settings
+import lifecycle
+
+# Written to the temp directory to avoid permission errors in the .app bundle
+LOG_FILE = os.path.join(tempfile.gettempdir(), "nps_backend_startup.log")
+
+_started = time.perf_counter()
+
+
+def log(message: str, mode: str = "a"):
+    try:
+        with open(LOG_FILE, mode) as f:
+            f.write(f"[{time.perf_counter() - _started:7.3f}s] {message}\n")
+    except OSError:
+        pass
+
+
+class FastStartApp:
+    """ASGI app serving /health while main loads, then delegating to main.app."""
+
+    def __init__(self):
+        self.app = None
+        self.error: Optional[BaseException] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start_loading(self):
+        if self._ready is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        threading.Thread(target=self._load, name="warm-up", daemon=True).start()
+
+    def _load(self):
+        start = time.perf_counter()
+        main = None
+        try:
+            import main
+            self.app = main.app
+            log(f"Loaded analysis modules in {time.perf_counter() - start:.2f}s")
+            print(f"Backend ready in {time.perf_counter() - _started:.2f}s", flush=True)
+        except BaseException as e:
+            self.error = e
+            log(f"Error loading analysis modules: {e}\n{traceback.format_exc()}")
+            print(f"Critical Error: {e}", file=sys.stderr, flush=True)
+        finally:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+        if main is not None:
+            try:
+                main.warm_up()
+            except Exception as e:
+                log(f"Warm-up failed: {e}")
+
+    async def _send_json(self, send, status: int, body: dict):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"access-control-allow-origin", b"*"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+    async def _lifespan(self, receive, send):
+        # main.app defines no startup or shutdown handlers, so none are forwarded
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start_loading()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        self.start_loading()
+        if not self._ready.is_set():
+            if scope["type"] == "http" and scope["path"] == "/health":
+                challenge = parse_qs(scope.get("query_string", b"").decode()).get("challenge", [None])[0]
+                await self._send_json(send, 200, lifecycle.health(False, challenge))
+                return
+            await self._ready.wait()
+
+        if self.app is None:
+            if scope["type"] == "http":
+                await self._send_json(send, 503, {"detail": f"Backend failed to start: {self.error}"})
+            return
+        await self.app(scope, receive, send)
+
+
+def serve(app):
+    """
+    Runs app with uvicorn on settings.HOST:PORT until it is idle for
+    settings.IDLE_SHUTDOWN_S or asked to shut down, logging startup to LOG_FILE.
+    """
+    log(f"Starting backend from {os.getcwd()}...", mode="w")
+    log(f"Executable: {sys.executable}")
+    try:
+        import uvicorn
+        import multiprocessing
+
+        multiprocessing.freeze_support()
+        log("Starting uvicorn...")
+        # Print to stdout so Electron can capture it too
+        print(f"Backend logging to {LOG_FILE}", flush=True)
+        server = uvicorn.Server(uvicorn.Config(app, host=settings.HOST, port=settings.PORT))
+        lifecycle.watch(server, settings.IDLE_SHUTDOWN_S, log=log)
+        server.run()
+        log("Backend stopped")
+    except Exception as e:
+        log(f"Error: {str(e)}\n{traceback.format_exc()}")
+        print(f"Critical Error: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    serve(FastStartApp())
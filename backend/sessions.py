@@ -0,0 +1,230 @@
+"""
+Per-session dataset namespaces.
+
+The backend outlives the window that started it: the Electron launcher
+reconnects to a running backend instead of spawning a new one (see
+frontend/electron/main.cjs), so one process may serve a reloaded window, a
+second window, or the dev server next to the packaged app. Each client
+names its session in the X-NPS-Session header (or ?session= for an
+EventSource, which cannot set headers). A session has its own DatasetStore,
+and results cached for it are keyed under it (qualified()), so an upload or
+/reset in one session leaves the others alone. Each store has its own
+memory budget (settings.SESSION_MEMORY_MB), so one session's large survey
+does not push another's datasets out of memory.
+
+A store is only opened for a session that has datasets or is being given
+one: reading from an unknown session sees an empty store and leaves nothing
+behind. At most max_sessions stores are open at once; opening another
+closes the least recently used one, whose datasets stay on disk and are
+read back when that session returns.
+
+Requests without a session use DEFAULT_SESSION, whose datasets stay at the
+root of settings.DATA_DIR where earlier versions kept them; other sessions
+persist under DATA_DIR/sessions/<id>.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import pandas as pd
+from dataset_store import DatasetStore, MANIFEST_FILE
+
+SESSION_HEADER = "X-NPS-Session"
+SESSION_PARAM = "session"
+DEFAULT_SESSION = "default"
+SESSIONS_DIR = "sessions"
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_current: ContextVar[str] = ContextVar("session_id", default=DEFAULT_SESSION)
+
+
+def valid_id(session_id: str) -> bool:
+    return bool(_VALID_ID.match(session_id))
+
+
+def current_id() -> str:
+    """Session of the request being handled (DEFAULT_SESSION outside a request)."""
+    return _current.get()
+
+
+def activate(session_id: str):
+    """Makes session_id the current session for the rest of this context (the request)."""
+    _current.set(session_id)
+
+
+def qualified(name: str, session_id: Optional[str] = None) -> str:
+    """Dataset name as recorded in the result cache: "<session>/<name>"."""
+    return f"{session_id or current_id()}/{name}"
+
+
+class SessionRegistry:
+    """The DatasetStore of every session, opened on first use."""
+
+    def __init__(self, root: str, persist: bool = True, memory_budget: int = 0, max_sessions: int = 0):
+        self.root = root
+        self.persist = persist
+        self.memory_budget = memory_budget
+        self.max_sessions = max_sessions
+        self._stores: "OrderedDict[str, DatasetStore]" = OrderedDict()  # least recently used first
+        self._last_seen: Dict[str, float] = {}
+        self._empty = DatasetStore(root, persist=False, memory_budget=memory_budget)
+        self._lock = threading.Lock()
+
+    def path(self, session_id: str) -> str:
+        if session_id == DEFAULT_SESSION:
+            return self.root
+        return os.path.join(self.root, SESSIONS_DIR, session_id)
+
+    def store(self, session_id: Optional[str] = None, create: bool = False) -> DatasetStore:
+        """
+        The session's store (the current session's by default). A session
+        without datasets gets an empty store that is not kept, unless create
+        is set because a dataset is about to be written.
+        """
+        session_id = session_id or current_id()
+        with self._lock:
+            store = self._stores.get(session_id)
+            if store is not None:
+                self._stores.move_to_end(session_id)
+                return store
+            if not (create or self._persisted(session_id)):
+                return self._empty
+            store = self._stores[session_id] = DatasetStore(self.path(session_id), persist=self.persist, memory_budget=self.memory_budget)
+            self._close_over_limit(keep=session_id)
+            return store
+
+    def touch(self, session_id: str):
+        with self._lock:
+            if session_id in self._stores:
+                self._last_seen[session_id] = time.time()
+
+    def ids(self) -> List[str]:
+        """Open sessions and sessions persisted by an earlier run, default first."""
+        ids = {DEFAULT_SESSION} | set(self._stores)
+        if self.persist:
+            try:
+                entries = os.listdir(os.path.join(self.root, SESSIONS_DIR))
+            except OSError:
+                entries = []
+            ids.update(
+                entry for entry in entries
+                if valid_id(entry) and os.path.exists(os.path.join(self.root, SESSIONS_DIR, entry, MANIFEST_FILE))
+            )
+        return sorted(ids, key=lambda session_id: (session_id != DEFAULT_SESSION, session_id))
+
+    def exists(self, session_id: str) -> bool:
+        return session_id in self.ids()
+
+    def open_ids(self) -> List[str]:
+        """Sessions whose store is open, least recently used first."""
+        with self._lock:
+            return list(self._stores)
+
+    def describe(self, session_id: str) -> dict:
+        """Datasets, memory use and last request time of one session (reads manifests only)."""
+        store = self.store(session_id)
+        return {
+            "id": session_id,
+            "datasets": {name: store.rows(name) for name in store.names()},
+            "last_seen": self._last_seen.get(session_id),
+            **store.memory_stats()
+        }
+
+    def totals(self) -> dict:
+        """Session count and the summed memory use, evictions and reloads of open stores, without session ids."""
+        with self._lock:
+            stats = [store.memory_stats() for store in self._stores.values()]
+        return {
+            "sessions": len(self.ids()),
+            "open_sessions": len(stats),
+            "memory_bytes": sum(store["memory_bytes"] for store in stats),
+            "evictions": sum(store["evictions"] for store in stats),
+            "reloads": sum(store["reloads"] for store in stats),
+        }
+
+    def drop(self, session_id: str):
+        """Removes the session's datasets, in memory and on disk."""
+        self.store(session_id).clear()
+        if session_id == DEFAULT_SESSION:
+            return
+        with self._lock:
+            self._stores.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+        if self.persist:
+            shutil.rmtree(self.path(session_id), ignore_errors=True)
+
+    def _persisted(self, session_id: str) -> bool:
+        """Whether an earlier run left datasets for the session on disk."""
+        return self.persist and os.path.exists(os.path.join(self.path(session_id), MANIFEST_FILE))
+
+    def _close_over_limit(self, keep: str):
+        """
+        Closes the least recently used stores beyond max_sessions. Their
+        datasets stay on disk; stores holding datasets that could not be
+        saved (or any, without persistence) are dropped only as a last
+        resort, since their data goes with them.
+        """
+        if not self.max_sessions:
+            return
+        while len(self._stores) > self.max_sessions:
+            candidates = [session_id for session_id in self._stores if session_id not in (keep, current_id())]
+            if not candidates:
+                return
+            victim = next((session_id for session_id in candidates if self._stores[session_id].persisted()), candidates[0])
+            del self._stores[victim]
+            self._last_seen.pop(victim, None)
+
+
+class CurrentSessionStore:
+    """
+    The current session's DatasetStore behind the DatasetStore interface, so
+    handlers keep using one module-level `data_store`.
+    """
+
+    def __init__(self, registry: SessionRegistry):
+        self.registry = registry
+
+    def __getitem__(self, name: str) -> Optional[pd.DataFrame]:
+        return self.registry.store()[name]
+
+    def __setitem__(self, name: str, df: Optional[pd.DataFrame]):
+        self.registry.store(create=df is not None)[name] = df
+
+    def update(self, datasets: Dict[str, Optional[pd.DataFrame]], meta: Optional[Dict[str, dict]] = None):
+        self.registry.store(create=any(df is not None for df in datasets.values())).update(datasets, meta)
+
+    def get(self, name: str, default=None):
+        return self.registry.store().get(name, default)
+
+    def clear(self):
+        self.registry.store().clear()
+
+    def names(self) -> List[str]:
+        return self.registry.store().names()
+
+    def exists(self, name: str) -> bool:
+        return self.registry.store().exists(name)
+
+    def rows(self, name: str) -> int:
+        return self.registry.store().rows(name)
+
+    def columns(self, name: str) -> List[str]:
+        return self.registry.store().columns(name)
+
+    def metadata(self, name: str) -> dict:
+        return self.registry.store().metadata(name)
+
+    def version(self, name: str) -> Optional[str]:
+        return self.registry.store().version(name)
+
+    def residency(self, names: Optional[List[str]] = None) -> Dict[str, dict]:
+        return self.registry.store().residency(names)
+
+    def memory_stats(self) -> dict:
+        return self.registry.store().memory_stats()
@@ -0,0 +1,102 @@
+"""
+Backend settings, read from environment variables.
+
+The Electron launcher passes NPS_DATA_DIR pointing into the app's user-data
+directory; running the backend by hand falls back to a per-user default.
+"""
+
+import os
+import sys
+import tempfile
+
+
+def _default_data_dir() -> str:
+    home = os.path.expanduser("~")
+    if sys.platform == "darwin":
+        base = os.path.join(home, "Library", "Application Support")
+    elif sys.platform == "win32":
+        base = os.environ.get("APPDATA", home)
+    else:
+        base = os.environ.get("XDG_DATA_HOME", os.path.join(home, ".local", "share"))
+    return os.path.join(base, "nps-analysis", "datasets")
+
+
+# Where uploaded datasets are persisted between backend restarts
+DATA_DIR = os.environ.get("NPS_DATA_DIR") or _default_data_dir()
+
+# Set to "0" to keep datasets in memory only (nothing written to disk)
+PERSIST_DATASETS = os.environ.get("NPS_PERSIST_DATASETS", "1") != "0"
+
+# Upper bound on memory used by cached analysis results
+RESULT_CACHE_MB = int(os.environ.get("NPS_RESULT_CACHE_MB", "64"))
+
+# Worker threads used to weight independent subsets (groups, NPS segments) concurrently
+MAX_WORKERS = max(1, int(os.environ.get("NPS_MAX_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+# Worker threads running heavy requests (uploads, analyses, exports) off the event loop
+COMPUTE_WORKERS = max(1, int(os.environ.get("NPS_COMPUTE_WORKERS", "2")))
+
+# Seconds a heavy request may run before it is cancelled (0 disables the limit)
+REQUEST_TIMEOUT_S = float(os.environ.get("NPS_REQUEST_TIMEOUT_S", "900"))
+
+# Finished background jobs (and their results) kept for GET /jobs/{id}
+JOB_HISTORY = max(1, int(os.environ.get("NPS_JOB_HISTORY", "20")))
+
+# Set to "1" to trace peak memory per stage in /metrics (slows allocation-heavy code)
+METRICS_TRACE_MEMORY = os.environ.get("NPS_METRICS_TRACE_MEMORY", "0") == "1"
+
+# Set to "1" to add a Server-Timing header to every response (?timing=1 adds it to one request)
+SERVER_TIMING = os.environ.get("NPS_SERVER_TIMING", "0") == "1"
+
+# Set to "1" to profile every request (?profile=1 profiles one request)
+PROFILE_REQUESTS = os.environ.get("NPS_PROFILE", "0") == "1"
+
+# Requests slower than this are profiled automatically; 0 (the default) turns
+# this off, as it samples every request while it runs to catch the slow ones
+PROFILE_SLOW_MS = float(os.environ.get("NPS_PROFILE_SLOW_MS", "0"))
+
+# Milliseconds between profiler samples
+PROFILE_INTERVAL_MS = max(1.0, float(os.environ.get("NPS_PROFILE_INTERVAL_MS", "10")))
+
+# Where profiles are saved (the temp directory, next to nps_backend_startup.log)
+PROFILE_DIR = os.environ.get("NPS_PROFILE_DIR") or tempfile.gettempdir()
+
+# Saved profiles kept in PROFILE_DIR
+PROFILE_HISTORY = max(1, int(os.environ.get("NPS_PROFILE_HISTORY", "50")))
+
+# Port the backend listens on (the Electron app expects 8000)
+PORT = int(os.environ.get("NPS_PORT", "8000"))
+
+# Interface the backend listens on. It outlives the app and has no user
+# authentication, so it only accepts connections from this machine by default
+HOST = os.environ.get("NPS_HOST", "127.0.0.1")
+
+# Origins whose pages may read the backend's responses (CORS): the packaged
+# app's file:// pages and the Vite dev server. Comma-separated in NPS_ALLOWED_ORIGINS.
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("NPS_ALLOWED_ORIGINS", "file://,http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if origin.strip()
+]
+
+# Identifies this backend on /health, so the launcher reuses only its own
+SERVICE_NAME = "nps-backend"
+
+# Version of the app that started the backend (the launcher passes it)
+APP_VERSION = os.environ.get("NPS_APP_VERSION", "dev")
+
+# Secret the launcher generates for each backend it spawns; the backend proves
+# it holds it before being reused or shut down (empty when started by hand)
+LAUNCH_TOKEN = os.environ.get("NPS_LAUNCH_TOKEN", "")
+
+# Seconds without requests or running work after which the backend exits (0 runs until stopped)
+IDLE_SHUTDOWN_S = float(os.environ.get("NPS_IDLE_SHUTDOWN_S", "0"))
+
+# Memory each session's datasets may hold; least recently used datasets beyond it
+# are dropped from memory and read back from their Arrow files when needed (0 = no limit)
+SESSION_MEMORY_MB = int(os.environ.get("NPS_SESSION_MEMORY_MB", "2048"))
+
+# Sessions whose datasets are open at once; opening another closes the least
+# recently used one (its datasets stay on disk), so memory stays within
+# MAX_SESSIONS x SESSION_MEMORY_MB
+MAX_SESSIONS = max(1, int(os.environ.get("NPS_MAX_SESSIONS", "8")))
@@ -0,0 +1,53 @@
+"""
+Concurrent subset weighting.
+
+Subset weighting re-weights every group (a group-by value in /analyze, an
+NPS segment in /analyze/response-rates) to the same population targets.
+The groups are independent, so they are weighted on a shared thread pool:
+threads read the source DataFrame and its NumPy arrays in place instead of
+copying them to worker processes, and NumPy/pandas release the GIL in their
+inner loops. Results come back in input order, so results and weighting
+reports are merged deterministically regardless of completion order.
+"""
+
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence, TypeVar
+import compute
+import profiling
+import settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.MAX_WORKERS, thread_name_prefix="subset-weighting")
+        return _executor
+
+
+def map_subsets(func: Callable[[T], R], items: Sequence[T]) -> List[R]:
+    """
+    Returns [func(item) for item in items], computed on the worker pool.
+    func must handle its own errors the way the sequential loop did.
+    """
+    def run_item(item):
+        # Groups not yet started are skipped once the request is cancelled
+        compute.check_cancelled()
+        with profiling.thread_scope():
+            return func(item)
+
+    items = list(items)
+    if len(items) <= 1 or settings.MAX_WORKERS <= 1:
+        return [run_item(item) for item in items]
+
+    # Each task runs in its own copy of the caller's context (e.g. the request's cancel flag)
+    contexts = [contextvars.copy_context() for _ in items]
+    return list(get_executor().map(lambda pair: pair[0].run(run_item, pair[1]), zip(contexts, items)))
@@ -1,11 +1,20 @@
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Literal, Tuple
+from segment_keys import encode_segments
+import metrics
 
 class WeightingConfig(BaseModel):
     segment_columns: List[str]
     targets: Dict[str, float] # Key: "Male_18-24", Value: 0.1
     target_column: Optional[str] = None
+    method: Literal["cell", "raking"] = "cell"
+    # Raking controls (ignored by cell weighting)
+    max_iterations: int = 50
+    tolerance: float = 1e-6
+    trim_min: Optional[float] = None # Lower bound on normalized weights, e.g. 0.3
+    trim_max: Optional[float] = None # Upper bound on normalized weights, e.g. 5.0
 
 def get_segment_counts(df: pd.DataFrame, segment_columns: list[str]) -> list[str]:
     """
@@ -14,18 +23,9 @@ def get_segment_counts(df: pd.DataFrame, segment_columns: list[str]) -> list[str
     if not segment_columns:
         return []
         
-    # Check if columns exist
-    missing = [col for col in segment_columns if col not in df.columns]
-    if missing:
-        raise ValueError(f"Missing columns: {missing}")
-
-    # Create segment series
-    if len(segment_columns) == 1:
-        segments = df[segment_columns[0]].astype(str).str.replace(" ", "")
-    else:
-        segments = df[segment_columns].astype(str).apply(lambda x: x.str.replace(" ", "")).agg('_'.join, axis=1)
-        
-    return sorted(segments.unique().tolist())
+    keys = encode_segments(df, segment_columns)
+    cells, _ = keys.factorize()
+    return sorted(keys.decode(cells))
 
 def assess_weight_risk(weight):
     """
@@ -63,36 +63,191 @@ def calculate_weights(df: pd.DataFrame, segment_columns: List[str], targets: Dic
     """
     df = df.copy()
     
-    # Create a segment column
-    if len(segment_columns) == 1:
-        df['Segment'] = df[segment_columns[0]].astype(str).str.replace(" ", "")
-    else:
-        # Apply whitespace removal to each column before joining
-        df['Segment'] = df[segment_columns].astype(str).apply(lambda x: x.str.replace(" ", "")).agg('_'.join, axis=1)
-        
+    # Encode segments as integer cells; only the distinct cells get string labels
+    keys = encode_segments(df, segment_columns)
+    cells, inverse = keys.factorize()
+    
     # Calculate Sample Proportions
     total_count = len(df)
-    sample_counts = df['Segment'].value_counts()
+    sample_counts = np.bincount(inverse, minlength=len(cells))
+    sample_props = sample_counts / total_count if total_count > 0 else sample_counts.astype(np.float64)
     
-    # Calculate Weights
-    def get_weight(segment):
-        target_prop = targets.get(segment, 0)
-        sample_count = sample_counts.get(segment, 0)
-        sample_prop = sample_count / total_count if total_count > 0 else 0
-        
-        if sample_prop == 0:
-            return 0 
-        
-        return target_prop / sample_prop
-
-    df['Weight'] = df['Segment'].apply(get_weight)
+    # Calculate Weights per cell, then broadcast to rows
+    target_props = np.array([targets.get(label, 0) for label in keys.decode(cells)], dtype=np.float64)
+    cell_weights = np.divide(target_props, sample_props, out=np.zeros_like(target_props), where=sample_props > 0)
+    weights = cell_weights[inverse]
     
     # Normalize weights so mean is 1 (preserves total N)
-    if df['Weight'].mean() > 0:
-        df['Weight'] = df['Weight'] / df['Weight'].mean()
+    if len(weights) > 0 and weights.mean() > 0:
+        weights = weights / weights.mean()
         
+    df['Weight'] = weights
     return df
 
+def marginal_targets(targets: Dict[str, float], n_dims: int) -> List[Dict[str, float]]:
+    """
+    Collapses joint cell targets (e.g. {"Male_18-24": 0.1}) into one marginal
+    distribution per segment column, which is what raking balances against.
+    Keys that do not split into exactly n_dims parts are ignored.
+    """
+    marginals = [{} for _ in range(n_dims)]
+    for key, value in targets.items():
+        parts = str(key).split('_') if n_dims > 1 else [str(key)]
+        if len(parts) != n_dims:
+            continue
+        for dim, part in enumerate(parts):
+            marginals[dim][part] = marginals[dim].get(part, 0.0) + float(value)
+    return marginals
+
+def rake_weights(
+    codes: np.ndarray,
+    marginals: List[np.ndarray],
+    max_iterations: int = 50,
+    tolerance: float = 1e-6,
+    trim_min: Optional[float] = None,
+    trim_max: Optional[float] = None
+) -> Tuple[np.ndarray, List[float], bool]:
+    """
+    Iterative proportional fitting on integer category codes.
+
+    Args:
+        codes: (n_rows, n_dims) array; codes[:, j] indexes into marginals[j].
+        marginals: Target share per category for each dimension. Categories with
+                   a zero target end up with zero weight.
+        max_iterations: Upper bound on full passes over all dimensions.
+        tolerance: Stop once every weighted marginal share is within this of its target.
+        trim_min / trim_max: Optional bounds applied to mean-1 weights after each pass.
+
+    Returns:
+        (weights normalized to mean 1, max deviation per iteration, converged flag)
+    """
+    n_rows, n_dims = codes.shape
+    weights = np.ones(n_rows, dtype=np.float64)
+    trace = []
+    converged = False
+
+    if n_rows == 0:
+        return weights, trace, True
+
+    # Only categories observed in the sample can be matched; rescale each
+    # marginal over those so the targets are attainable.
+    observed = []
+    for dim in range(n_dims):
+        present = np.bincount(codes[:, dim], minlength=len(marginals[dim])) > 0
+        target = np.where(present, marginals[dim], 0.0)
+        total = target.sum()
+        observed.append(target / total if total > 0 else target)
+
+    for _ in range(max_iterations):
+        for dim in range(n_dims):
+            dim_codes = codes[:, dim]
+            current = np.bincount(dim_codes, weights=weights, minlength=len(observed[dim]))
+            desired = observed[dim] * weights.sum()
+            factors = np.divide(desired, current, out=np.zeros_like(desired), where=current > 0)
+            weights *= factors[dim_codes]
+
+        mean = weights.mean()
+        if mean <= 0:
+            break
+        if trim_min is not None or trim_max is not None:
+            weights = np.clip(weights / mean, trim_min, trim_max) * mean
+
+        total = weights.sum()
+        deviation = 0.0
+        for dim in range(n_dims):
+            shares = np.bincount(codes[:, dim], weights=weights, minlength=len(observed[dim])) / total
+            deviation = max(deviation, float(np.abs(shares - observed[dim]).max()))
+        trace.append(deviation)
+
+        if deviation < tolerance:
+            converged = True
+            break
+        # Trimming can leave a residual that no further pass will remove
+        if len(trace) > 1 and abs(trace[-2] - deviation) < tolerance:
+            break
+
+    mean = weights.mean()
+    if mean > 0:
+        weights = weights / mean
+
+    return weights, trace, converged
+
+def calculate_raking_weights(
+    df: pd.DataFrame,
+    segment_columns: List[str],
+    targets: Dict[str, float],
+    max_iterations: int = 50,
+    tolerance: float = 1e-6,
+    trim_min: Optional[float] = None,
+    trim_max: Optional[float] = None
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    Calculates weights with raking (iterative proportional fitting).
+
+    Joint targets are collapsed to per-column marginals, so sparse or empty
+    cells do not produce extreme weights the way cell weighting does.
+
+    Returns:
+        DataFrame with a new 'Weight' column, and a diagnostics dict with the
+        iteration count, convergence flag and per-iteration deviation trace.
+    """
+    df = df.copy()
+    marginals = marginal_targets(targets, len(segment_columns))
+
+    keys = encode_segments(df, segment_columns)
+    marginal_arrays = [
+        np.array([marginals[dim].get(cat, 0.0) for cat in categorical.categories], dtype=np.float64)
+        for dim, categorical in enumerate(keys.categoricals)
+    ]
+
+    weights, trace, converged = rake_weights(
+        keys.codes,
+        marginal_arrays,
+        max_iterations=max_iterations,
+        tolerance=tolerance,
+        trim_min=trim_min,
+        trim_max=trim_max
+    )
+    df['Weight'] = weights
+
+    diagnostics = {
+        "method": "raking",
+        "iterations": len(trace),
+        "converged": converged,
+        "trace": [round(d, 8) for d in trace]
+    }
+    return df, diagnostics
+
+@metrics.timed("weighting")
+def apply_weighting(
+    df: pd.DataFrame,
+    config: WeightingConfig,
+    segment_columns: Optional[List[str]] = None,
+    targets: Optional[Dict[str, float]] = None
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    Weights df using the method selected in config.
+    segment_columns/targets override the config values (used for subset weighting).
+
+    Returns:
+        DataFrame with a 'Weight' column, and a diagnostics dict.
+    """
+    segment_columns = segment_columns if segment_columns is not None else config.segment_columns
+    targets = targets if targets is not None else config.targets
+
+    if config.method == "raking":
+        return calculate_raking_weights(
+            df,
+            segment_columns,
+            targets,
+            max_iterations=config.max_iterations,
+            tolerance=config.tolerance,
+            trim_min=config.trim_min,
+            trim_max=config.trim_max
+        )
+
+    return calculate_weights(df, segment_columns, targets), {"method": "cell"}
+
 def calculate_targets(pop_df: pd.DataFrame, segment_columns: list[str], target_column: str = None) -> dict[str, float]:
     """
     Calculates target proportions from population data.
@@ -102,26 +257,64 @@ def calculate_targets(pop_df: pd.DataFrame, segment_columns: list[str], target_c
     if missing:
         return {}
 
-    df = pop_df.copy()
-    
-    # Create segment column
-    if len(segment_columns) == 1:
-        df['Segment'] = df[segment_columns[0]].astype(str).str.replace(" ", "")
-    else:
-        df['Segment'] = df[segment_columns].astype(str).apply(lambda x: x.str.replace(" ", "")).agg('_'.join, axis=1)
+    keys = encode_segments(pop_df, segment_columns)
         
     # Calculate weights/counts
-    if target_column and target_column in df.columns:
+    if target_column and target_column in pop_df.columns:
         # Use the specified column as weight (e.g. mem_rate)
-        df[target_column] = pd.to_numeric(df[target_column], errors='coerce').fillna(0)
-        segment_sums = df.groupby('Segment')[target_column].sum()
+        values = pd.to_numeric(pop_df[target_column], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+        segment_sums = keys.sums(values)
     else:
         # Just count rows
-        segment_sums = df['Segment'].value_counts()
+        segment_sums = keys.sums()
         
-    total = segment_sums.sum()
+    total = sum(segment_sums.values())
     if total == 0:
         return {}
         
-    proportions = (segment_sums / total).to_dict()
-    return {k: round(v, 4) for k, v in proportions.items()}
+    return {k: round(v / total, 4) for k, v in sorted(segment_sums.items())}
+
+def build_weighting_report(
+    df: pd.DataFrame,
+    segment_columns: List[str],
+    targets: Dict[str, float],
+    weight_column: str = 'Weight',
+    extra: Optional[dict] = None
+) -> List[dict]:
+    """
+    One row per segment cell with sample vs population proportions and the
+    applied weight. Segment values are the normalized labels used as target keys.
+    extra fields (e.g. {'nps_segment': 'Promoters (9-10)'}) follow the segment columns.
+    """
+    keys = encode_segments(df, segment_columns)
+    cells, inverse = keys.factorize()
+    total_responses = len(df)
+    if total_responses == 0:
+        return []
+
+    sample_counts = np.bincount(inverse, minlength=len(cells))
+    # Weights are constant within a cell; take the first row of each
+    _, first_rows = np.unique(inverse, return_index=True)
+    cell_weights = df[weight_column].to_numpy(dtype=np.float64)[first_rows]
+
+    components = keys.components(cells)
+    report = []
+    for pos in sorted(range(len(cells)), key=lambda i: components[i]):
+        segment_dict = dict(zip(segment_columns, components[pos]))
+        if extra:
+            segment_dict.update(extra)
+
+        weight = float(cell_weights[pos])
+        sample_count = int(sample_counts[pos])
+        target_prop = targets.get('_'.join(components[pos]), 0)
+
+        segment_dict.update({
+            'sample_count': sample_count,
+            'sample_proportion': round(sample_count / total_responses, 4),
+            'population_proportion': round(target_prop, 4),
+            'applied_weight': round(weight, 4),
+            'risk_level': assess_weight_risk(weight)
+        })
+        report.append(segment_dict)
+
+    return report
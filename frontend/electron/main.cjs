@@ -12,12 +12,19 @@ ipcMain.on('log-to-file', (event, message) => {
 const path = require('path');
 const { spawn } = require('child_process');
 const http = require('http');
+const crypto = require('crypto');
 
 let mainWindow;
 let backendProcess;
 
 const isDev = process.env.NODE_ENV === 'development';
 const BACKEND_PORT = 8000;
+// The backend only listens on the loopback interface (see backend/settings.py)
+const BACKEND_HOST = '127.0.0.1';
+const BACKEND_SERVICE = 'nps-backend';
+// The backend outlives the app so reopening it reuses the warm process with
+// its datasets in memory; it exits on its own after this long unused
+const BACKEND_IDLE_SHUTDOWN_S = 1800;
 
 function getBackendPath() {
     if (isDev) {
@@ -53,6 +60,65 @@ function logToFile(message) {
     }
 }
 
+function getDataDir() {
+    // Uploaded datasets persist here across backend restarts
+    return path.join(app.getPath('userData'), 'datasets');
+}
+
+// Secret given to the backend we spawn; a running backend is reused (or shut
+// down) only if it proves it holds the token of our last launch
+function getLaunchTokenPath() {
+    return path.join(app.getPath('userData'), 'backend_launch_token');
+}
+
+function readLaunchToken() {
+    try {
+        return fs.readFileSync(getLaunchTokenPath(), 'utf8').trim();
+    } catch (err) {
+        return null;
+    }
+}
+
+function createLaunchToken() {
+    const token = crypto.randomBytes(32).toString('hex');
+    fs.writeFileSync(getLaunchTokenPath(), token, { mode: 0o600 });
+    return token;
+}
+
+// Backend session of each window (see src/api.js), so two windows do not
+// share datasets. The ids are saved in order, and a window opened later
+// takes the first id no open window uses: reopening the app finds the
+// datasets it left. The first is the backend's default session, which
+// holds the datasets saved before sessions existed.
+const DEFAULT_SESSION = 'default';
+const windowSessions = new Map();
+
+function getWindowSessionsPath() {
+    return path.join(app.getPath('userData'), 'window_sessions.json');
+}
+
+function claimWindowSession() {
+    let ids;
+    try {
+        ids = JSON.parse(fs.readFileSync(getWindowSessionsPath(), 'utf8'));
+    } catch (err) {
+        ids = [];
+    }
+    ids = [DEFAULT_SESSION, ...ids.filter((id) => id !== DEFAULT_SESSION)];
+    const inUse = new Set(windowSessions.values());
+    let sessionId = ids.find((id) => !inUse.has(id));
+    if (!sessionId) {
+        sessionId = crypto.randomUUID();
+        ids.push(sessionId);
+    }
+    try {
+        fs.writeFileSync(getWindowSessionsPath(), JSON.stringify(ids));
+    } catch (err) {
+        logToFile(`Failed to save window sessions: ${err}`);
+    }
+    return sessionId;
+}
+
 function startBackend() {
     const backendPath = getBackendPath();
     console.log('Starting backend from:', backendPath);
@@ -63,20 +129,27 @@ function startBackend() {
     const cwd = isDev ? undefined : app.getPath('temp');
     logToFile(`Backend CWD: ${cwd}`);
 
+    // Detached with its output in a file, so it keeps running after the app quits
+    const backendLogPath = path.join(app.getPath('userData'), 'nps_backend.log');
+    logToFile(`Backend output: ${backendLogPath}`);
+
     try {
+        const launchToken = createLaunchToken();
+        const output = fs.openSync(backendLogPath, 'a');
         backendProcess = spawn(backendPath, [], {
-            cwd: cwd
-        });
-
-        backendProcess.stdout.on('data', (data) => {
-            console.log(`Backend: ${data}`);
-            logToFile(`Backend: ${data}`);
-        });
-
-        backendProcess.stderr.on('data', (data) => {
-            console.error(`Backend Error: ${data}`);
-            logToFile(`Backend Error: ${data}`);
+            cwd: cwd,
+            detached: true,
+            stdio: ['ignore', output, output],
+            env: {
+                ...process.env,
+                NPS_DATA_DIR: getDataDir(),
+                NPS_APP_VERSION: app.getVersion(),
+                NPS_IDLE_SHUTDOWN_S: String(BACKEND_IDLE_SHUTDOWN_S),
+                NPS_LAUNCH_TOKEN: launchToken
+            }
         });
+        fs.closeSync(output);
+        backendProcess.unref();
 
         backendProcess.on('close', (code) => {
             console.log(`Backend process exited with code ${code}`);
@@ -92,14 +165,23 @@ function startBackend() {
     }
 }
 
-function checkBackendHealth() {
+function checkBackendHealth(challenge) {
+    const query = challenge ? `?challenge=${challenge}` : '';
     return new Promise((resolve, reject) => {
-        const req = http.get(`http://localhost:${BACKEND_PORT}/health`, (res) => {
-            if (res.statusCode === 200) {
-                resolve();
-            } else {
-                reject('Backend not ready');
-            }
+        const req = http.get(`http://${BACKEND_HOST}:${BACKEND_PORT}/health${query}`, (res) => {
+            let body = '';
+            res.on('data', (chunk) => { body += chunk; });
+            res.on('end', () => {
+                if (res.statusCode !== 200) {
+                    reject('Backend not ready');
+                    return;
+                }
+                try {
+                    resolve(JSON.parse(body));
+                } catch (err) {
+                    resolve({});
+                }
+            });
         });
 
         req.on('error', (err) => {
@@ -110,24 +192,79 @@ function checkBackendHealth() {
     });
 }
 
+// The backend answers /health as soon as it listens, before the analysis
+// modules have loaded (see backend/server.py), so poll often
+const HEALTH_POLL_MS = 100;
+const HEALTH_TIMEOUT_MS = 60000;
+
 async function waitForBackend() {
-    let retries = 20;
-    while (retries > 0) {
+    const deadline = Date.now() + HEALTH_TIMEOUT_MS;
+    while (Date.now() < deadline) {
         try {
             await checkBackendHealth();
             console.log('Backend is ready!');
             return;
         } catch (err) {
-            console.log('Waiting for backend...');
-            await new Promise(resolve => setTimeout(resolve, 1000));
-            retries--;
+            await new Promise(resolve => setTimeout(resolve, HEALTH_POLL_MS));
         }
     }
     console.error('Failed to connect to backend');
 }
 
+// A backend already listening (left running by an earlier launch) is reused
+// when it is one we spawned (it answers our challenge with our launch token)
+// and matches this app: same app version and data directory
+async function findReusableBackend() {
+    const token = readLaunchToken();
+    const challenge = crypto.randomBytes(16).toString('hex');
+    let health;
+    try {
+        health = await checkBackendHealth(challenge);
+    } catch (err) {
+        return false;
+    }
+    const launchedByUs = Boolean(token) && health.service === BACKEND_SERVICE &&
+        health.launch_proof === crypto.createHmac('sha256', token).update(challenge).digest('hex');
+    if (!launchedByUs) {
+        logToFile(`Port ${BACKEND_PORT} is in use by a process this app did not launch`);
+        return false;
+    }
+    if (health.app_version === app.getVersion() && health.data_dir === getDataDir()) {
+        logToFile(`Reusing running backend (pid ${health.pid})`);
+        return true;
+    }
+    logToFile(`Stopping backend of version ${health.app_version} (pid ${health.pid})`);
+    await stopBackend(token);
+    return false;
+}
+
+function stopBackend(token) {
+    return new Promise((resolve) => {
+        const req = http.request(`http://${BACKEND_HOST}:${BACKEND_PORT}/shutdown`, {
+            method: 'POST',
+            headers: { 'X-NPS-Launch-Token': token }
+        }, (res) => {
+            res.resume();
+            res.on('end', resolve);
+        });
+        req.on('error', () => resolve());
+        req.end();
+    }).then(async () => {
+        // Wait for the port to be released
+        const deadline = Date.now() + HEALTH_TIMEOUT_MS;
+        while (Date.now() < deadline) {
+            try {
+                await checkBackendHealth();
+            } catch (err) {
+                return;
+            }
+            await new Promise(resolve => setTimeout(resolve, HEALTH_POLL_MS));
+        }
+    });
+}
+
 function createWindow() {
-    mainWindow = new BrowserWindow({
+    const window = new BrowserWindow({
         width: 1280,
         height: 800,
         webPreferences: {
@@ -135,21 +272,30 @@ function createWindow() {
             contextIsolation: false, // For simple IPC if needed, though we use HTTP
         },
     });
+    mainWindow = window;
+    const sessionId = claimWindowSession();
+    windowSessions.set(window, sessionId);
+    logToFile(`Window uses backend session ${sessionId}`);
 
     if (isDev) {
-        mainWindow.loadURL('http://localhost:5173');
-        mainWindow.webContents.openDevTools();
+        window.loadURL(`http://localhost:5173/?session=${encodeURIComponent(sessionId)}`);
+        window.webContents.openDevTools();
     } else {
-        mainWindow.loadFile(path.join(__dirname, '../dist/index.html'));
+        window.loadFile(path.join(__dirname, '../dist/index.html'), { query: { session: sessionId } });
     }
 
-    mainWindow.on('closed', function () {
-        mainWindow = null;
+    window.on('closed', function () {
+        windowSessions.delete(window);
+        if (mainWindow === window) {
+            mainWindow = null;
+        }
     });
 }
 
 app.on('ready', async () => {
-    startBackend();
+    if (!(await findReusableBackend())) {
+        startBackend();
+    }
     await waitForBackend();
     createWindow();
 });
@@ -166,8 +312,4 @@ app.on('activate', function () {
     }
 });
 
-app.on('will-quit', () => {
-    if (backendProcess) {
-        backendProcess.kill();
-    }
-});
+// The backend is left running for the next launch (see BACKEND_IDLE_SHUTDOWN_S)
@@ -3,6 +3,7 @@ import FileUpload from './components/FileUpload';
 import WeightingConfig from './components/WeightingConfig';
 import Dashboard from './components/Dashboard';
 import Modal from './components/Modal';
+import { apiFetch } from './api';
 
 function App() {
   const [columns, setColumns] = useState([]);
@@ -16,7 +17,7 @@ function App() {
 
   const fetchColumns = async () => {
     try {
-      const response = await fetch('http://localhost:8000/columns');
+      const response = await apiFetch('/columns');
       const data = await response.json();
       setColumns(data.columns);
       setDataVersion(v => v + 1); // Update data version for dependent components
@@ -70,7 +71,7 @@ function App() {
 
   const handleReset = async () => {
     try {
-      await fetch('http://localhost:8000/reset', { method: 'POST' });
+      await apiFetch('/reset', { method: 'POST' });
       setColumns([]);
       setWeightingConfig(null);
       setDataVersion(v => v + 1);
@@ -0,0 +1,44 @@
+// Backend requests, tagged with this window's session.
+// The backend keeps running between app launches and may serve several
+// windows at once (see backend/sessions.py); each keeps its datasets in its
+// own session. The Electron launcher names the window's session in the page
+// URL (?session=) and gives a reopened window the id it had before (see
+// electron/main.cjs). A page opened without one, such as the dev server in a
+// browser tab, makes up its own id and keeps it in sessionStorage, which
+// belongs to that tab alone and survives reloads.
+
+// The backend only listens on the loopback interface (see backend/settings.py)
+export const API_BASE = 'http://127.0.0.1:8000';
+
+const SESSION_HEADER = 'X-NPS-Session';
+const SESSION_KEY = 'nps-session-id';
+
+const newSessionId = () => (
+    window.crypto && window.crypto.randomUUID
+        ? window.crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+);
+
+const resolveSessionId = () => {
+    const fromUrl = new URLSearchParams(window.location.search).get('session');
+    if (fromUrl) return fromUrl;
+    let id = window.sessionStorage.getItem(SESSION_KEY);
+    if (!id) {
+        id = newSessionId();
+        window.sessionStorage.setItem(SESSION_KEY, id);
+    }
+    return id;
+};
+
+export const SESSION_ID = resolveSessionId();
+
+export const apiFetch = (path, options = {}) => fetch(`${API_BASE}${path}`, {
+    ...options,
+    headers: { ...options.headers, [SESSION_HEADER]: SESSION_ID },
+});
+
+// EventSource cannot send headers, so the session goes in the query string
+export const apiUrl = (path) => {
+    const separator = path.includes('?') ? '&' : '?';
+    return `${API_BASE}${path}${separator}session=${encodeURIComponent(SESSION_ID)}`;
+};
@@ -0,0 +1,39 @@
+// Columnar JSON responses (Accept: application/vnd.nps.columnar+json).
+// The backend sends each table of a result as {"$table": {field: [values]}},
+// plus "$index": [keys] when the table was an object keyed by category.
+// Field names are not repeated per row, so large breakdowns download and
+// parse faster; expandColumnar turns them back into the usual shape.
+
+export const COLUMNAR_JSON = 'application/vnd.nps.columnar+json';
+
+const expandTable = (value) => {
+    const fields = Object.keys(value.$table);
+    const length = fields.length > 0 ? value.$table[fields[0]].length : 0;
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const row = {};
+        for (const field of fields) {
+            row[field] = value.$table[field][i];
+        }
+        rows[i] = row;
+    }
+    if (!value.$index) return rows;
+
+    const keyed = {};
+    value.$index.forEach((key, i) => {
+        keyed[key] = rows[i];
+    });
+    return keyed;
+};
+
+export const expandColumnar = (value) => {
+    if (Array.isArray(value)) return value.map(expandColumnar);
+    if (value === null || typeof value !== 'object') return value;
+    if (value.$table) return expandTable(value);
+
+    const expanded = {};
+    for (const [key, item] of Object.entries(value)) {
+        expanded[key] = expandColumnar(item);
+    }
+    return expanded;
+};
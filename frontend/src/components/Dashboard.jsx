@@ -1,4 +1,55 @@
 import React, { useState, useEffect } from 'react';
+import { COLUMNAR_JSON, expandColumnar } from '../columnar';
+import { apiFetch, apiUrl } from '../api';
+
+const JOB_STAGE_LABELS = {
+    queued: 'Queued',
+    weighting: 'Weighting',
+    segmenting: 'Segmenting',
+    categories: 'Categories',
+    report: 'Report',
+};
+
+// Runs an analysis as a background job, reporting progress from its event
+// stream, and resolves with the job's result.
+const runAnalysisJob = async (kind, request, onProgress) => {
+    const response = await apiFetch('/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ kind, request }),
+    });
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || 'Could not start analysis');
+    }
+    const job = await response.json();
+    onProgress(job);
+
+    await new Promise((resolve, reject) => {
+        const events = new EventSource(apiUrl(`/jobs/${job.id}/events`));
+        events.onmessage = (event) => {
+            const status = JSON.parse(event.data);
+            onProgress(status);
+            if (['succeeded', 'failed', 'cancelled'].includes(status.status)) {
+                events.close();
+                resolve();
+            }
+        };
+        events.onerror = () => {
+            events.close();
+            reject(new Error('Lost connection to the analysis job'));
+        };
+    });
+
+    const result = await apiFetch(`/jobs/${job.id}/result`, {
+        headers: { 'Accept': `${COLUMNAR_JSON}, application/json` },
+    });
+    if (!result.ok) {
+        const errorData = await result.json();
+        throw new Error(errorData.detail || 'Analysis failed');
+    }
+    return expandColumnar(await result.json());
+};
 
 const SelectField = ({ label, value, onChange, options = [] }) => (
     <div>
@@ -223,11 +274,11 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
     useEffect(() => {
         const fetchColumns = async () => {
             try {
-                const qRes = await fetch('http://localhost:8000/columns/qualtrics');
+                const qRes = await apiFetch('/columns/qualtrics');
                 const qData = await qRes.json();
                 setQualtricsCols(qData.columns || []);
 
-                const cRes = await fetch('http://localhost:8000/columns/coding');
+                const cRes = await apiFetch('/columns/coding');
                 const cData = await cRes.json();
                 setCodingCols(cData.columns || []);
             } catch (error) {
@@ -263,6 +314,7 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
 
     const [loadingMetrics, setLoadingMetrics] = useState(false);
     const [loadingRR, setLoadingRR] = useState(false);
+    const [rrProgress, setRrProgress] = useState(null);
 
     const handleCalculateMetrics = async () => {
         if (!npsCol) {
@@ -289,7 +341,7 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
         log(`Starting analysis for NPS Column: ${npsCol}`);
 
         try {
-            const response = await fetch('http://localhost:8000/analyze', {
+            const response = await apiFetch('/analyze', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -334,26 +386,17 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
 
         setLoadingRR(true);
         setRrResults(null);
+        setRrProgress(null);
 
         try {
-            const response = await fetch('http://localhost:8000/analyze/response-rates', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    nps_column: openEndNpsCol, // Pass selected NPS column for segmentation
-                    top_box_columns: [], // Not needed
-                    open_end_columns: validCols,
-                    group_weighting_columns: openEndWeightingCols, // Pass weighting columns
-                    weighting_config: weightingConfig // Pass config to enable exclusion logic
-                }),
-            });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.detail || 'Response rate analysis failed');
-            }
-
-            const data = await response.json();
+            // Runs as a background job so long analyses report their progress
+            const data = await runAnalysisJob('response-rates', {
+                nps_column: openEndNpsCol, // Pass selected NPS column for segmentation
+                top_box_columns: [], // Not needed
+                open_end_columns: validCols,
+                group_weighting_columns: openEndWeightingCols, // Pass weighting columns
+                weighting_config: weightingConfig // Pass config to enable exclusion logic
+            }, setRrProgress);
             console.log('DEBUG: Response data:', data);
             console.log('DEBUG: weighting_reports:', data.weighting_reports);
             console.log('DEBUG: openEndWeightingCols:', openEndWeightingCols);
@@ -363,6 +406,7 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
             alert(`Response Rate Error: ${error.message}`);
         } finally {
             setLoadingRR(false);
+            setRrProgress(null);
         }
     };
 
@@ -823,7 +867,9 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
                                     {loadingRR ? (
                                         <>
                                             <div className="w-4 h-4 border-2 border-white/30 border-t-white rounded-full animate-spin"></div>
-                                            Calculating...
+                                            {rrProgress && rrProgress.status === 'running'
+                                                ? `${JOB_STAGE_LABELS[rrProgress.stage] || 'Calculating'}... ${Math.round(rrProgress.progress)}%`
+                                                : 'Calculating...'}
                                         </>
                                     ) : (
                                         <>
@@ -831,6 +877,14 @@ const Dashboard = ({ columns, weightingConfig, dataVersion }) => {
                                         </>
                                     )}
                                 </button>
+                                {loadingRR && rrProgress && (
+                                    <div className="mt-2 h-1.5 bg-slate-100 rounded-full overflow-hidden">
+                                        <div
+                                            className="h-full bg-purple-500 transition-all duration-300"
+                                            style={{ width: `${rrProgress.progress}%` }}
+                                        ></div>
+                                    </div>
+                                )}
                             </div>
                         </div>
 
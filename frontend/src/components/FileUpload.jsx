@@ -1,4 +1,5 @@
 import React, { useState } from 'react';
+import { apiFetch } from '../api';
 
 const FileUpload = ({ onUploadComplete }) => {
     const [status, setStatus] = useState({
@@ -17,7 +18,7 @@ const FileUpload = ({ onUploadComplete }) => {
         }));
 
         try {
-            const response = await fetch(`http://localhost:8000/upload/${type}`, {
+            const response = await apiFetch(`/upload/${type}`, {
                 method: 'POST',
                 body: formData,
             });
@@ -1,9 +1,13 @@
 import React, { useState, useEffect } from 'react';
+import { COLUMNAR_JSON, expandColumnar } from '../columnar';
+import { apiFetch } from '../api';
 
 const FoodNpsResults = ({ triggerAnalysis }) => {
   const [loading, setLoading] = useState(false);
   const [results, setResults] = useState(null);
   const [error, setError] = useState(null);
+  // Category expanded to its sub-categories: { group, category }
+  const [drillDown, setDrillDown] = useState(null);
 
   useEffect(() => {
     if (triggerAnalysis) {
@@ -16,8 +20,10 @@ const FoodNpsResults = ({ triggerAnalysis }) => {
     setError(null);
 
     try {
-      const response = await fetch('http://localhost:8000/food-nps/analyze', {
-        method: 'POST'
+      const response = await apiFetch('/food-nps/analyze', {
+        method: 'POST',
+        // Breakdown and weighting tables come back as arrays per field
+        headers: { 'Accept': `${COLUMNAR_JSON}, application/json` }
       });
 
       if (!response.ok) {
@@ -25,8 +31,9 @@ const FoodNpsResults = ({ triggerAnalysis }) => {
         throw new Error(error.detail || '분석 실패');
       }
 
-      const data = await response.json();
+      const data = expandColumnar(await response.json());
       setResults(data);
+      setDrillDown(null);
     } catch (error) {
       setError(error.message);
     } finally {
@@ -276,8 +283,28 @@ const FoodNpsResults = ({ triggerAnalysis }) => {
                     <span className="text-xs font-normal opacity-70">Top 5 Categories</span>
                   </h4>
                   <div className="space-y-3">
-                    {data.slice(0, 5).map((cat, idx) => (
-                      <div key={idx} className="bg-white/60 rounded-lg p-3 backdrop-blur-sm">
+                    {data.slice(0, 5).map((cat, idx) => {
+                      const matrix = results.category_matrix;
+                      const groupIdx = matrix ? matrix.groups.indexOf(group) : -1;
+                      const catIdx = matrix ? matrix.categories.indexOf(cat.category) : -1;
+                      const subCategories = catIdx >= 0
+                        ? matrix.sub_categories[catIdx]
+                            .map((name, subIdx) => ({
+                              name,
+                              count: matrix.sub_category_count[groupIdx][catIdx][subIdx],
+                              rate: matrix.sub_category_rate[groupIdx][catIdx][subIdx]
+                            }))
+                            .filter(sub => sub.count > 0)
+                            .sort((a, b) => b.rate - a.rate)
+                        : [];
+                      const expanded = drillDown && drillDown.group === group && drillDown.category === cat.category;
+
+                      return (
+                      <div
+                        key={idx}
+                        className={`bg-white/60 rounded-lg p-3 backdrop-blur-sm ${subCategories.length > 0 ? 'cursor-pointer' : ''}`}
+                        onClick={() => subCategories.length > 0 && setDrillDown(expanded ? null : { group, category: cat.category })}
+                      >
                         <div className="flex justify-between items-center mb-1">
                           <span className="text-sm font-medium text-slate-700 truncate pr-2">{cat.category}</span>
                           <span className={`text-sm font-bold ${colors.text}`}>{cat.response_rate.toFixed(1)}%</span>
@@ -288,8 +315,19 @@ const FoodNpsResults = ({ triggerAnalysis }) => {
                         <div className="mt-1 text-[10px] text-slate-500 text-right">
                           n={cat.count}
                         </div>
+                        {expanded && (
+                          <div className="mt-2 pt-2 border-t border-black/5 space-y-1">
+                            {subCategories.map((sub) => (
+                              <div key={sub.name} className="flex justify-between items-center text-xs text-slate-600">
+                                <span className="truncate pr-2">{sub.name}</span>
+                                <span className="font-medium">{sub.rate.toFixed(1)}% <span className="text-slate-400">(n={sub.count})</span></span>
+                              </div>
+                            ))}
+                          </div>
+                        )}
                       </div>
-                    ))}
+                      );
+                    })}
                   </div>
                 </div>
               );
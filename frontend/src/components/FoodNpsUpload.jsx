@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 const FoodNpsUpload = ({ onUploadComplete }) => {
   const [uploadStatus, setUploadStatus] = useState({
@@ -59,7 +60,7 @@ const FoodNpsUpload = ({ onUploadComplete }) => {
     };
 
     try {
-      const response = await fetch(`http://localhost:8000${endpoints[type]}`, {
+      const response = await apiFetch(endpoints[type], {
         method: 'POST',
         body: formData
       });
@@ -103,7 +104,7 @@ const FoodNpsUpload = ({ onUploadComplete }) => {
 
   const checkUploadStatus = async () => {
     try {
-      const response = await fetch('http://localhost:8000/food-nps/status');
+      const response = await apiFetch('/food-nps/status');
       return await response.json();
     } catch (error) {
       console.error('상태 확인 오류:', error);
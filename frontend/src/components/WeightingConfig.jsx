@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 const WeightingConfig = ({ columns, onConfigChange, dataVersion }) => {
     const [selectedColumns, setSelectedColumns] = useState([]);
@@ -14,7 +15,7 @@ const WeightingConfig = ({ columns, onConfigChange, dataVersion }) => {
         // Fetch population columns whenever dataVersion changes (new upload)
         const fetchPopColumns = async () => {
             try {
-                const response = await fetch('http://localhost:8000/population-columns');
+                const response = await apiFetch('/population-columns');
                 const data = await response.json();
                 setPopColumns(data.columns || []);
             } catch (error) {
@@ -25,7 +26,7 @@ const WeightingConfig = ({ columns, onConfigChange, dataVersion }) => {
         // Fetch Qualtrics columns for segmentation (ignore coding columns)
         const fetchQualtricsColumns = async () => {
             try {
-                const response = await fetch('http://localhost:8000/columns/qualtrics');
+                const response = await apiFetch('/columns/qualtrics');
                 const data = await response.json();
                 setSegmentationOptions(data.columns || []);
             } catch (error) {
@@ -54,7 +55,7 @@ const WeightingConfig = ({ columns, onConfigChange, dataVersion }) => {
     const fetchSegments = async () => {
         setIsFetching(true);
         try {
-            const response = await fetch('http://localhost:8000/preview-segments', {
+            const response = await apiFetch('/preview-segments', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({